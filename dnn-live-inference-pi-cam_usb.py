@@ -4,6 +4,13 @@ Raspberry Pi Live Image Inference (USB version by Antonio)
 
 Continuously captures image from Raspberry Pi Camera module and perform 
 inference using provided .eim model file. Outputs probabilities in console.
+With result_cache_mb set, frames whose model input looks like one classified
+before take its result from a content-hash cache. The model and the camera start up
+at the same time, and a breakdown of the start-up time is printed with the
+first result. Every stage of the loop is timed, and the FPS shown is the
+wall-clock throughput; the stage latency percentiles are printed on exit.
+With metrics_port set, frame counters, predictions and stage latencies are
+served for Prometheus to scrape.
 
 Author: EdgeImpulse, Inc.
 Date: June 8, 2021
@@ -15,15 +22,40 @@ import cv2
 import numpy as np
 from edge_impulse_linux.runner import ImpulseRunner
 
+# Shared helpers live in usb_pipeline/ at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+from usb_pipeline.cache import ResultCache
+from usb_pipeline.capture import MjpegCamera, ThreadedCapture
+from usb_pipeline.daemon import DaemonClient
+from usb_pipeline.features import GrayscaleFeatures
+from usb_pipeline.metrics import Metrics, MetricsServer
+from usb_pipeline.sources import open_source
+from usb_pipeline.startup import ConcurrentStartup
+from usb_pipeline.timing import LoopTimer
+from usb_pipeline.transport import FeatureTransport
+
 # Settings
-device = '/dev/video0'                  # Linux video device
+device = '/dev/video0'                  # Linux video device, image folder, .zip, video or 'synthetic'
 model_file = "modelfile.eim"            # Trained ML model from Edge Impulse
 draw_fps = True                         # Draw FPS on screen
 res_width = 96                          # Resolution of camera (width)
 res_height = 96                         # Resolution of camera (height)
 rotation = 0                            # Camera rotation (0, 90, 180, or 270)
+capture_slots = 3                       # Frames in the capture ring buffer
+mjpeg = False                           # Capture MJPEG and decode it in Python
+decode_scale = 1                        # Decode MJPEG at 1/1, 1/2, 1/4 or 1/8 scale
+source_fps = None                       # Pace files/synthetic frames (None = as fast as possible)
+source_loop = True                      # Start image folders, zips and videos over at the end
+show_preview = True                     # Set to False to run headless
+use_shm = True                          # Send features via shared memory if the model supports it
+daemon_socket = None                    # Attach to the inference daemon on this socket instead of starting the model
 img_width = 28                          # Resize width to this for inference
 img_height = 28                         # Resize height to this for inference
+result_cache_mb = 0                     # Memory for results of frames seen before, in MB (0 = off)
+cache_quantize_bits = 0                 # Low bits of each pixel ignored when matching frames (above 0 is lossy)
+timing_window = 1000                    # Recent frames the stage percentiles and FPS are taken over
+timing_dump = None                      # Write the stage timings to this JSON file on exit
+metrics_port = None                     # Serve Prometheus metrics on http://localhost:<port>/metrics (None = off)
 
 # The ImpulseRunner module will attempt to load files relative to its location,
 # so we make it load files relative to this program instead
@@ -31,13 +63,57 @@ dir_path = os.path.dirname(os.path.realpath(__file__))
 model_path = os.path.join(dir_path, model_file)
 
 # Load the model file
-runner = ImpulseRunner(model_path)
+if daemon_socket is not None:
+    runner = DaemonClient(daemon_socket, model_path, shared_memory=use_shm)
+else:
+    runner = ImpulseRunner(model_path)
+
+# Start the model and the camera at the same time, as both can take seconds
+startup = ConcurrentStartup()
+
+def start_model():
+    """
+    Initializes the model and runs one inference, so the first frame doesn't
+    pay for the warm-up
+    """
+    with startup.phase("model init"):
+        model_info = runner.init()
+    with startup.phase("model warm-up"):
+        runner.classify([0] * model_info['model_parameters']['input_features_count'])
+    return model_info
+
+def start_camera():
+    """
+    Opens the camera (or other frame source, see usb_pipeline/sources.py),
+    sets its format and waits for the first frame
+    """
+    with startup.phase("camera open"):
+        camera = open_source(device, res_width, res_height, fps=source_fps,
+                             loop=source_loop)
+
+        # Optionally take MJPEG from the camera and only keep the region the model sees
+        if mjpeg:
+            if rotation in (0, 180):
+                decode_roi = (res_width, res_height)
+            else:
+                decode_roi = (res_height, res_width)
+            camera = MjpegCamera(camera, scale=decode_scale, roi=decode_roi)
+            print("Camera pixel format:", camera.fourcc())
+
+    # Read frames in a background thread so capture overlaps with inference
+    camera = ThreadedCapture(camera, num_slots=capture_slots)
+    with startup.phase("first frame"):
+        camera.wait_first_frame()
+    return camera
+
+startup.start("model", start_model)
+startup.start("camera", start_camera)
 
 # Initialize model
 try:
 
     # Print model information
-    model_info = runner.init()
+    model_info = startup.result("model")
     print("Model name:", model_info['project']['name'])
     print("Model owner:", model_info['project']['owner'])
     
@@ -48,81 +124,96 @@ except Exception as e:
     if (runner):
             runner.stop()
     sys.exit(1)
+
+# Send features through shared memory when the model offers it
+transport = FeatureTransport(runner, model_info, shared_memory=use_shm)
     
 # Initial framerate value
 fps = 0
 
+# The camera, started alongside the model
+camera = startup.result("camera")
+
+# MJPEG frames are decoded at 1/decode_scale, so the crop is that much
+# smaller (the features are resized up from it)
+crop_scale = decode_scale if mjpeg else 1
+crop_width, crop_height = res_width // crop_scale, res_height // crop_scale
 
+# Rotate and crop in one warp, then resize, grayscale and normalize into a
+# reused float32 buffer. The crop is also the preview, in a buffer of its own
+# so drawing never touches the captured frame.
+extract_features = GrayscaleFeatures(img_width, img_height, crop_width,
+                                     crop_height, rotation, copy=True)
 
-# Start the camera
-camera = cv2.VideoCapture(device, cv2.CAP_V4L)
-camera.set(cv2.CAP_PROP_FRAME_WIDTH,res_width)
-camera.set(cv2.CAP_PROP_FRAME_HEIGHT,res_height)
-camera.set(cv2.CAP_PROP_MODE, 0) # CV_CAP_MODE_BGR
+# Results of frames seen before, looked up by the grayscale model input
+cache = None
+if result_cache_mb:
+    cache = ResultCache(int(result_cache_mb * (1 << 20)), cache_quantize_bits)
 
 # Initial countdown timestamp
 countdown_timestamp = cv2.getTickCount()
 
+# Time every stage of the loop, and the frames
+timer = LoopTimer(timing_window)
+timer.frame()
+
+# Optionally serve counters and stage latencies for Prometheus to scrape
+metrics = None
+if metrics_port is not None:
+    metrics = Metrics()
+    metrics.add_capture(camera)
+    metrics.add_timer(timer)
+    metrics.counter("predictions_total", "Frames classified as each label",
+                    label="label")
+    metrics.counter("inference_errors_total", "Frames inference failed on")
+    metrics_server = MetricsServer(metrics, metrics_port)
+    metrics_server.start()
+    print("Metrics:", metrics_server.url)
 
 while(True):
     
         # Acquire frame and expand frame dimensions to have shape: [1, None, None, 3]
         # i.e. a single-column array, where each item in the column has the pixel RGB value
-        ret, frame = camera.read()
-
-        # rotate image
-        if rotation == 90:
-            attr = 'ROTATE_90_CLOCKWISE'
-        elif rotation == 180:
-            attr = 'ROTATE_180'
-        elif rotation == 270:
-            attr = 'ROTATE_90_COUNTERCLOCKWISE'
-
-        if rotation > 0:
-                frame = cv2.rotate(frame, getattr(cv2, attr))
-
-                                            
-        # Get timestamp for calculating actual framerate
-        timestamp = cv2.getTickCount()
-        
-        # Get Numpy array that represents the image
-
-        img = np.array(frame)
-
-        # Crop image (for USB cameras)
-
-        center = img.shape
-        x = int(center[1]/2 - res_width/2)
-        y = int(center[0]/2 - res_height/2)
-
-
-        img = img[y:y+res_height, x:x+res_width]
+        with timer.stage("read"):
+            ret, frame = camera.read()
+        if not ret:
+            print("No more frames from:", device)
+            break
 
+        # Rotate and crop image (for USB cameras) in a single warp
+        with timer.stage("rotate"):
+            img = extract_features.crop(frame)
         
-        # Resize captured image
-        img_resize = cv2.resize(img, (img_width, img_height))
-        
-        # Convert image to grayscale
-        img_resize = cv2.cvtColor(img_resize, cv2.COLOR_BGR2GRAY)
-        
-        # Convert image to 1D vector of floating point numbers
-        features = np.reshape(img_resize, (img_width * img_height)) / 255
-        
-        # Edge Impulse model expects features in list format
-        features = features.tolist()
+        # Convert image to 1D vector of floating point numbers (0..1 grayscale)
+        with timer.stage("features"):
+            features = extract_features.from_crop(img)
         
         # Perform inference
         res = None
         try:
-            res = runner.classify(features)
+            misses = cache.misses if cache else 0
+            start_time = time.perf_counter()
+            if cache:
+                res = cache.classify(transport, extract_features.gray, features)
+            else:
+                res = transport.classify(features)
+            classify_time = time.perf_counter() - start_time
+            timer.add("classify", classify_time)
+
+            # Split the call against the model's own timing (not for cache hits)
+            if not cache or cache.misses != misses:
+                timer.runner_split(res, classify_time)
         except Exception as e:
             print("ERROR: Could not perform inference")
             print("Exception:", e)
+            if metrics is not None:
+                metrics.inc("inference_errors_total")
             
         # Display predictions and timing data
         print("Output:", res)
         
         # Display prediction on preview
+        draw_start = time.perf_counter()
         if res is not None:
         
             # Find label with the highest probability
@@ -133,11 +224,13 @@ while(True):
                 if predictions[p] > max_val:
                     max_val = predictions[p]
                     max_label = p
+            if metrics is not None:
+                metrics.inc("predictions_total", max_label)
                     
             # Draw predicted label on bottom of preview
             cv2.putText(img,
                         max_label,
-                        (0, res_height - 20),
+                        (0, crop_height - 20),
                         cv2.FONT_HERSHEY_PLAIN,
                         1,
                         (255, 255, 255))
@@ -145,7 +238,7 @@ while(True):
             # Draw predicted class's confidence score (probability)
             cv2.putText(img,
                         str(round(max_val, 2)),
-                        (0, res_height - 2),
+                        (0, crop_height - 2),
                         cv2.FONT_HERSHEY_PLAIN,
                         1,
                         (255, 255, 255))
@@ -158,22 +251,43 @@ while(True):
                         cv2.FONT_HERSHEY_PLAIN,
                         1,
                         (255, 255, 255))
+        timer.add("draw", time.perf_counter() - draw_start)
 
         # Show the frame
-        cv2.imshow("Frame", img)
+        if show_preview:
+            with timer.stage("show"):
+                cv2.imshow("Frame", img)
+                key = cv2.waitKey(1)
         
+        # Report where the time to the first result went
+        if not startup.marks:
+            startup.mark("first result")
+            print("Startup:")
+            print(startup.report())
         
-        # Calculate framrate
-        frame_time = (cv2.getTickCount() - timestamp) / cv2.getTickFrequency()
-        fps = 1 / frame_time
+        # Frames per second by the wall clock, capture and display included
+        timer.frame()
+        fps = timer.fps
         
         # Press 'q' to quit
-        if cv2.waitKey(1) == ord('q'):
+        if show_preview and key == ord('q'):
             break
 
 camera.release()
+print("Frames captured:", camera.captured,
+      "dropped:", camera.dropped,
+      "reused:", camera.reused)
+if cache:
+    print("Result cache", cache.stats())
+print("Timing:")
+print(timer.report())
+if timing_dump:
+    timer.dump(timing_dump)
 
             
 # Clean up
-cv2.destroyAllWindows()
+if metrics is not None:
+    metrics_server.stop()
+if show_preview:
+    cv2.destroyAllWindows()
 
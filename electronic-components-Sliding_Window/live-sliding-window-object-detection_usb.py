@@ -3,7 +3,26 @@
 Pi Camera Sliding Window Object Detection (USB version by Antonio)
 
 Continuously captures images and performs inference on a sliding window to 
-detect objects.
+detect objects. All windows of a frame are classified as one batch: in a single
+call with the exported CNN SavedModel (backend = 'savedmodel'), or back to back
+with the Edge Impulse runner, spread over runner_workers copies of the .eim
+model so every core takes a share of the windows. With convolutional = True the SavedModel's
+convolution layers run once over the whole frame, and per window only near its
+edges, with the same results as classifying each window; it needs windows that
+start a multiple of 4 pixels apart at model scale (e.g. window 84, stride 24,
+not the default 96). With prefilter = True windows of empty bench are rejected before inference.
+With a change_threshold, windows that haven't changed keep their last result,
+and windows that look like ones classified before (at any position) take the
+stored result from a content-hash cache of result_cache_mb megabytes. The
+cache is off by default: it only pays off when windows repeat pixel for pixel
+(file or synthetic sources, flat tiles), which a noisy USB sensor never does,
+and cache_quantize_bits above 0 lets windows that differ slightly share a
+result, so the boxes can change. Every stage of the loop is timed, and the
+FPS shown is the wall-clock throughput; the stage latency percentiles are
+printed on exit. With metrics_port set, frame counters, detections and stage
+latencies are served for Prometheus to scrape. The model and the camera start
+up at the same time, and a breakdown of the start-up time is printed with the
+first result.
 
 Author: EdgeImpulse, Inc.
 Date: August 5, 2021
@@ -15,17 +34,54 @@ import cv2
 import numpy as np
 from edge_impulse_linux.image import ImageImpulseRunner
 
+# Shared helpers live in usb_pipeline/ at the top of the repository
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from usb_pipeline.cache import ResultCache
+from usb_pipeline.capture import MjpegCamera, ThreadedCapture
+from usb_pipeline.cascade import WindowRejector
+from usb_pipeline.daemon import DaemonClient
+from usb_pipeline.geometry import GeometryPlan
+from usb_pipeline.metrics import Metrics, MetricsServer
+from usb_pipeline.pool import RunnerPool
+from usb_pipeline.savedmodel import SavedModelClassifier
+from usb_pipeline.sources import open_source
+from usb_pipeline.startup import ConcurrentStartup
+from usb_pipeline.timing import LoopTimer
+from usb_pipeline.transport import FeatureTransport
+from usb_pipeline.windows import SlidingWindows
+
 # Settings
-device = '/dev/video0'                  # Linux video device
+device = '/dev/video0'                  # Linux video device, image folder, .zip, video or 'synthetic'
+backend = 'eim'                         # 'eim' (Edge Impulse runner) or 'savedmodel' (in-process)
 model_file = "modelfile.eim"            # Trained ML model from Edge Impulse
+savedmodel_file = "../electronic-components-cnn/ei-electronic-components-cnn-nn-classifier-tensorflow-savedmodel-model-v2.zip"
+savedmodel_labels = ['background', 'capacitor', 'diode', 'led', 'resistor'] # Labels in model order
 target_label = "led"                    # Which label we're looking for
 target_threshold = 0.6                  # Draw box if output prob. >= this value
 cam_width = 320                         # Width of frame (pixels)
 cam_height = 240                        # Height of frame (pixels)
 rotation = 0                            # Camera rotation (0, 90, 180, or 270)
+capture_slots = 3                       # Frames in the capture ring buffer
+mjpeg = False                           # Capture MJPEG and decode it in Python
+decode_scale = 1                        # Decode MJPEG at 1/1, 1/2, 1/4 or 1/8 scale
+source_fps = None                       # Pace files/synthetic frames (None = as fast as possible)
+source_loop = True                      # Start image folders, zips and videos over at the end
+show_preview = True                     # Set to False to run headless
+use_shm = True                          # Send features via shared memory if the model supports it
+daemon_socket = None                    # Attach to the inference daemon on this socket instead of starting the model
+runner_workers = 1                      # .eim model processes to spread windows over (None = one per core)
 window_width = 96                       # Window width (input to CNN)
 window_height = 96                      # Window height (input to CNN)
 stride = 24                             # How many pixels to move the window
+convolutional = False                   # Share the CNN's work between overlapping windows (backend = 'savedmodel', window 84)
+prefilter = False                       # Skip windows that look like empty bench without classifying them
+change_threshold = None                 # Keep the last result of windows that changed less than this (None = off)
+refresh_every = 30                      # Classify all windows every this many frames anyway
+result_cache_mb = 0                     # Memory for results of windows seen before, in MB (0 = off, pays off on bit-identical repeats only)
+cache_quantize_bits = 0                 # Low bits of each pixel ignored when matching windows (above 0 is lossy)
+timing_window = 1000                    # Recent frames the stage percentiles and FPS are taken over
+timing_dump = None                      # Write the stage timings to this JSON file on exit
+metrics_port = None                     # Serve Prometheus metrics on http://localhost:<port>/metrics (None = off)
 
 # The ImpulseRunner module will attempt to load files relative to its location,
 # so we make it load files relative to this program instead
@@ -33,11 +89,64 @@ dir_path = os.path.dirname(os.path.realpath(__file__))
 model_path = os.path.join(dir_path, model_file)
 
 # Load the model file
-runner = ImageImpulseRunner(model_path)
+if backend == 'savedmodel':
+    runner = SavedModelClassifier(os.path.join(dir_path, savedmodel_file),
+                                  savedmodel_labels)
+elif daemon_socket is not None:
+    runner = DaemonClient(daemon_socket, model_path, shared_memory=use_shm)
+elif runner_workers == 1:
+    runner = ImageImpulseRunner(model_path)
+else:
+    runner = RunnerPool(model_path, runner_workers, shared_memory=use_shm)
+
+# Start the model and the camera at the same time, as both can take seconds
+startup = ConcurrentStartup()
+
+def start_model():
+    """
+    Initializes the model and runs one inference (one per runner of a pool),
+    so the first frame doesn't pay for the warm-up
+    """
+    with startup.phase("model init"):
+        model_info = runner.init()
+    with startup.phase("model warm-up"):
+        params = model_info['model_parameters']
+        if backend == 'savedmodel':
+            runner.classify(np.zeros((params['image_input_height'],
+                                      params['image_input_width'], 3), dtype=np.uint8))
+        elif isinstance(runner, RunnerPool):
+            runner.classify_batch([[0] * params['input_features_count']] *
+                                  len(runner.workers))
+        else:
+            runner.classify([0] * params['input_features_count'])
+    return model_info
+
+def start_camera():
+    """
+    Opens the camera (or other frame source, see usb_pipeline/sources.py),
+    sets its format and waits for the first frame
+    """
+    with startup.phase("camera open"):
+        camera = open_source(device, cam_width, cam_height, fps=source_fps,
+                             loop=source_loop)
+
+        # Optionally take MJPEG from the camera and decode it at reduced scale
+        if mjpeg:
+            camera = MjpegCamera(camera, scale=decode_scale)
+            print("Camera pixel format:", camera.fourcc())
+
+    # Read frames in a background thread so capture overlaps with inference
+    camera = ThreadedCapture(camera, num_slots=capture_slots)
+    with startup.phase("first frame"):
+        camera.wait_first_frame()
+    return camera
+
+startup.start("model", start_model)
+startup.start("camera", start_camera)
 
 # Initialize model (and print information if it loads)
 try:
-    model_info = runner.init()
+    model_info = startup.result("model")
     labels = model_info['model_parameters']['labels']
     print("Model name:", model_info['project']['name'])
     print("Model owner:", model_info['project']['owner'])
@@ -51,49 +160,72 @@ except Exception as e:
             runner.stop()
     sys.exit(1)
 
-# Compute number of window steps
-num_horizontal_windows = math.floor((cam_width - window_width) / stride) + 1
-num_vertical_windows = math.floor((cam_height - window_height) / stride) + 1
+# Send features through shared memory when the model offers it
+if backend == 'savedmodel' or isinstance(runner, RunnerPool):
+    model = runner
+else:
+    model = FeatureTransport(runner, model_info, shared_memory=use_shm)
 
 # Initial framerate value
 fps = 0
 
-# Start the camera
-camera = cv2.VideoCapture(device, cv2.CAP_V4L)
-camera.set(cv2.CAP_PROP_FRAME_WIDTH,cam_width)
-camera.set(cv2.CAP_PROP_FRAME_HEIGHT,cam_height)
-camera.set(cv2.CAP_PROP_MODE, 0) # CV_CAP_MODE_BGR
+# The camera, started alongside the model
+camera = startup.result("camera")
+
+# Rotation of the whole frame, compiled into one warp, into a buffer of its
+# own so the boxes drawn on it never reach a reused capture frame
+geometry = GeometryPlan(rotation, copy=True)
+
+# Results of windows seen before, looked up by their pixels
+cache = None
+if result_cache_mb:
+    cache = ResultCache(int(result_cache_mb * (1 << 20)), cache_quantize_bits)
+
+# All windows of a frame, fitted to the model input and classified as a batch
+windows = SlidingWindows(model, model_info, (window_width, window_height), stride,
+                         convolutional=convolutional,
+                         prefilter=WindowRejector() if prefilter else None,
+                         change_threshold=change_threshold,
+                         refresh_every=refresh_every,
+                         result_cache=cache)
+windows_rejected = 0
+windows_reused = 0
+windows_cached = 0
+windows_total = 0
 
 # Initial countdown timestamp
 countdown_timestamp = cv2.getTickCount()
 
+# Time every stage of the loop, and the frames
+timer = LoopTimer(timing_window)
+timer.frame()
+
+# Optionally serve counters and stage latencies for Prometheus to scrape
+metrics = None
+if metrics_port is not None:
+    metrics = Metrics()
+    metrics.add_capture(camera)
+    metrics.add_timer(timer)
+    metrics.counter("detections_total", "Windows detected as the target label",
+                    label="label")
+    metrics.counter("inference_errors_total", "Frames inference failed on")
+    metrics_server = MetricsServer(metrics, metrics_port)
+    metrics_server.start()
+    print("Metrics:", metrics_server.url)
 
 while(True):
     
         # Acquire frame and expand frame dimensions to have shape: [1, None, None, 3]
         # i.e. a single-column array, where each item in the column has the pixel RGB value
-        ret, frame = camera.read()
-
-        # rotate image
-        if rotation == 90:
-            attr = 'ROTATE_90_CLOCKWISE'
-        elif rotation == 180:
-            attr = 'ROTATE_180'
-        elif rotation == 270:
-            attr = 'ROTATE_90_COUNTERCLOCKWISE'
-
-        if rotation > 0:
-                frame = cv2.rotate(frame, getattr(cv2, attr))
-
-                                            
-        # Get timestamp for calculating actual framerate
-        timestamp = cv2.getTickCount()
-        
-        # Get Numpy array that represents the image
-        img = np.array(frame)
-        
-        # Convert image to RGB
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        with timer.stage("read"):
+            ret, frame = camera.read()
+        if not ret:
+            print("No more frames from:", device)
+            break
+
+        # Rotate image in a single warp
+        with timer.stage("rotate"):
+            img = geometry.apply(frame)
         
         # >>> ENTER YOUR CODE HERE <<<
         # Loop over all possible windows, crop/copy image under window, 
@@ -101,44 +233,36 @@ while(True):
         # print out info (x, y, w, h) of all bounding boxes that meet or exceed 
         # that threshold.
         
-        # Slide window across image and perform inference on each sub-image
+        # Do inference on all sub-images (window portions) at once. The output
+        # probabilities come back as one matrix: window row, column, label.
         bboxes = []
-        for vertical_window in range(num_vertical_windows):
-            for horizontal_window in range(num_horizontal_windows):
-
-                # Crop out image under window
-                x = horizontal_window * stride
-                y = vertical_window * stride
-                window_img = img[y:(y + window_height), x:(x + window_width)]
-                
-                # Extract features from image (e.g. convert to grayscale, crop, etc.)
-                features, cropped = runner.get_features_from_image(window_img)
-
-                # Do inference on sub-image (cropped window portion)
-                res = None
-                try:
-                    res = runner.classify(features)
-                except Exception as e:
-                    print("ERROR: Could not perform inference")
-                    print("Exception:", e)
-                
-                # The output probabilities are stored in the results
-                predictions = res['result']['classification']
-                
-                # Remember bounding box location if target inference >= thresh.
-                if predictions[target_label] >= target_threshold:
-                    bboxes.append((x, 
-                                   y, 
-                                   window_width, 
-                                   window_height, 
-                                   predictions[target_label]))
+        try:
+            with timer.stage("classify"):
+                probabilities = windows.probabilities(img)
+            
+            # Remember bounding box locations where target inference >= thresh.
+            with timer.stage("boxes"):
+                bboxes = windows.boxes(probabilities, target_label, target_threshold)
+            windows_rejected += windows.rejected
+            windows_reused += windows.reused
+            windows_cached += windows.cached
+            windows_total += windows.rejected + windows.reused + \
+                windows.cached + windows.classified
+            if metrics is not None:
+                metrics.inc("detections_total", target_label, len(bboxes))
+        except Exception as e:
+            print("ERROR: Could not perform inference")
+            print("Exception:", e)
+            if metrics is not None:
+                metrics.inc("inference_errors_total")
 
         # Draw bounding boxes on preview image
-        for bb in bboxes:
-            cv2.rectangle(img, 
-                          pt1=(bb[0], bb[1]), 
-                          pt2=(bb[0] + bb[2], bb[1] + bb[3]),
-                          color=(255, 255, 255))
+        with timer.stage("draw"):
+            for bb in bboxes:
+                cv2.rectangle(img, 
+                              pt1=(bb[0], bb[1]), 
+                              pt2=(bb[0] + bb[2], bb[1] + bb[3]),
+                              color=(255, 255, 255))
 
         # Print bounding box locations
         print("---")
@@ -146,24 +270,54 @@ while(True):
         for bb in bboxes:
             print(" " + "x:" + str(bb[0]) + " y:" + str(bb[1]) + " w:" + str(bb[2]) +
                     " h:" + str(bb[3]) + " prob:" + str(bb[4]))
+        if prefilter or change_threshold is not None or cache:
+            print("Windows rejected:", windows.rejected,
+                  "reused:", windows.reused,
+                  "cached:", windows.cached,
+                  "classified:", windows.classified)
         print("FPS:", round(fps, 2))
 
-        # Convert image to BGR
-        img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)        
-        
         # Show the frame
-        cv2.imshow("Frame", img)
-        
+        if show_preview:
+            with timer.stage("show"):
+                cv2.imshow("Frame", img)
+                key = cv2.waitKey(1)
+
+        # Report where the time to the first result went
+        if not startup.marks:
+            startup.mark("first result")
+            print("Startup:")
+            print(startup.report())
         
-        # Calculate framrate
-        frame_time = (cv2.getTickCount() - timestamp) / cv2.getTickFrequency()
-        fps = 1 / frame_time
+        # Frames per second by the wall clock, capture and display included
+        timer.frame()
+        fps = timer.fps
         
         # Press 'q' to quit
-        if cv2.waitKey(1) == ord('q'):
+        if show_preview and key == ord('q'):
             break
 
 camera.release()
+print("Frames captured:", camera.captured,
+      "dropped:", camera.dropped,
+      "reused:", camera.reused)
+if prefilter or change_threshold is not None or cache:
+    print("Windows rejected:", windows_rejected,
+          "reused:", windows_reused,
+          "cached:", windows_cached,
+          "of", windows_total)
+if cache:
+    print("Result cache", cache.stats())
+if isinstance(runner, RunnerPool):
+    print("Runner pool", runner.stats())
+print("Timing:")
+print(timer.report())
+if timing_dump:
+    timer.dump(timing_dump)
         
 # Clean up
-cv2.destroyAllWindows()
\ No newline at end of file
+if metrics is not None:
+    metrics_server.stop()
+runner.stop()
+if show_preview:
+    cv2.destroyAllWindows()
\ No newline at end of file
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""
+Sliding Window Result Cache Test
+
+Plays the object detection image_set as a fixed camera would see it, each
+image held for frames_per_scene frames, and runs the sliding window CNN over
+it with and without a content-hash result cache. Matching only identical
+pixels (quantize_bits 0) the probabilities must be the same as without the
+cache. Then the same with a little sensor noise added to every frame and the
+default quantization, where the test prints how many labels still match and
+how few windows are found in the cache. For both it prints the cache counters
+and the time per frame.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import os, sys, time, glob
+import cv2
+import numpy as np
+
+# Shared helpers live in usb_pipeline/ at the top of the repository
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from usb_pipeline.cache import ResultCache
+from usb_pipeline.savedmodel import SavedModelClassifier
+from usb_pipeline.windows import SlidingWindows
+
+# Settings
+model_file = "../electronic-components-cnn/ei-electronic-components-cnn-nn-classifier-tensorflow-savedmodel-model-v2.zip"
+labels = ['background', 'capacitor', 'diode', 'led', 'resistor'] # Labels in model order
+image_dir = "../electronic-components-object_detection/image_set" # Test images
+window_width = 96                       # Window width (input to CNN)
+window_height = 96                      # Window height (input to CNN)
+stride = 24                             # How many pixels to move the window
+frames_per_scene = 5                    # Frames each image is held for
+result_cache_mb = 8                     # Memory for cached results, in MB
+noise = 1.0                             # Standard deviation of the sensor noise (levels)
+
+# Print something to the console
+print()
+print("---Result Cache Test---")
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+classifier = SavedModelClassifier(os.path.join(dir_path, model_file), labels)
+model_info = classifier.init()
+window_size = (window_width, window_height)
+names = sorted(glob.glob(os.path.join(dir_path, image_dir, "*.png")))
+scenes = [cv2.imread(name) for name in names]
+frame_count = len(scenes) * frames_per_scene
+
+for noisy, quantize_bits in ((False, 0), (True, 2)):
+    print("Noise:" if noisy else "Exact repeats:", "quantize bits", quantize_bits)
+    cache = ResultCache(result_cache_mb << 20, quantize_bits)
+    full = SlidingWindows(classifier, model_info, window_size, stride)
+    cached = SlidingWindows(classifier, model_info, window_size, stride,
+                            result_cache=cache)
+    rng = np.random.default_rng(0)
+    same = 0
+    windows = 0
+    full_time = 0
+    cached_time = 0
+    for img in scenes:
+        for i in range(frames_per_scene):
+            frame = img
+            if noisy:
+                grain = rng.normal(0, noise, img.shape)
+                frame = np.clip(img + grain, 0, 255).astype(np.uint8)
+
+            start_time = time.perf_counter()
+            expected = full.probabilities(frame)
+            full_time += time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            actual = cached.probabilities(frame)
+            cached_time += time.perf_counter() - start_time
+
+            if not noisy:
+                assert np.array_equal(actual, expected), \
+                    np.abs(actual - expected).max()
+            same += np.count_nonzero(actual.argmax(-1) == expected.argmax(-1))
+            windows += expected.shape[0] * expected.shape[1]
+
+    print(" Same labels:", round(same / windows, 3))
+    print(" Cache", cache.stats())
+    print(" Without cache:", round(full_time / frame_count * 1000, 2), "ms per frame")
+    print(" With cache:", round(cached_time / frame_count * 1000, 2), "ms per frame")
+print()
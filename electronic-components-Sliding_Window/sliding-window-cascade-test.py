@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""
+Sliding Window Rejection Cascade Test
+
+Measures what the rejection cascade in front of the sliding window CNN costs
+in recall on the object detection image_set. The reference for which windows
+hold an object is the int8 object detection model: a window holds an object if
+the centre of one of its boxes lies inside it. For a few cascade settings the
+test prints the share of windows rejected (CNN calls saved) and the share of
+object windows kept (recall), and checks that the default settings keep at
+least min_recall of them.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import os, sys, time, glob
+import cv2
+import numpy as np
+
+# Shared helpers live in usb_pipeline/ at the top of the repository
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from usb_pipeline.cascade import WindowRejector
+from usb_pipeline.tflite import TFLiteDetector
+
+# Settings
+detector_file = "../electronic-components-object_detection/ei-electronic-components-object-detection-object-detection-tensorflow-lite-int8-quantized-model.lite"
+image_dir = "../electronic-components-object_detection/image_set" # Test images
+window_width = 96                       # Window width (input to CNN)
+window_height = 96                      # Window height (input to CNN)
+stride = 24                             # How many pixels to move the window
+min_recall = 0.95                       # Least share of object windows the defaults must keep
+settings = [                            # (min_variance, min_edges, min_distance) to compare
+    (100, 0.01, 30),
+    (200, 0.02, 40),
+    (400, 0.05, 60),
+]
+
+# Print something to the console
+print()
+print("---Rejection Cascade Test---")
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+detector = TFLiteDetector(os.path.join(dir_path, detector_file))
+window_size = (window_width, window_height)
+
+# Which windows of each image hold an object, according to the detector
+images = []
+objects = []
+for name in sorted(glob.glob(os.path.join(dir_path, image_dir, "*.png"))):
+    img = cv2.imread(name)
+    height, width = img.shape[:2]
+    rows = (height - window_height) // stride + 1
+    columns = (width - window_width) // stride + 1
+    x = np.arange(columns) * stride
+    y = np.arange(rows)[:, np.newaxis] * stride
+    held = np.zeros((rows, columns), dtype=bool)
+    for bbox in detector.classify(img)['result']['bounding_boxes']:
+        center_x = bbox['x'] + bbox['width'] / 2
+        center_y = bbox['y'] + bbox['height'] / 2
+        held |= (x <= center_x) & (center_x < x + window_width) & \
+            (y <= center_y) & (center_y < y + window_height)
+    images.append(img)
+    objects.append(held)
+print("Images:", len(images), "object windows:", sum(map(np.count_nonzero, objects)),
+      "of", sum(held.size for held in objects))
+
+# Rejection and recall of each setting, the defaults first
+rejectors = [("Defaults", WindowRejector())] + \
+    [(str(setting), WindowRejector(*setting)) for setting in settings]
+windows = sum(held.size for held in objects)
+recalls = []
+for label, rejector in rejectors:
+    kept = 0
+    kept_objects = 0
+    start_time = time.perf_counter()
+    for img, held in zip(images, objects):
+        keep = rejector(img, held.shape[0], held.shape[1], stride, window_size)
+        kept += np.count_nonzero(keep)
+        kept_objects += np.count_nonzero(keep & held)
+    elapsed_time = (time.perf_counter() - start_time) / len(images)
+    recall = kept_objects / sum(map(np.count_nonzero, objects))
+    recalls.append(recall)
+    print(label + ": rejected", round(1 - kept / windows, 3),
+          "recall", round(recall, 3),
+          "(" + str(round(elapsed_time * 1000, 2)), "ms per frame)")
+assert recalls[0] >= min_recall, recalls[0]
+print()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""
+Sliding Window Parity Test
+
+Classifies the windows of every image in the object detection image_set three
+ways with the CNN SavedModel: one window at a time (the original loop), all
+windows as one batch, and fully convolutionally (convolution layers run once
+over the frame, per window only near its edges). Both must give the loop's
+probabilities and target boxes; the test prints the time per frame of each
+mode. The windows are 84 pixels, so the stride is 8 pixels at model scale, a
+multiple of the CNN's pooling stride as the convolutional mode needs.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import os, sys, time, glob
+import cv2
+import numpy as np
+
+# Shared helpers live in usb_pipeline/ at the top of the repository
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from usb_pipeline.savedmodel import SavedModelClassifier
+from usb_pipeline.windows import SlidingWindows
+
+# Settings
+model_file = "../electronic-components-cnn/ei-electronic-components-cnn-nn-classifier-tensorflow-savedmodel-model-v2.zip"
+labels = ['background', 'capacitor', 'diode', 'led', 'resistor'] # Labels in model order
+image_dir = "../electronic-components-object_detection/image_set" # Test images
+target_label = "led"                    # Which label we're looking for
+target_threshold = 0.6                  # Box if output prob. >= this value
+window_width = 84                       # Window width (input to CNN)
+window_height = 84                      # Window height (input to CNN)
+stride = 24                             # How many pixels to move the window
+tolerance = 1e-5                        # Largest difference in probability allowed
+
+# Print something to the console
+print()
+print("---Sliding Window Parity Test---")
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+classifier = SavedModelClassifier(os.path.join(dir_path, model_file), labels)
+model_info = classifier.init()
+window_size = (window_width, window_height)
+batched = SlidingWindows(classifier, model_info, window_size, stride)
+convolutional = SlidingWindows(classifier, model_info, window_size, stride,
+                               convolutional=True)
+
+def loop(img):
+    """
+    One classify call per window, as the script did before batching
+    """
+    probabilities = np.empty((batched.rows, batched.columns, len(labels)),
+                             dtype=np.float32)
+    for r in range(batched.rows):
+        for c in range(batched.columns):
+            x = c * stride
+            y = r * stride
+            res = classifier.classify(img[y:(y + window_height), x:(x + window_width)])
+            predictions = res['result']['classification']
+            probabilities[r, c] = [predictions[label] for label in labels]
+    return probabilities
+
+names = sorted(glob.glob(os.path.join(dir_path, image_dir, "*.png")))
+images = [cv2.imread(name) for name in names]
+times = {"Loop": 0, "Batch": 0, "Convolutional": 0}
+same_labels = 0
+windows = 0
+same_boxes = 0
+loop_boxes = 0
+conv_boxes = 0
+for img in images:
+    start_time = time.perf_counter()
+    expected = batched.probabilities(img)
+    times["Batch"] += time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    reference = loop(img)
+    times["Loop"] += time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    actual = convolutional.probabilities(img)
+    times["Convolutional"] += time.perf_counter() - start_time
+
+    # Both must be the same as the loop
+    assert np.allclose(expected, reference, atol=tolerance), \
+        np.abs(expected - reference).max()
+    assert np.allclose(actual, reference, atol=tolerance), \
+        np.abs(actual - reference).max()
+
+    same_labels += np.count_nonzero(actual.argmax(-1) == reference.argmax(-1))
+    windows += reference.shape[0] * reference.shape[1]
+    reference_boxes = {box[:4] for box in
+                       batched.boxes(reference, target_label, target_threshold)}
+    actual_boxes = {box[:4] for box in
+                    convolutional.boxes(actual, target_label, target_threshold)}
+    same_boxes += len(reference_boxes & actual_boxes)
+    loop_boxes += len(reference_boxes)
+    conv_boxes += len(actual_boxes)
+
+print("Batch matches loop:", len(images), "images")
+print("Convolutional matches loop:", len(images), "images")
+print("Convolutional label agreement:", same_labels, "of", windows, "windows")
+print("Convolutional " + target_label + " boxes found:", same_boxes, "of", loop_boxes,
+      "(" + str(conv_boxes - same_boxes) + " extra)")
+for name, elapsed_time in times.items():
+    print(name + ":", round(elapsed_time / len(images) * 1000, 2), "ms per frame")
+assert same_labels == windows
+assert same_boxes == loop_boxes == conv_boxes
+print()
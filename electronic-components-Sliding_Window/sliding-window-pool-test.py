@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+Sliding Window Runner Pool Test
+
+Classifies a frame's worth of window features with one runner and with pools
+of several runners, checks that every pool returns the same responses in the
+same order, and prints the windows per second, the speed-up over one runner
+and how busy each runner was. By default it runs against the stand-in runner
+in usb_pipeline/ with a simulated inference time, so no trained model is
+needed; point model_file at a .eim to measure a real model (where the speed-up
+is bounded by the number of cores).
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import os, sys, time
+import numpy as np
+from edge_impulse_linux.image import ImageImpulseRunner
+
+# Shared helpers live in usb_pipeline/ at the top of the repository
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from usb_pipeline.pool import RunnerPool
+from usb_pipeline.transport import FeatureTransport
+
+# Settings
+model_file = "../usb_pipeline/standin_runner.py" # Model (.eim) or stand-in runner
+standin_delay_ms = 5                    # Stand-in runner inference time (a .eim ignores it)
+windows = 70                            # Windows per frame (320x240, 96x96, stride 24)
+frames = 5                              # Frames timed per pool size
+pool_sizes = [2, 4]                     # Runners per pool to compare with one runner
+
+# Print something to the console
+print()
+print("---Runner Pool Test---")
+
+# The ImpulseRunner module will attempt to load files relative to its location,
+# so we make it load files relative to this program instead
+dir_path = os.path.dirname(os.path.realpath(__file__))
+model_path = os.path.join(dir_path, model_file)
+os.environ['STANDIN_DELAY_MS'] = str(standin_delay_ms)
+
+# The reference: one runner, windows back to back
+runner = ImageImpulseRunner(model_path)
+try:
+    model_info = runner.init()
+    print("Model name:", model_info['project']['name'])
+    print("CPU cores:", os.cpu_count())
+    count = model_info['model_parameters']['input_features_count']
+
+    # Random packed 0xRRGGBB pixels, as sent for a window
+    rng = np.random.default_rng(0)
+    batch = [rng.integers(0, 1 << 24, count).astype(np.float32)
+             for _ in range(windows)]
+
+    transport = FeatureTransport(runner, model_info)
+    expected = [transport.classify(features)['result'] for features in batch]
+    start_time = time.perf_counter()
+    for i in range(frames):
+        for features in batch:
+            transport.classify(features)
+    single_rate = frames * windows / (time.perf_counter() - start_time)
+    print("1 runner:", round(single_rate, 1), "windows per second")
+    transport.close()
+finally:
+    runner.stop()
+
+# The same windows through pools of runners
+for size in pool_sizes:
+    pool = RunnerPool(model_path, size)
+    try:
+        pool.init()
+        actual = [res['result'] for res in pool.classify_batch(batch)]
+        assert actual == expected, "pool of " + str(size) + " changed the results"
+
+        start_time = time.perf_counter()
+        for i in range(frames):
+            pool.classify_batch(batch)
+        rate = frames * windows / (time.perf_counter() - start_time)
+        print(str(size), "runners:", round(rate, 1), "windows per second,",
+              "speed-up", round(rate / single_rate, 2))
+        print(" ", pool.stats())
+    finally:
+        pool.stop()
+print()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""
+Sliding Window Temporal Reuse Test
+
+Plays the object detection image_set as a fixed camera would see it, each
+image held for frames_per_scene frames, and runs the sliding window CNN over
+it twice: classifying every window of every frame, and classifying only the
+windows that changed (change_threshold, refresh_every). With exactly repeated
+frames and threshold 0 the boxes must be identical. Then the same with a little
+sensor noise added to every frame, where the test prints how many boxes still
+match. For both it prints the windows classified and the time per frame.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import os, sys, time, glob
+import cv2
+import numpy as np
+
+# Shared helpers live in usb_pipeline/ at the top of the repository
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from usb_pipeline.savedmodel import SavedModelClassifier
+from usb_pipeline.windows import SlidingWindows
+
+# Settings
+model_file = "../electronic-components-cnn/ei-electronic-components-cnn-nn-classifier-tensorflow-savedmodel-model-v2.zip"
+labels = ['background', 'capacitor', 'diode', 'led', 'resistor'] # Labels in model order
+image_dir = "../electronic-components-object_detection/image_set" # Test images
+target_label = "led"                    # Which label we're looking for
+target_threshold = 0.6                  # Box if output prob. >= this value
+window_width = 96                       # Window width (input to CNN)
+window_height = 96                      # Window height (input to CNN)
+stride = 24                             # How many pixels to move the window
+frames_per_scene = 10                   # Frames each image is held for
+refresh_every = 30                      # Classify all windows every this many frames
+noise = 2.0                             # Standard deviation of the sensor noise (levels)
+noise_threshold = 3.0                   # Change threshold used with noise
+
+# Print something to the console
+print()
+print("---Temporal Reuse Test---")
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+classifier = SavedModelClassifier(os.path.join(dir_path, model_file), labels)
+model_info = classifier.init()
+window_size = (window_width, window_height)
+names = sorted(glob.glob(os.path.join(dir_path, image_dir, "*.png")))
+scenes = [cv2.imread(name) for name in names]
+
+def frames(noisy):
+    """
+    Every scene held for frames_per_scene frames, optionally with noise
+    """
+    rng = np.random.default_rng(0)
+    for img in scenes:
+        for i in range(frames_per_scene):
+            if noisy:
+                grain = rng.normal(0, noise, img.shape)
+                yield np.clip(img + grain, 0, 255).astype(np.uint8)
+            else:
+                yield img
+
+def run(windows, noisy):
+    """
+    Returns the boxes of every frame, the windows classified and the time
+    """
+    boxes = []
+    classified = 0
+    elapsed_time = 0
+    for img in frames(noisy):
+        start_time = time.perf_counter()
+        probabilities = windows.probabilities(img)
+        elapsed_time += time.perf_counter() - start_time
+        boxes.append(windows.boxes(probabilities, target_label, target_threshold))
+        classified += windows.classified
+    return boxes, classified, elapsed_time
+
+frame_count = len(scenes) * frames_per_scene
+for noisy, threshold in ((False, 0), (True, noise_threshold)):
+    print("Noise:" if noisy else "Exact repeats:",
+          "change threshold", threshold)
+    full = SlidingWindows(classifier, model_info, window_size, stride)
+    incremental = SlidingWindows(classifier, model_info, window_size, stride,
+                                 change_threshold=threshold,
+                                 refresh_every=refresh_every)
+    expected, full_classified, full_time = run(full, noisy)
+    actual, classified, incremental_time = run(incremental, noisy)
+
+    same = sum(a == e for a, e in zip(actual, expected))
+    print(" Frames with identical boxes:", same, "of", frame_count)
+    print(" Windows classified:", classified, "of", full_classified)
+    print(" Every window:", round(full_time / frame_count * 1000, 2), "ms per frame")
+    print(" Changed windows:", round(incremental_time / frame_count * 1000, 2), "ms per frame")
+    if not noisy:
+        assert same == frame_count, same
+print()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""
+CNN Batch Evaluation
+
+Classifies every image of the electronic components dataset with the exported
+SavedModel, batch_size images per model call, and prints the accuracy per
+label (the label of an image is its folder in the zip) and the time per image
+at a few batch sizes.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import os, sys, time
+
+# Shared helpers live in usb_pipeline/ at the top of the repository
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from usb_pipeline.savedmodel import SavedModelClassifier
+from usb_pipeline.sources import ZipSource
+
+# Settings
+model_file = "ei-electronic-components-cnn-nn-classifier-tensorflow-savedmodel-model-v2.zip"
+labels = ['background', 'capacitor', 'diode', 'led', 'resistor'] # Labels in model order
+dataset_file = "electronic-components-png.zip" # Images in one folder per label
+batch_size = 32                         # Images per model call
+timed_batch_sizes = [1, 16, 64]         # Batch sizes to time
+
+# Print something to the console
+print()
+print("---CNN Batch Evaluation---")
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+classifier = SavedModelClassifier(os.path.join(dir_path, model_file), labels)
+print("Model:", classifier.model_info['project']['name'])
+print("Labels:", classifier.labels)
+
+# Load the whole dataset with the label of each image
+dataset = ZipSource(os.path.join(dir_path, dataset_file))
+images = []
+truth = []
+while True:
+    ret, img = dataset.read()
+    if not ret:
+        break
+    images.append(img)
+    truth.append(dataset.label)
+dataset.release()
+
+# Classify it in batches and count the correct answers per label
+correct = dict.fromkeys(labels, 0)
+total = dict.fromkeys(labels, 0)
+for start in range(0, len(images), batch_size):
+    results = classifier.classify_batch(images[start:start + batch_size])
+    for res, label in zip(results, truth[start:start + batch_size]):
+        predictions = res['result']['classification']
+        total[label] += 1
+        correct[label] += max(predictions, key=predictions.get) == label
+for label in labels:
+    print(label + ": " + str(correct[label]) + "/" + str(total[label]))
+print("Accuracy:", round(sum(correct.values()) / len(images), 3))
+
+# Time per image at different batch sizes
+for size in timed_batch_sizes:
+    batches = [images[i:i + size] for i in range(0, len(images), size)]
+    classifier.classify_batch(batches[0])
+    start_time = time.perf_counter()
+    for batch in batches:
+        classifier.classify_batch(batch)
+    elapsed_time = (time.perf_counter() - start_time) / len(images)
+    print("Batch size " + str(size) + ":", round(elapsed_time * 1000, 3),
+          "ms per image")
+print()
@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+"""
+Multi-Camera Live Image Classification (USB version by Antonio)
+
+Classifies the continuous streams of several USB cameras with one Edge Impulse
+Runner and one copy of the .eim model. The newest frames of all cameras are
+grouped into micro-batches, classified together, and each result is drawn in
+its own camera's window along with that camera's framerate (FPS) and latency.
+With runner_workers above 1 the frames of a batch are spread over that many
+copies of the .eim model, one process each.
+With backend = 'savedmodel' each batch is one call to the exported SavedModel.
+Every stage of the loop is timed per batch, and the stage latency percentiles
+are printed on exit. With metrics_port set, per-camera frame counters,
+predictions and stage latencies are served for Prometheus to scrape. The
+model and the cameras start up at the same time, and a breakdown of the
+start-up time is printed with the first results.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import os, sys, time
+import cv2
+import numpy as np
+from edge_impulse_linux.image import ImageImpulseRunner
+
+# Shared helpers live in usb_pipeline/ at the top of the repository
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from usb_pipeline.daemon import DaemonClient
+from usb_pipeline.features import PackedPixelFeatures
+from usb_pipeline.geometry import GeometryPlan
+from usb_pipeline.metrics import Metrics, MetricsServer
+from usb_pipeline.multicam import MultiCamera, classify_batch
+from usb_pipeline.pool import RunnerPool
+from usb_pipeline.savedmodel import SavedModelClassifier
+from usb_pipeline.sources import open_source
+from usb_pipeline.startup import ConcurrentStartup
+from usb_pipeline.timing import LoopTimer
+from usb_pipeline.transport import FeatureTransport
+
+# Settings
+devices = ['/dev/video0', '/dev/video1'] # Linux video devices (or other sources)
+backend = 'eim'                          # 'eim' (Edge Impulse runner) or 'savedmodel' (in-process)
+model_file = "modelfile.eim"             # Trained ML model from Edge Impulse
+savedmodel_file = "ei-electronic-components-cnn-nn-classifier-tensorflow-savedmodel-model-v2.zip"
+savedmodel_labels = ['background', 'capacitor', 'diode', 'led', 'resistor'] # Labels in model order
+res_width = 96                           # Resolution of camera (width)
+res_height = 96                          # Resolution of camera (height)
+rotation = 0                             # Camera rotation (0, 90, 180, or 270)
+capture_slots = 3                        # Frames in each capture ring buffer
+max_batch = 4                            # Most frames classified per batch
+source_fps = None                        # Pace files/synthetic frames (None = as fast as possible)
+source_loop = True                       # Start image folders, zips and videos over at the end
+show_preview = True                      # Set to False to run headless
+use_shm = True                           # Send features via shared memory if the model supports it
+daemon_socket = None                     # Attach to the inference daemon on this socket instead of starting the model
+runner_workers = 1                       # .eim model processes to spread each batch over (None = one per core)
+timing_window = 1000                     # Recent batches the stage percentiles and throughput are taken over
+timing_dump = None                       # Write the stage timings to this JSON file on exit
+metrics_port = None                      # Serve Prometheus metrics on http://localhost:<port>/metrics (None = off)
+
+# The ImpulseRunner module will attempt to load files relative to its location,
+# so we make it load files relative to this program instead
+dir_path = os.path.dirname(os.path.realpath(__file__))
+model_path = os.path.join(dir_path, model_file)
+
+# Load the model file
+if backend == 'savedmodel':
+    runner = SavedModelClassifier(os.path.join(dir_path, savedmodel_file),
+                                  savedmodel_labels)
+elif daemon_socket is not None:
+    runner = DaemonClient(daemon_socket, model_path, shared_memory=use_shm)
+elif runner_workers == 1:
+    runner = ImageImpulseRunner(model_path)
+else:
+    runner = RunnerPool(model_path, runner_workers, shared_memory=use_shm)
+
+# Start the model and the cameras at the same time, as both can take seconds
+startup = ConcurrentStartup()
+
+def start_model():
+    """
+    Initializes the model and runs one inference (one per runner of a pool),
+    so the first batch doesn't pay for the warm-up
+    """
+    with startup.phase("model init"):
+        model_info = runner.init()
+    with startup.phase("model warm-up"):
+        params = model_info['model_parameters']
+        if backend == 'savedmodel':
+            runner.classify(np.zeros((params['image_input_height'],
+                                      params['image_input_width'], 3), dtype=np.uint8))
+        elif isinstance(runner, RunnerPool):
+            runner.classify_batch([[0] * params['input_features_count']] *
+                                  len(runner.workers))
+        else:
+            runner.classify([0] * params['input_features_count'])
+    return model_info
+
+def start_cameras():
+    """
+    Opens every camera (or other frame source, see usb_pipeline/sources.py),
+    each with its own capture thread, and waits for their first frames
+    """
+    with startup.phase("camera open"):
+        sources = [open_source(device, res_width, res_height, fps=source_fps,
+                               loop=source_loop)
+                   for device in devices]
+    cameras = MultiCamera(sources, num_slots=capture_slots)
+    with startup.phase("first frame"):
+        for camera in cameras.cameras:
+            camera.wait_first_frame()
+    return cameras
+
+startup.start("model", start_model)
+startup.start("cameras", start_cameras)
+
+# Initialize model (and print information if it loads)
+try:
+    model_info = startup.result("model")
+    print("Model name:", model_info['project']['name'])
+    print("Model owner:", model_info['project']['owner'])
+
+# Exit if we cannot initialize the model
+except Exception as e:
+    print("ERROR: Could not initialize model")
+    print("Exception:", e)
+    if (runner):
+            runner.stop()
+    sys.exit(1)
+
+# Send features through shared memory when the model offers it (the pool
+# has a transport per runner)
+if isinstance(runner, RunnerPool):
+    transport = runner
+elif backend != 'savedmodel':
+    transport = FeatureTransport(runner, model_info, shared_memory=use_shm)
+
+# The cameras, started alongside the model
+cameras = startup.result("cameras")
+
+# Rotation and the runner's resize/crop to the model input, one plan per camera
+model_size = (model_info['model_parameters']['image_input_width'],
+              model_info['model_parameters']['image_input_height'])
+geometry = [GeometryPlan(rotation, out_size=model_size) for _ in devices]
+pack_features = PackedPixelFeatures.for_model(model_info)
+
+# The rotated full-size frames for the previews, in buffers of their own to draw on
+preview_geometry = [GeometryPlan(rotation, copy=True) for _ in devices]
+
+# Time every stage of the loop, and the batches
+timer = LoopTimer(timing_window)
+timer.frame()
+
+# Optionally serve counters and stage latencies for Prometheus to scrape
+metrics = None
+if metrics_port is not None:
+    metrics = Metrics()
+    metrics.add_cameras(cameras)
+    metrics.add_timer(timer)
+    metrics.counter("predictions_total",
+                    "Frames classified as each label, per camera",
+                    label=("camera", "label"))
+    metrics.counter("inference_errors_total", "Batches inference failed on")
+    metrics_server = MetricsServer(metrics, metrics_port)
+    metrics_server.start()
+    print("Metrics:", metrics_server.url)
+
+
+while(True):
+
+        # Newest frame of each camera that has one
+        read_start = time.perf_counter()
+        batch = cameras.next_batch(max_batch)
+        if batch is None:
+            print("No more frames from any camera")
+            break
+
+        # Nothing new within the timeout: keep the windows responsive, but
+        # don't count it as a batch
+        if not batch:
+            if show_preview and cv2.waitKey(1) == ord('q'):
+                break
+            continue
+        timer.add("read", time.perf_counter() - read_start)
+
+        # Rotate and fit each frame to the model input, and pack its pixels
+        # (the SavedModel takes the images themselves). The rotated full-size
+        # frame is kept for the preview.
+        frames = []
+        previews = []
+        features = []
+        for i, frame, captured_at in batch:
+            with timer.stage("rotate"):
+                img = geometry[i].apply(frame)
+                frames.append(img)
+                previews.append(preview_geometry[i].apply(frame))
+            if backend != 'savedmodel':
+                with timer.stage("features"):
+                    features.append(pack_features(img).copy())
+
+        # Perform inference on the batch, in a single model call with the
+        # SavedModel
+        results = None
+        try:
+            classify_start = time.perf_counter()
+            if backend == 'savedmodel':
+                results = runner.classify_batch(frames)
+            else:
+                results = classify_batch(transport, features)
+            timer.add("classify", time.perf_counter() - classify_start)
+        except Exception as e:
+            print("ERROR: Could not perform inference")
+            print("Exception:", e)
+            if metrics is not None:
+                metrics.inc("inference_errors_total")
+            continue
+
+        # Route each result back to the camera it came from
+        draw_start = time.perf_counter()
+        for (i, _, captured_at), preview, res in zip(batch, previews, results):
+            cameras.done(i, captured_at)
+            stats = cameras.stats[i]
+
+            # Find label with the highest probability
+            predictions = res['result']['classification']
+            max_label = max(predictions, key=predictions.get)
+            if metrics is not None:
+                metrics.inc("predictions_total", (i, max_label))
+            print("Camera " + str(i) + ": " + max_label + " " +
+                  str(round(predictions[max_label], 3)) +
+                  " FPS: " + str(round(stats.fps, 2)) +
+                  " latency: " + str(round(stats.latency_ms, 1)) + " ms")
+
+            # Draw max label, probability and camera stats on preview window
+            cv2.putText(preview,
+                        max_label + " " + str(round(predictions[max_label], 2)),
+                        (0, 12),
+                        cv2.FONT_HERSHEY_PLAIN,
+                        1,
+                        (255, 255, 255))
+            cv2.putText(preview,
+                        "FPS: " + str(round(stats.fps, 2)),
+                        (0, 24),
+                        cv2.FONT_HERSHEY_PLAIN,
+                        1,
+                        (255, 255, 255))
+        timer.add("draw", time.perf_counter() - draw_start)
+
+        # Report where the time to the first results went
+        if not startup.marks:
+            startup.mark("first result")
+            print("Startup:")
+            print(startup.report())
+
+        # Show each frame in its camera's window
+        if show_preview:
+            with timer.stage("show"):
+                for (i, _, _), preview in zip(batch, previews):
+                    cv2.imshow("Camera " + str(i), preview)
+                key = cv2.waitKey(1)
+
+        # Batches per second by the wall clock, capture and display included
+        timer.frame()
+
+        # Press 'q' to quit
+        if show_preview and key == ord('q'):
+            break
+
+cameras.release()
+for i, stats in enumerate(cameras.stats):
+    print("Camera", i, "processed:", stats.processed,
+          "dropped:", cameras.cameras[i].dropped,
+          "max latency (ms):", round(stats.max_latency_ms, 1))
+if isinstance(runner, RunnerPool):
+    print("Runner pool", runner.stats())
+print("Timing:")
+print(timer.report())
+if timing_dump:
+    timer.dump(timing_dump)
+
+# Clean up
+if metrics is not None:
+    metrics_server.stop()
+runner.stop()
+if show_preview:
+    cv2.destroyAllWindows()
@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+"""
+Pipelined Live Image Classification (USB version by Antonio)
+
+The live classification script with its steps run as a pipeline: capture,
+preprocess (rotate, fit to the model input and pack the pixels), infer and
+render each run as a stage of usb_pipeline/pipeline.py, joined by bounded
+queues. While the model classifies one frame the next is being captured and
+preprocessed, so the frame rate is set by the slowest stage rather than by all
+of them together. With queue_policy = 'drop-oldest' a stage that falls behind
+skips to the newest frame; with 'block' every captured frame is classified.
+Queue depths and the time each stage was busy, starved and blocked are printed
+on exit. With metrics_port set, frame counters, queue depths and drops, and
+predictions are served for Prometheus to scrape. The model and the camera
+start up at the same time, and a breakdown of the start-up time is printed
+with the first result.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import os, sys, time
+import cv2
+import numpy as np
+from edge_impulse_linux.image import ImageImpulseRunner
+
+# Shared helpers live in usb_pipeline/ at the top of the repository
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from usb_pipeline.capture import MjpegCamera, ThreadedCapture
+from usb_pipeline.daemon import DaemonClient
+from usb_pipeline.features import PackedPixelFeatures
+from usb_pipeline.geometry import GeometryPlan
+from usb_pipeline.metrics import Metrics, MetricsServer
+from usb_pipeline.pipeline import Stage, StagedPipeline
+from usb_pipeline.savedmodel import SavedModelClassifier
+from usb_pipeline.sources import open_source
+from usb_pipeline.startup import ConcurrentStartup
+from usb_pipeline.transport import FeatureTransport
+
+# Settings
+device = '/dev/video0'                  # Linux video device, image folder, .zip, video or 'synthetic'
+backend = 'eim'                         # 'eim' (Edge Impulse runner) or 'savedmodel' (in-process)
+model_file = "modelfile.eim"            # Trained ML model from Edge Impulse
+savedmodel_file = "ei-electronic-components-cnn-nn-classifier-tensorflow-savedmodel-model-v2.zip"
+savedmodel_labels = ['background', 'capacitor', 'diode', 'led', 'resistor'] # Labels in model order
+res_width = 96                          # Resolution of camera (width)
+res_height = 96                         # Resolution of camera (height)
+rotation = 0                            # Camera rotation (0, 90, 180, or 270)
+capture_slots = 3                       # Frames in the capture ring buffer
+mjpeg = False                           # Capture MJPEG and decode it in Python
+decode_scale = 1                        # Decode MJPEG at 1/1, 1/2, 1/4 or 1/8 scale
+source_fps = None                       # Pace files/synthetic frames (None = as fast as possible)
+source_loop = True                      # Start image folders, zips and videos over at the end
+show_preview = True                     # Set to False to run headless
+use_shm = True                          # Send features via shared memory if the model supports it
+daemon_socket = None                    # Attach to the inference daemon on this socket instead of starting the model
+queue_size = 2                          # Frames waiting in front of each stage
+queue_policy = 'drop-oldest'            # 'drop-oldest' (skip to newest frame) or 'block' (keep every frame)
+metrics_port = None                     # Serve Prometheus metrics on http://localhost:<port>/metrics (None = off)
+
+# The ImpulseRunner module will attempt to load files relative to its location,
+# so we make it load files relative to this program instead
+dir_path = os.path.dirname(os.path.realpath(__file__))
+model_path = os.path.join(dir_path, model_file)
+
+# Load the model file
+if backend == 'savedmodel':
+    runner = SavedModelClassifier(os.path.join(dir_path, savedmodel_file),
+                                  savedmodel_labels)
+elif daemon_socket is not None:
+    runner = DaemonClient(daemon_socket, model_path, shared_memory=use_shm)
+else:
+    runner = ImageImpulseRunner(model_path)
+
+# Start the model and the camera at the same time, as both can take seconds
+startup = ConcurrentStartup()
+
+def start_model():
+    """
+    Initializes the model and runs one inference, so the first frame doesn't
+    pay for the warm-up
+    """
+    with startup.phase("model init"):
+        model_info = runner.init()
+    with startup.phase("model warm-up"):
+        params = model_info['model_parameters']
+        if backend == 'savedmodel':
+            runner.classify(np.zeros((params['image_input_height'],
+                                      params['image_input_width'], 3), dtype=np.uint8))
+        else:
+            runner.classify([0] * params['input_features_count'])
+    return model_info
+
+def start_camera():
+    """
+    Opens the camera (or other frame source, see usb_pipeline/sources.py),
+    sets its format and waits for the first frame
+    """
+    with startup.phase("camera open"):
+        camera = open_source(device, res_width, res_height, fps=source_fps,
+                             loop=source_loop)
+
+        # Optionally take MJPEG from the camera and decode it at reduced scale
+        if mjpeg:
+            camera = MjpegCamera(camera, scale=decode_scale)
+            print("Camera pixel format:", camera.fourcc())
+
+    # Read frames in a background thread so capture overlaps with inference
+    camera = ThreadedCapture(camera, num_slots=capture_slots)
+    with startup.phase("first frame"):
+        camera.wait_first_frame()
+    return camera
+
+startup.start("model", start_model)
+startup.start("camera", start_camera)
+
+# Initialize model (and print information if it loads)
+try:
+    model_info = startup.result("model")
+    print("Model name:", model_info['project']['name'])
+    print("Model owner:", model_info['project']['owner'])
+
+# Exit if we cannot initialize the model
+except Exception as e:
+    print("ERROR: Could not initialize model")
+    print("Exception:", e)
+    if (runner):
+            runner.stop()
+    sys.exit(1)
+
+# Send features through shared memory when the model offers it
+if backend != 'savedmodel':
+    transport = FeatureTransport(runner, model_info, shared_memory=use_shm)
+
+# The camera, started alongside the model
+camera = startup.result("camera")
+
+# Rotation and the runner's resize/crop to the model input, compiled into one warp
+model_size = (model_info['model_parameters']['image_input_width'],
+              model_info['model_parameters']['image_input_height'])
+geometry = GeometryPlan(rotation, out_size=model_size)
+pack_features = PackedPixelFeatures.for_model(model_info)
+
+# The rotated full-size frame for the preview, in a buffer of its own to draw on
+preview_geometry = GeometryPlan(rotation, copy=True)
+
+# Frames shown and when the last one was, for the framerate
+rendered = {'count': 0, 'timestamp': None, 'fps': 0}
+
+
+def capture():
+    """
+    Source stage: the next frame, copied out of the ring buffer because the
+    stages after this one still use it after the next read
+    """
+    ret, frame = camera.read()
+    if not ret:
+        print("No more frames from:", device)
+        return None
+    return {'frame': frame.copy(), 'captured_at': cv2.getTickCount()}
+
+
+def preprocess(item):
+    """
+    Rotates and fits the frame to the model input in a single warp, and packs
+    its pixels for the runner (the SavedModel takes the image itself). The
+    rotated full-size frame is kept for the preview. All come from reused
+    buffers, so they are copied for the next stages.
+    """
+    frame = item.pop('frame')
+    item['img'] = geometry.apply(frame).copy()
+    item['preview'] = preview_geometry.apply(frame).copy()
+    if backend != 'savedmodel':
+        item['features'] = pack_features(item['img']).copy()
+    return item
+
+
+def infer(item):
+    """
+    Classifies the frame, or drops it if inference fails
+    """
+    try:
+        if backend == 'savedmodel':
+            item['res'] = runner.classify(item['img'])
+        else:
+            item['res'] = transport.classify(item.pop('features'))
+    except Exception as e:
+        print("ERROR: Could not perform inference")
+        print("Exception:", e)
+        if metrics is not None:
+            metrics.inc("inference_errors_total")
+        return None
+    return item
+
+
+def render(item):
+    """
+    Prints the predictions, draws the max label on the frame and shows it
+    """
+    preview = item['preview']
+    timestamp = cv2.getTickCount()
+    latency = (timestamp - item['captured_at']) / cv2.getTickFrequency()
+
+    # Display predictions, framerate and capture-to-render latency
+    print("-----")
+    results = item['res']['result']['classification']
+    for label in results:
+        prob = results[label]
+        print(label + ": " + str(round(prob, 3)))
+    print("FPS: " + str(round(rendered['fps'], 3)) +
+          " latency: " + str(round(latency * 1000, 1)) + " ms")
+
+    # Find label with the highest probability
+    max_label = max(results, key=results.get)
+    if metrics is not None:
+        metrics.inc("predictions_total", max_label)
+
+    # Draw max label and probability on preview window
+    cv2.putText(preview,
+                max_label,
+                (0, 12),
+                cv2.FONT_HERSHEY_PLAIN,
+                1,
+                (255, 255, 255))
+    cv2.putText(preview,
+                str(round(results[max_label], 2)),
+                (0, 24),
+                cv2.FONT_HERSHEY_PLAIN,
+                1,
+                (255, 255, 255))
+
+    # Show the frame
+    if show_preview:
+        cv2.imshow("Frame", preview)
+
+    # Calculate framerate from the time between shown frames
+    if rendered['timestamp'] is not None:
+        frame_time = (timestamp - rendered['timestamp']) / cv2.getTickFrequency()
+        rendered['fps'] = 1 / frame_time if frame_time > 0 else 0
+    rendered['timestamp'] = timestamp
+    rendered['count'] += 1
+
+    # Report where the time to the first result went
+    if not startup.marks:
+        startup.mark("first result")
+        print("Startup:")
+        print(startup.report())
+
+    # Press 'q' to quit
+    if show_preview and cv2.waitKey(1) == ord('q'):
+        pipeline.stop()
+    return item
+
+
+# Capture, preprocess and inference run on threads of their own; drawing and
+# showing stay on the main thread
+pipeline = StagedPipeline([
+    Stage("capture", capture),
+    Stage("preprocess", preprocess, queue_size, queue_policy),
+    Stage("infer", infer, queue_size, queue_policy),
+    Stage("render", render, queue_size, queue_policy, inline=True),
+])
+
+# Optionally serve counters and queue depths for Prometheus to scrape. They are
+# read when scraped, on the server's thread.
+metrics = None
+if metrics_port is not None:
+    metrics = Metrics()
+    metrics.add_capture(camera)
+    metrics.add_pipeline(pipeline)
+    metrics.counter("predictions_total", "Frames classified as each label",
+                    label="label")
+    metrics.counter("inference_errors_total", "Frames inference failed on")
+    metrics_server = MetricsServer(metrics, metrics_port)
+    metrics_server.start()
+    print("Metrics:", metrics_server.url)
+
+try:
+    pipeline.run()
+except KeyboardInterrupt:
+    pass
+
+camera.release()
+print("Frames captured:", camera.captured,
+      "dropped:", camera.dropped,
+      "reused:", camera.reused)
+print("Frames shown:", rendered['count'], "in", round(pipeline.elapsed, 2), "s")
+print(pipeline.stats())
+
+# Clean up
+if metrics is not None:
+    metrics_server.stop()
+runner.stop()
+if show_preview:
+    cv2.destroyAllWindows()
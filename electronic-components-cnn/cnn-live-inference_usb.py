@@ -3,8 +3,16 @@
 Pi Camera Live Image Classification (USB version by Antonio)
 
 Detects objects in continuous stream of images from Pi Camera. Use Edge Impulse
-Runner and downloaded .eim model file to perform inference. Bounding box info is
+Runner and downloaded .eim model file to perform inference, or the exported
+SavedModel inside this process (backend = 'savedmodel'). Bounding box info is
 drawn on top of detected objects along with framerate (FPS) in top-left corner.
+With result_cache_mb set, frames that look like one classified before take its
+result from a content-hash cache instead of running the model again. The
+model and the camera start up at the same time, and a breakdown of the
+start-up time is printed with the first result. Every stage of the loop is
+timed, and the FPS shown is the wall-clock throughput; the stage latency
+percentiles are printed on exit. With metrics_port set, frame counters,
+predictions and stage latencies are served for Prometheus to scrape.
 
 Author: EdgeImpulse, Inc.
 Date: August 3, 2021
@@ -16,12 +24,42 @@ import cv2
 import numpy as np
 from edge_impulse_linux.image import ImageImpulseRunner
 
+# Shared helpers live in usb_pipeline/ at the top of the repository
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from usb_pipeline.cache import ResultCache
+from usb_pipeline.capture import MjpegCamera, ThreadedCapture
+from usb_pipeline.daemon import DaemonClient
+from usb_pipeline.features import PackedPixelFeatures
+from usb_pipeline.geometry import GeometryPlan
+from usb_pipeline.metrics import Metrics, MetricsServer
+from usb_pipeline.savedmodel import SavedModelClassifier
+from usb_pipeline.sources import open_source
+from usb_pipeline.startup import ConcurrentStartup
+from usb_pipeline.timing import LoopTimer
+from usb_pipeline.transport import FeatureTransport
+
 # Settings
-device = '/dev/video0'                  # Linux video device
+device = '/dev/video0'                  # Linux video device, image folder, .zip, video or 'synthetic'
+backend = 'eim'                         # 'eim' (Edge Impulse runner) or 'savedmodel' (in-process)
 model_file = "modelfile.eim"            # Trained ML model from Edge Impulse
+savedmodel_file = "ei-electronic-components-cnn-nn-classifier-tensorflow-savedmodel-model-v2.zip"
+savedmodel_labels = ['background', 'capacitor', 'diode', 'led', 'resistor'] # Labels in model order
 res_width = 96                          # Resolution of camera (width)
 res_height = 96                         # Resolution of camera (height)
 rotation = 0                            # Camera rotation (0, 90, 180, or 270)
+capture_slots = 3                       # Frames in the capture ring buffer
+mjpeg = False                           # Capture MJPEG and decode it in Python
+decode_scale = 1                        # Decode MJPEG at 1/1, 1/2, 1/4 or 1/8 scale
+source_fps = None                       # Pace files/synthetic frames (None = as fast as possible)
+source_loop = True                      # Start image folders, zips and videos over at the end
+show_preview = True                     # Set to False to run headless
+use_shm = True                          # Send features via shared memory if the model supports it
+daemon_socket = None                    # Attach to the inference daemon on this socket instead of starting the model
+result_cache_mb = 0                     # Memory for results of frames seen before, in MB (0 = off)
+cache_quantize_bits = 0                 # Low bits of each pixel ignored when matching frames (above 0 is lossy)
+timing_window = 1000                    # Recent frames the stage percentiles and FPS are taken over
+timing_dump = None                      # Write the stage timings to this JSON file on exit
+metrics_port = None                     # Serve Prometheus metrics on http://localhost:<port>/metrics (None = off)
 
 # The ImpulseRunner module will attempt to load files relative to its location,
 # so we make it load files relative to this program instead
@@ -29,11 +67,59 @@ dir_path = os.path.dirname(os.path.realpath(__file__))
 model_path = os.path.join(dir_path, model_file)
 
 # Load the model file
-runner = ImageImpulseRunner(model_path)
+if backend == 'savedmodel':
+    runner = SavedModelClassifier(os.path.join(dir_path, savedmodel_file),
+                                  savedmodel_labels)
+elif daemon_socket is not None:
+    runner = DaemonClient(daemon_socket, model_path, shared_memory=use_shm)
+else:
+    runner = ImageImpulseRunner(model_path)
+
+# Start the model and the camera at the same time, as both can take seconds
+startup = ConcurrentStartup()
+
+def start_model():
+    """
+    Initializes the model and runs one inference, so the first frame doesn't
+    pay for the warm-up
+    """
+    with startup.phase("model init"):
+        model_info = runner.init()
+    with startup.phase("model warm-up"):
+        params = model_info['model_parameters']
+        if backend == 'savedmodel':
+            runner.classify(np.zeros((params['image_input_height'],
+                                      params['image_input_width'], 3), dtype=np.uint8))
+        else:
+            runner.classify([0] * params['input_features_count'])
+    return model_info
+
+def start_camera():
+    """
+    Opens the camera (or other frame source, see usb_pipeline/sources.py),
+    sets its format and waits for the first frame
+    """
+    with startup.phase("camera open"):
+        camera = open_source(device, res_width, res_height, fps=source_fps,
+                             loop=source_loop)
+
+        # Optionally take MJPEG from the camera and decode it at reduced scale
+        if mjpeg:
+            camera = MjpegCamera(camera, scale=decode_scale)
+            print("Camera pixel format:", camera.fourcc())
+
+    # Read frames in a background thread so capture overlaps with inference
+    camera = ThreadedCapture(camera, num_slots=capture_slots)
+    with startup.phase("first frame"):
+        camera.wait_first_frame()
+    return camera
+
+startup.start("model", start_model)
+startup.start("camera", start_camera)
 
 # Initialize model (and print information if it loads)
 try:
-    model_info = runner.init()
+    model_info = startup.result("model")
     print("Model name:", model_info['project']['name'])
     print("Model owner:", model_info['project']['owner'])
     
@@ -45,56 +131,92 @@ except Exception as e:
             runner.stop()
     sys.exit(1)
 
+# Send features through shared memory when the model offers it
+if backend != 'savedmodel':
+    transport = FeatureTransport(runner, model_info, shared_memory=use_shm)
+
 # Initial framerate value
 fps = 0
 
-# Start the camera
-camera = cv2.VideoCapture(device, cv2.CAP_V4L)
-camera.set(cv2.CAP_PROP_FRAME_WIDTH,res_width)
-camera.set(cv2.CAP_PROP_FRAME_HEIGHT,res_height)
-camera.set(cv2.CAP_PROP_MODE, 0) # CV_CAP_MODE_BGR
+# The camera, started alongside the model
+camera = startup.result("camera")
+
+# Rotation and the runner's resize/crop to the model input, compiled into one warp
+model_size = (model_info['model_parameters']['image_input_width'],
+              model_info['model_parameters']['image_input_height'])
+geometry = GeometryPlan(rotation, out_size=model_size)
+pack_features = PackedPixelFeatures.for_model(model_info)
+
+# The rotated full-size frame for the preview, in a buffer of its own to draw on
+preview_geometry = GeometryPlan(rotation, copy=True)
+
+# Results of frames seen before, looked up by their pixels
+cache = None
+if result_cache_mb:
+    cache = ResultCache(int(result_cache_mb * (1 << 20)), cache_quantize_bits)
 
 # Initial countdown timestamp
 countdown_timestamp = cv2.getTickCount()
 
+# Time every stage of the loop, and the frames
+timer = LoopTimer(timing_window)
+timer.frame()
+
+# Optionally serve counters and stage latencies for Prometheus to scrape
+metrics = None
+if metrics_port is not None:
+    metrics = Metrics()
+    metrics.add_capture(camera)
+    metrics.add_timer(timer)
+    metrics.counter("predictions_total", "Frames classified as each label",
+                    label="label")
+    metrics.counter("inference_errors_total", "Frames inference failed on")
+    metrics_server = MetricsServer(metrics, metrics_port)
+    metrics_server.start()
+    print("Metrics:", metrics_server.url)
 
 while(True):
     
         # Acquire frame and expand frame dimensions to have shape: [1, None, None, 3]
         # i.e. a single-column array, where each item in the column has the pixel RGB value
-        ret, frame = camera.read()
-
-        # rotate image
-        if rotation == 90:
-            attr = 'ROTATE_90_CLOCKWISE'
-        elif rotation == 180:
-            attr = 'ROTATE_180'
-        elif rotation == 270:
-            attr = 'ROTATE_90_COUNTERCLOCKWISE'
-
-        if rotation > 0:
-                frame = cv2.rotate(frame, getattr(cv2, attr))
-
-                                            
-        # Get timestamp for calculating actual framerate
-        timestamp = cv2.getTickCount()
-        
-        # Get Numpy array that represents the image
-        img = np.array(frame)
-        
-        # Convert image to RGB
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        
-        # Encapsulate raw image values into array for model input
-        features, cropped = runner.get_features_from_image(img)
+        with timer.stage("read"):
+            ret, frame = camera.read()
+        if not ret:
+            print("No more frames from:", device)
+            break
+
+        # Rotate and fit the frame to the model input in a single warp. The
+        # result is what the model sees.
+        with timer.stage("rotate"):
+            img = geometry.apply(frame)
         
-        # Perform inference
+        # Perform inference. The SavedModel takes the image itself; the runner
+        # takes raw pixel values packed into its input array.
         res = None
         try:
-            res = runner.classify(features)
+            if backend == 'savedmodel':
+                model, features = runner, img
+            else:
+                with timer.stage("features"):
+                    features = pack_features(img)
+                model = transport
+            misses = cache.misses if cache else 0
+            start_time = time.perf_counter()
+            if cache:
+                res = cache.classify(model, img, features)
+            else:
+                res = model.classify(features)
+            classify_time = time.perf_counter() - start_time
+            timer.add("classify", classify_time)
+
+            # Split the call against the model's own timing (not for cache hits)
+            if not cache or cache.misses != misses:
+                timer.runner_split(res, classify_time)
         except Exception as e:
             print("ERROR: Could not perform inference")
             print("Exception:", e)
+            if metrics is not None:
+                metrics.inc("inference_errors_total")
             
         # Display predictions and timing data
         print("-----")
@@ -106,39 +228,62 @@ while(True):
         
         # Find label with the highest probability
         max_label = max(results, key=results.get)
+        if metrics is not None:
+            metrics.inc("predictions_total", max_label)
         
-        # Draw max label on preview window
-        cv2.putText(img,
-                    max_label,
-                    (0, 12),
-                    cv2.FONT_HERSHEY_PLAIN,
-                    1,
-                    (255, 255, 255))
-                    
-        # Draw max probability on preview window
-        cv2.putText(img,
-                    str(round(results[max_label], 2)),
-                    (0, 24),
-                    cv2.FONT_HERSHEY_PLAIN,
-                    1,
-                    (255, 255, 255))
-
-        # Convert image to BGR
-        img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
-        
+        with timer.stage("draw"):
+            preview = preview_geometry.apply(frame)
+
+            # Draw max label on preview window
+            cv2.putText(preview,
+                        max_label,
+                        (0, 12),
+                        cv2.FONT_HERSHEY_PLAIN,
+                        1,
+                        (255, 255, 255))
+
+            # Draw max probability on preview window
+            cv2.putText(preview,
+                        str(round(results[max_label], 2)),
+                        (0, 24),
+                        cv2.FONT_HERSHEY_PLAIN,
+                        1,
+                        (255, 255, 255))
+
         # Show the frame
-        cv2.imshow("Frame", img)
+        if show_preview:
+            with timer.stage("show"):
+                cv2.imshow("Frame", preview)
+                key = cv2.waitKey(1)
+        
+        # Report where the time to the first result went
+        if not startup.marks:
+            startup.mark("first result")
+            print("Startup:")
+            print(startup.report())
         
         
-        # Calculate framrate
-        frame_time = (cv2.getTickCount() - timestamp) / cv2.getTickFrequency()
-        fps = 1 / frame_time
+        # Frames per second by the wall clock, capture and display included
+        timer.frame()
+        fps = timer.fps
         
         # Press 'q' to quit
-        if cv2.waitKey(1) == ord('q'):
+        if show_preview and key == ord('q'):
             break
 
 camera.release()
+print("Frames captured:", camera.captured,
+      "dropped:", camera.dropped,
+      "reused:", camera.reused)
+if cache:
+    print("Result cache", cache.stats())
+print("Timing:")
+print(timer.report())
+if timing_dump:
+    timer.dump(timing_dump)
         
 # Clean up
-cv2.destroyAllWindows()
\ No newline at end of file
+if metrics is not None:
+    metrics_server.stop()
+if show_preview:
+    cv2.destroyAllWindows()
\ No newline at end of file
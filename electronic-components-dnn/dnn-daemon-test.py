@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""
+Raspberry Pi DNN Inference Daemon Test
+
+Starts an inference daemon for a model and compares it with starting the model
+in the script: how long a cold start takes against attaching to the daemon,
+whether predictions through the daemon (JSON and shared memory) match the
+model's own, and what a classify round trip costs each way. Then several
+clients classify at the same time through the one served model. By default it
+runs against the stand-in runner in usb_pipeline/, so no trained model is
+needed; point model_file at a .eim to test a real model.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import os, sys, time, signal, subprocess, tempfile, threading
+import numpy as np
+from edge_impulse_linux.runner import ImpulseRunner
+
+# Shared helpers live in usb_pipeline/ at the top of the repository
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from usb_pipeline.daemon import DaemonClient
+from usb_pipeline.transport import FeatureTransport
+
+# Settings
+model_file = "../usb_pipeline/standin_runner.py" # Model (.eim) or stand-in runner
+iterations = 200                        # Classify calls per measurement
+clients = 3                             # Clients sharing the model at once
+
+# Print something to the console
+print()
+print("---Inference Daemon Test---")
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+model_path = os.path.join(dir_path, model_file)
+socket_path = os.path.join(tempfile.mkdtemp(), "inference.sock")
+
+def round_trip(transport, samples):
+    start_time = time.perf_counter()
+    for i in range(iterations):
+        transport.classify(samples[i % len(samples)])
+    return (time.perf_counter() - start_time) / iterations
+
+# Cold start in the script, as the live scripts do without a daemon
+start_time = time.perf_counter()
+runner = ImpulseRunner(model_path)
+model_info = runner.init()
+print("Model name:", model_info['project']['name'])
+print("Cold start:", round((time.perf_counter() - start_time) * 1000, 1), "ms")
+count = model_info['model_parameters']['input_features_count']
+rng = np.random.default_rng(0)
+samples = [(rng.integers(0, 256, count) / 255).astype(np.float32)
+           for _ in range(10)]
+direct = FeatureTransport(runner, model_info)
+expected = [direct.classify(features)['result'] for features in samples]
+direct_time = round_trip(direct, samples)
+direct.close()
+runner.stop()
+
+# The daemon, in a process of its own like inference-daemon_usb.py
+serve = """
+import sys
+sys.path.insert(0, sys.argv[1])
+from usb_pipeline.daemon import InferenceDaemon
+daemon = InferenceDaemon(sys.argv[2], [sys.argv[3]])
+print(round(daemon.start()[0] * 1000, 1), flush=True)
+try:
+    daemon.serve_forever()
+except KeyboardInterrupt:
+    pass
+daemon.stop()
+"""
+daemon = subprocess.Popen([sys.executable, "-c", serve, os.path.join(dir_path, ".."),
+                           socket_path, model_path], stdout=subprocess.PIPE, text=True)
+print("Daemon start:", daemon.stdout.readline().strip(), "ms")
+try:
+    start_time = time.perf_counter()
+    client = DaemonClient(socket_path, model_path)
+    client_info = client.init()
+    print("Attach:", round((time.perf_counter() - start_time) * 1000, 2), "ms")
+
+    json_client = DaemonClient(socket_path, model_path, shared_memory=False)
+    json_transport = FeatureTransport(json_client, json_client.init(),
+                                      shared_memory=False)
+    shm_transport = FeatureTransport(client, client_info)
+    assert json_transport.mode == 'json' and shm_transport.mode == 'sdk-shm'
+    for name, transport in (("JSON", json_transport), ("Shared memory", shm_transport)):
+        actual = [transport.classify(features)['result'] for features in samples]
+        assert actual == expected, name + " predictions differ"
+    print("Predictions match:", len(samples), "samples")
+    print("Direct:", round(direct_time * 1000, 3), "ms per classify")
+    print("Daemon, JSON:", round(round_trip(json_transport, samples) * 1000, 3),
+          "ms per classify")
+    print("Daemon, shared memory:", round(round_trip(shm_transport, samples) * 1000, 3),
+          "ms per classify")
+    shm_transport.close()
+    json_client.stop()
+    client.stop()
+
+    # A second hello may hand out a new features block; the transport the
+    # script made on top keeps working
+    client = DaemonClient(socket_path, model_path)
+    transport = FeatureTransport(client, client.init())
+    client.hello(model_path)
+    actual = [transport.classify(features)['result'] for features in samples]
+    assert actual == expected, "predictions differ after a second hello"
+    print("Second hello: predictions match")
+    transport.close()
+    client.stop()
+
+    # Several clients at once, each with its own features block
+    errors = []
+
+    def classify_all(n):
+        client = DaemonClient(socket_path, model_path)
+        transport = FeatureTransport(client, client.init())
+        for i in range(iterations):
+            res = transport.classify(samples[(i + n) % len(samples)])
+            if res['result'] != expected[(i + n) % len(samples)]:
+                errors.append(n)
+        transport.close()
+        client.stop()
+
+    threads = [threading.Thread(target=classify_all, args=(n,))
+               for n in range(clients)]
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed_time = time.perf_counter() - start_time
+    assert not errors, "wrong predictions for clients " + str(sorted(set(errors)))
+    print(clients, "clients:", clients * iterations, "requests in",
+          round(elapsed_time, 2), "s, all correct")
+finally:
+    daemon.send_signal(signal.SIGINT)
+    daemon.wait()
+print()
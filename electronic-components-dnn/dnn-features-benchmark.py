@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+DNN Feature Extraction Benchmark
+
+Times the per-frame cost of turning a camera frame into DNN features, the way
+dnn-live-inference-pi-cam_usb.py used to do it (copy, crop, resize, grayscale,
+float64 division, list) against the fused GrayscaleFeatures extractor, and
+checks that both produce the same numbers. No model or camera is needed.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import os, sys, time
+import cv2
+import numpy as np
+
+# Shared helpers live in usb_pipeline/ at the top of the repository
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from usb_pipeline.features import GrayscaleFeatures
+
+# Settings
+image_file = "48.bmp"                   # Test frame (96x96 BGR)
+res_width = 96                          # Crop width
+res_height = 96                         # Crop height
+img_width = 28                          # Resize width to this for inference
+img_height = 28                         # Resize height to this for inference
+iterations = 10000                      # Frames to time each path with
+tolerance = 1e-6                        # Largest feature difference allowed (float32 rounding)
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+frame = cv2.imread(os.path.join(dir_path, image_file), cv2.IMREAD_COLOR)
+
+
+def old_features(frame):
+    """
+    Feature extraction as in the original live script
+    """
+    img = np.array(frame)
+    center = img.shape
+    x = int(center[1]/2 - res_width/2)
+    y = int(center[0]/2 - res_height/2)
+    img = img[y:y+res_height, x:x+res_width]
+    img_resize = cv2.resize(img, (img_width, img_height))
+    img_resize = cv2.cvtColor(img_resize, cv2.COLOR_BGR2GRAY)
+    features = np.reshape(img_resize, (img_width * img_height)) / 255
+    return features.tolist()
+
+
+def time_per_frame(function):
+    """
+    Returns the mean time per call in microseconds, after a short warm-up
+    """
+    for _ in range(100):
+        function(frame)
+    start_time = time.perf_counter()
+    for _ in range(iterations):
+        function(frame)
+    return (time.perf_counter() - start_time) / iterations * 1e6
+
+
+extract_features = GrayscaleFeatures(img_width, img_height, res_width, res_height)
+
+print()
+print("---DNN Feature Extraction Benchmark---")
+print("Frame:", frame.shape, "->", img_width * img_height, "features")
+
+old_us = time_per_frame(old_features)
+fused_us = time_per_frame(extract_features)
+fused_list_us = time_per_frame(lambda f: extract_features(f).tolist())
+print("Original path:       ", round(old_us, 1), "us/frame")
+print("Fused:               ", round(fused_us, 1), "us/frame",
+      "(" + str(round(old_us / fused_us, 1)) + "x)")
+print("Fused + list:        ", round(fused_list_us, 1), "us/frame",
+      "(" + str(round(old_us / fused_list_us, 1)) + "x)")
+
+# Both paths must give the model the same input
+difference = np.max(np.abs(np.array(old_features(frame)) - extract_features(frame)))
+print("Max difference:      ", difference)
+assert difference <= tolerance, "features differ by " + str(difference)
+print()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""
+Raspberry Pi DNN Feature Transport Test
+
+Sends the same feature vectors to a model over the JSON protocol and through
+shared memory, checks that both give the same predictions, and prints how long
+a classify round trip takes with each. By default it runs against the stand-in
+runner in usb_pipeline/, so no trained model is needed; point model_file at a
+.eim to test a real model.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import os, sys, time
+import numpy as np
+from edge_impulse_linux.runner import ImpulseRunner
+
+# Shared helpers live in usb_pipeline/ at the top of the repository
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from usb_pipeline.transport import FeatureTransport
+
+# Settings
+model_file = "../usb_pipeline/standin_runner.py" # Model (.eim) or stand-in runner
+iterations = 200                        # Classify calls per transport
+
+# Print something to the console
+print()
+print("---Feature Transport Test---")
+
+# The ImpulseRunner module will attempt to load files relative to its location,
+# so we make it load files relative to this program instead
+dir_path = os.path.dirname(os.path.realpath(__file__))
+model_path = os.path.join(dir_path, model_file)
+
+# Load the model file. Newer SDKs use shared memory on their own unless told
+# not to, which would hide the JSON path we want to compare against.
+try:
+    runner = ImpulseRunner(model_path, allow_shm=False)
+except TypeError:
+    runner = ImpulseRunner(model_path)
+
+try:
+
+    # Print model information
+    model_info = runner.init()
+    print("Model name:", model_info['project']['name'])
+    print("Model owner:", model_info['project']['owner'])
+    count = model_info['model_parameters']['input_features_count']
+
+    json_transport = FeatureTransport(runner, model_info, shared_memory=False)
+    shm_transport = FeatureTransport(runner, model_info)
+    print("Shared memory offered:", shm_transport.mode == 'shm')
+
+    # Random grayscale features, the same for both transports
+    rng = np.random.default_rng(0)
+    samples = [(rng.integers(0, 256, count) / 255).astype(np.float32)
+               for _ in range(10)]
+
+    # Both transports must give identical predictions
+    for features in samples:
+        expected = json_transport.classify(features)['result']
+        actual = shm_transport.classify(features)['result']
+        assert actual == expected, (actual, expected)
+    print("Predictions match:", len(samples), "samples")
+
+    # Time a classify round trip with each transport
+    for name, transport in (("JSON", json_transport), ("Shared memory", shm_transport)):
+        start_time = time.perf_counter()
+        for i in range(iterations):
+            transport.classify(samples[i % len(samples)])
+        elapsed_time = (time.perf_counter() - start_time) / iterations
+        print(name + ":", round(elapsed_time * 1000, 3), "ms per classify")
+
+    shm_transport.close()
+
+finally:
+    if (runner):
+        runner.stop()
+    print()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""
+Int8 Detection Model Input Parity Test
+
+Runs the int8 quantized TFLite detection model over the images in image_set/
+twice: once with the uint8 pixels written straight into the model's quantized
+input tensor, and once through the float path (pixels scaled to 0..1 and then
+quantized). Checks that both give the same outputs within the quantization
+tolerance and prints how long preparing the input takes with each.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import os, sys, time, glob
+import cv2
+import numpy as np
+
+# Shared helpers live in usb_pipeline/ at the top of the repository
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from usb_pipeline.geometry import GeometryPlan
+from usb_pipeline.tflite import QuantizedImageInput, load_interpreter
+
+# Settings
+model_file = "ei-electronic-components-object-detection-object-detection-tensorflow-lite-int8-quantized-model.lite"
+image_dir = "image_set"                  # Folder of test images
+tolerance = 1                            # Largest allowed output difference (quantization steps)
+iterations = 200                         # Input conversions to time per path
+
+# Print something to the console
+print()
+print("---Int8 Input Parity Test---")
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+interpreter = load_interpreter(os.path.join(dir_path, model_file))
+model_input = QuantizedImageInput(interpreter)
+output_index = interpreter.get_output_details()[0]['index']
+print("Input:", model_input.dtype.__name__, (model_input.width, model_input.height),
+      "scale:", model_input.scale, "zero point:", model_input.zero_point)
+
+# Fit every image to the model input the way the live script does
+geometry = GeometryPlan(0, out_size=(model_input.width, model_input.height))
+names = sorted(glob.glob(os.path.join(dir_path, image_dir, "*.png")))
+images = [geometry.apply(cv2.imread(name)).copy() for name in names]
+
+# Both input paths must give the same model output
+worst = 0
+for name, img in zip(names, images):
+    model_input(img)
+    interpreter.invoke()
+    native = interpreter.get_tensor(output_index).astype(np.int32)
+
+    model_input.set_float(img)
+    interpreter.invoke()
+    reference = interpreter.get_tensor(output_index).astype(np.int32)
+
+    difference = int(np.abs(native - reference).max())
+    worst = max(worst, difference)
+    assert difference <= tolerance, (os.path.basename(name), difference)
+print("Outputs match:", len(images), "images, largest difference:", worst)
+
+# Time preparing the input with each path
+for label, prepare in (("Native uint8", model_input), ("Float", model_input.set_float)):
+    start_time = time.perf_counter()
+    for i in range(iterations):
+        prepare(images[i % len(images)])
+    elapsed_time = (time.perf_counter() - start_time) / iterations
+    print(label + ":", round(elapsed_time * 1000, 3), "ms per frame")
+print()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""
+Object Detection Tracker Test
+
+Simulates components moving across a 320x320 frame at camera rate and a
+detector that only runs at inference_rate, with some position noise and the
+odd missed detection. Boxes shown on every frame come either from holding the
+last detections (as the live script does without tracking) or from the
+tracker, and the test prints the mean distance from the true box centres for
+both and how many times an object changed track ID. The tracker must be
+closer and keep the IDs.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import os, sys
+import numpy as np
+
+# Shared helpers live in usb_pipeline/ at the top of the repository
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from usb_pipeline.tracker import BoxTracker
+
+# Settings
+camera_fps = 30                         # Frames per second shown
+inference_rate = 4                      # Detections per second
+seconds = 20                            # Length of the simulation
+objects = 4                             # Components moving in the frame
+box_size = 32                           # Width and height of their boxes (pixels)
+speed = 40                              # Largest speed (pixels per second)
+noise = 2.0                             # Standard deviation of detected positions (pixels)
+miss_rate = 0.1                         # Share of detections the detector misses
+max_switches = 2                        # Most track ID changes allowed
+
+# Print something to the console
+print()
+print("---Tracker Test---")
+
+rng = np.random.default_rng(0)
+start = rng.uniform(40, 280 - box_size, (objects, 2))
+velocity = rng.uniform(-speed, speed, (objects, 2))
+labels = [str(i % 3) for i in range(objects)]
+
+def positions(t):
+    """
+    True top-left corners at time t, bouncing off the frame edges
+    """
+    span = 320 - box_size
+    p = np.abs((start + velocity * t) % (2 * span))
+    return np.where(p > span, 2 * span - p, p)
+
+def nearest(boxes, center):
+    """
+    Distance from center to the nearest box centre, and that box
+    """
+    best = (None, None)
+    for bbox in boxes:
+        c = (bbox['x'] + bbox['width'] / 2, bbox['y'] + bbox['height'] / 2)
+        distance = np.hypot(c[0] - center[0], c[1] - center[1])
+        if best[0] is None or distance < best[0]:
+            best = (distance, bbox)
+    return best
+
+tracker = BoxTracker()
+held = []
+errors = {"Hold last": [], "Tracker": []}
+ids = [None] * objects
+switches = 0
+frames = seconds * camera_fps
+every = camera_fps // inference_rate
+for n in range(frames):
+    t = n / camera_fps
+    truth = positions(t)
+
+    # The detector runs on every few frames
+    if n % every == 0:
+        detections = []
+        for i, (x, y) in enumerate(truth):
+            if rng.random() < miss_rate:
+                continue
+            x, y = np.array([x, y]) + rng.normal(0, noise, 2)
+            detections.append({'label': labels[i], 'value': 0.9,
+                               'x': int(x), 'y': int(y),
+                               'width': box_size, 'height': box_size})
+        held = detections
+        tracked = tracker.update(detections, t)
+    else:
+        tracked = tracker.boxes(t)
+
+    # Skip the first second while the tracks learn their velocity
+    if t < 1:
+        continue
+    for i, (x, y) in enumerate(truth):
+        center = (x + box_size / 2, y + box_size / 2)
+        for name, boxes in (("Hold last", held), ("Tracker", tracked)):
+            distance, bbox = nearest(boxes, center)
+            if distance is not None:
+                errors[name].append(distance)
+            if name == "Tracker" and bbox is not None and distance < box_size / 2:
+                if ids[i] is not None and bbox['id'] != ids[i]:
+                    switches += 1
+                ids[i] = bbox['id']
+
+for name, distances in errors.items():
+    print(name + ": mean centre error", round(float(np.mean(distances)), 2), "pixels")
+print("Tracks started:", tracker.next_id - 1, "for", objects, "objects,",
+      "ID switches:", switches)
+assert np.mean(errors["Tracker"]) < np.mean(errors["Hold last"])
+assert switches <= max_switches, switches
+print()
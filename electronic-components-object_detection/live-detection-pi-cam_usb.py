@@ -3,8 +3,19 @@
 Live Object Detection (USB version by Antonio)
 
 Detects objects in continuous stream of images from Pi Camera. Use Edge Impulse
-Runner and downloaded .eim model file to perform inference. Bounding box info is
-drawn on top of detected objects along with framerate (FPS) in top-left corner.
+Runner and downloaded .eim model file to perform inference, or run the int8
+TFLite model (.lite) inside this process (backend = 'tflite'). Bounding box info
+is drawn on top of detected objects along with framerate (FPS) in top-left
+corner. With a latency_budget, inference is skipped on frames that would be
+shown too late; they are shown with the last boxes instead, and the inference
+rate and latency percentiles are printed on exit. With tracking = True boxes
+are tracked between inference frames, so the model can run at a few Hz
+(inference_rate) while boxes, with stable IDs, move on every frame. The model
+and the camera start up at the same time, and a breakdown of the start-up time
+is printed with the first result. Every stage of the loop is timed, and the
+FPS shown is the wall-clock throughput; the stage latency percentiles are
+printed on exit. With metrics_port set, frame counters, detections per label
+and stage latencies are served for Prometheus to scrape.
 
 Author: EdgeImpulse, Inc.
 Date: July 5, 2021
@@ -16,14 +27,48 @@ import cv2
 import numpy as np
 from edge_impulse_linux.image import ImageImpulseRunner
 
+# Shared helpers live in usb_pipeline/ at the top of the repository
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from usb_pipeline.capture import MjpegCamera, ThreadedCapture
+from usb_pipeline.daemon import DaemonClient
+from usb_pipeline.features import PackedPixelFeatures
+from usb_pipeline.geometry import GeometryPlan
+from usb_pipeline.metrics import Metrics, MetricsServer
+from usb_pipeline.scheduler import FrameScheduler
+from usb_pipeline.sources import open_source
+from usb_pipeline.startup import ConcurrentStartup
+from usb_pipeline.timing import LoopTimer
+from usb_pipeline.tflite import TFLiteDetector
+from usb_pipeline.tracker import BoxTracker
+from usb_pipeline.transport import FeatureTransport
+
 # Settings
-device = '/dev/video0'                   # Linux video device
+device = '/dev/video0'                   # Linux video device, image folder, .zip, video or 'synthetic'
+backend = 'eim'                          # 'eim' (Edge Impulse runner) or 'tflite' (in-process)
 model_file = "modelfile.eim"             # Trained ML model from Edge Impulse
+lite_file = "ei-electronic-components-object-detection-object-detection-tensorflow-lite-int8-quantized-model.lite"
+lite_labels = None                       # Object labels of the .lite model in training order (None = class numbers)
+num_threads = None                       # CPU threads for the .lite model (None = one per core)
 cam_width = 640                          # Width of frame (pixels)
 cam_height = 480                         # Height of frame (pixels)
 res_width = 320                          # Resolution of camera (width)
 res_height = 320                         # Resolution of camera (height)
 rotation = 0                             # Camera rotation (0, 90, 180, or 270)
+capture_slots = 3                        # Frames in the capture ring buffer
+mjpeg = False                            # Capture MJPEG and decode it in Python
+decode_scale = 1                         # Decode MJPEG at 1/1, 1/2, 1/4 or 1/8 scale
+source_fps = None                        # Pace files/synthetic frames (None = as fast as possible)
+source_loop = True                       # Start image folders, zips and videos over at the end
+show_preview = True                      # Set to False to run headless
+use_shm = True                           # Send features via shared memory if the model supports it
+daemon_socket = None                     # Attach to the inference daemon on this socket instead of starting the model
+latency_budget = None                    # Target capture-to-display latency in seconds (None = infer every frame)
+latency_percentile = 0.9                 # Share of frames to show within the budget
+tracking = False                         # Track boxes between inference frames and give them IDs
+inference_rate = None                    # Run inference at most this many times per second (None = every frame)
+timing_window = 1000                     # Recent frames the stage percentiles and FPS are taken over
+timing_dump = None                       # Write the stage timings to this JSON file on exit
+metrics_port = None                      # Serve Prometheus metrics on http://localhost:<port>/metrics (None = off)
 
 # The ImpulseRunner module will attempt to load files relative to its location,
 # so we make it load files relative to this program instead
@@ -31,11 +76,63 @@ dir_path = os.path.dirname(os.path.realpath(__file__))
 model_path = os.path.join(dir_path, model_file)
 
 # Load the model file
-runner = ImageImpulseRunner(model_path)
+if backend == 'tflite':
+    runner = TFLiteDetector(os.path.join(dir_path, lite_file),
+                            labels=lite_labels, num_threads=num_threads)
+elif daemon_socket is not None:
+    runner = DaemonClient(daemon_socket, model_path, shared_memory=use_shm)
+else:
+    runner = ImageImpulseRunner(model_path)
+
+# Start the model and the camera at the same time, as both can take seconds
+startup = ConcurrentStartup()
+
+def start_model():
+    """
+    Initializes the model and runs one inference, so the first frame doesn't
+    pay for the warm-up
+    """
+    with startup.phase("model init"):
+        model_info = runner.init()
+    with startup.phase("model warm-up"):
+        params = model_info['model_parameters']
+        if backend == 'tflite':
+            runner.classify(np.zeros((params['image_input_height'],
+                                      params['image_input_width'], 3), dtype=np.uint8))
+        else:
+            runner.classify([0] * params['input_features_count'])
+    return model_info
+
+def start_camera():
+    """
+    Opens the camera (or other frame source, see usb_pipeline/sources.py),
+    sets its format and waits for the first frame
+    """
+    with startup.phase("camera open"):
+        camera = open_source(device, cam_width, cam_height, fps=source_fps,
+                             loop=source_loop)
+
+        # Optionally take MJPEG from the camera and only keep the region the model sees
+        if mjpeg:
+            if rotation in (0, 180):
+                decode_roi = (res_width, res_height)
+            else:
+                decode_roi = (res_height, res_width)
+            camera = MjpegCamera(camera, scale=decode_scale, roi=decode_roi)
+            print("Camera pixel format:", camera.fourcc())
+
+    # Read frames in a background thread so capture overlaps with inference
+    camera = ThreadedCapture(camera, num_slots=capture_slots)
+    with startup.phase("first frame"):
+        camera.wait_first_frame()
+    return camera
+
+startup.start("model", start_model)
+startup.start("camera", start_camera)
 
 # Initialize model (and print information if it loads)
 try:
-    model_info = runner.init()
+    model_info = startup.result("model")
     print("Model name:", model_info['project']['name'])
     print("Model owner:", model_info['project']['owner'])
     
@@ -47,69 +144,133 @@ except Exception as e:
             runner.stop()
     sys.exit(1)
 
+# Send features through shared memory when the model offers it
+if backend != 'tflite':
+    transport = FeatureTransport(runner, model_info, shared_memory=use_shm)
+
 # Initial framerate value
 fps = 0
 
+# The camera, started alongside the model
+camera = startup.result("camera")
+
+# Rotation and the runner's resize/crop to the model input, compiled into one warp
+model_size = (model_info['model_parameters']['image_input_width'],
+              model_info['model_parameters']['image_input_height'])
+# MJPEG frames are decoded at 1/decode_scale, so the crop is that much
+# smaller and gets scaled back up to the model input
+crop_scale = decode_scale if mjpeg else 1
+crop_size = (res_width // crop_scale, res_height // crop_scale)
+geometry = GeometryPlan(rotation, crop_size, out_size=model_size, copy=True)
+pack_features = PackedPixelFeatures.for_model(model_info)
 
-# Start the camera
-camera = cv2.VideoCapture(device, cv2.CAP_V4L)
-camera.set(cv2.CAP_PROP_FRAME_WIDTH,cam_width)
-camera.set(cv2.CAP_PROP_FRAME_HEIGHT,cam_height)
-camera.set(cv2.CAP_PROP_MODE, 0) # CV_CAP_MODE_BGR
+# Decide which frames to run inference on from the measured inference time
+scheduler = None
+if latency_budget is not None:
+    scheduler = FrameScheduler(latency_budget, percentile=latency_percentile)
+res = None
+inference_at = None
+
+# Boxes of the last successful inference, drawn until the next one succeeds
+bboxes = []
+
+# Carry boxes from inference frames over to the frames in between
+tracker = BoxTracker() if tracking else None
 
 # Initial countdown timestamp
 countdown_timestamp = cv2.getTickCount()
 
+# Time every stage of the loop, and the frames
+timer = LoopTimer(timing_window)
+timer.frame()
+
+# Optionally serve counters and stage latencies for Prometheus to scrape
+metrics = None
+if metrics_port is not None:
+    metrics = Metrics()
+    metrics.add_capture(camera)
+    metrics.add_timer(timer)
+    metrics.counter("inferences_total", "Frames inference ran on")
+    metrics.counter("detections_total", "Objects detected of each label",
+                    label="label")
+    metrics.counter("inference_errors_total", "Frames inference failed on")
+    metrics_server = MetricsServer(metrics, metrics_port)
+    metrics_server.start()
+    print("Metrics:", metrics_server.url)
 
 while(True):
     
         # Acquire frame and expand frame dimensions to have shape: [1, None, None, 3]
         # i.e. a single-column array, where each item in the column has the pixel RGB value
-        ret, frame = camera.read()
-
-        # rotate image
-        if rotation == 90:
-            attr = 'ROTATE_90_CLOCKWISE'
-        elif rotation == 180:
-            attr = 'ROTATE_180'
-        elif rotation == 270:
-            attr = 'ROTATE_90_COUNTERCLOCKWISE'
-
-        if rotation > 0:
-                frame = cv2.rotate(frame, getattr(cv2, attr))
-
-                                            
-        # Get timestamp for calculating actual framerate
-        timestamp = cv2.getTickCount()
-        
-        # Get Numpy array that represents the image
-        img = np.array(frame)
-
-        # Crop image
-
-        center = img.shape
-        x = int(center[1]/2 - res_width/2)
-        y = int(center[0]/2 - res_height/2)
+        with timer.stage("read"):
+            ret, frame = camera.read()
+        if not ret:
+            print("No more frames from:", device)
+            break
 
-        img = img[y:y+res_height, x:x+res_width]
+        # Rotate, crop and fit the frame to the model input in a single warp.
+        # Bounding boxes come back in this image's coordinates. It is the
+        # plan's own buffer, never a view of the capture ring slot, so the
+        # boxes drawn on it don't reach the model if the frame is reused.
+        with timer.stage("rotate"):
+            img = geometry.apply(frame)
         
-        # Convert to RGB and encapsulate raw values into array for model input
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        features, cropped = runner.get_features_from_image(img_rgb)
-        
-        # Perform inference
-        res = None
-        try:
-            res = runner.classify(features)
-        except Exception as e:
-            print("ERROR: Could not perform inference")
-            print("Exception:", e)
+        # Perform inference, unless the scheduler skips this frame to hold the
+        # latency budget or inference_rate says it's too soon (it is then
+        # shown with the last result, or the tracked boxes). The in-process
+        # model takes the image itself; the runner takes raw pixel values
+        # packed into its input array.
+        captured_at = camera.frame_time
+        infer = scheduler is None or scheduler.should_infer(captured_at) or res is None
+        if inference_rate is not None and inference_at is not None and \
+                captured_at - inference_at < 1 / inference_rate:
+            infer = res is None
+        if infer:
+            inference_start = time.perf_counter()
+            res = None
+            try:
+                if backend == 'tflite':
+                    features = img
+                else:
+                    with timer.stage("features"):
+                        features = pack_features(img)
+                classify_start = time.perf_counter()
+                if backend == 'tflite':
+                    res = runner.classify(features)
+                else:
+                    res = transport.classify(features)
+                classify_time = time.perf_counter() - classify_start
+                timer.add("classify", classify_time)
+                timer.runner_split(res, classify_time)
+            except Exception as e:
+                print("ERROR: Could not perform inference")
+                print("Exception:", e)
+                if metrics is not None:
+                    metrics.inc("inference_errors_total")
+            if scheduler is not None:
+                scheduler.record_inference(time.perf_counter() - inference_start)
             
-        # Display predictions and timing data
-        print("Output:", res)
+            # Display predictions and timing data
+            print("Output:", res)
+            inference_at = captured_at
+            if metrics is not None and res is not None:
+                metrics.inc("inferences_total")
+                for bbox in res['result']['bounding_boxes']:
+                    metrics.inc("detections_total", bbox['label'])
+            if tracker is not None and res is not None:
+                with timer.stage("track"):
+                    tracker.update(res['result']['bounding_boxes'], captured_at)
         
-        # Go through each of the returned bounding boxes
-        bboxes = res['result']['bounding_boxes']
+        # Go through each of the returned bounding boxes, or the tracked boxes
+        # predicted to this frame
+        draw_start = time.perf_counter()
+        if tracker is not None:
+            bboxes = tracker.boxes(captured_at)
+            print("Tracks:", ", ".join(str(bbox['id']) + " " + bbox['label'] +
+                                       " x:" + str(bbox['x']) + " y:" + str(bbox['y'])
+                                       for bbox in bboxes))
+        elif res is not None:
+            bboxes = res['result']['bounding_boxes']
         for bbox in bboxes:
         
             # Calculate corners of bounding box so we can draw it
@@ -125,9 +286,12 @@ while(True):
                             (255, 255, 255),
                             1)
                             
-            # Draw object and score in bounding box corner
+            # Draw object and score (and track ID) in bounding box corner
+            text = bbox['label'] + ": " + str(round(bbox['value'], 2))
+            if 'id' in bbox:
+                text = str(bbox['id']) + " " + text
             cv2.putText(img,
-                        bbox['label'] + ": " + str(round(bbox['value'], 2)),
+                        text,
                         (b_x0, b_y0 + 12),
                         cv2.FONT_HERSHEY_PLAIN,
                         1,
@@ -140,20 +304,44 @@ while(True):
                     cv2.FONT_HERSHEY_PLAIN,
                     1,
                     (255, 255, 255))
+        timer.add("draw", time.perf_counter() - draw_start)
         
         # Show the frame
-        cv2.imshow("Frame", img)
+        if show_preview:
+            with timer.stage("show"):
+                cv2.imshow("Frame", img)
+                key = cv2.waitKey(1)
+        if scheduler is not None:
+            scheduler.shown(captured_at)
+
+        # Report where the time to the first result went
+        if not startup.marks:
+            startup.mark("first result")
+            print("Startup:")
+            print(startup.report())
 
         
-        # Calculate framrate
-        frame_time = (cv2.getTickCount() - timestamp) / cv2.getTickFrequency()
-        fps = 1 / frame_time
+        # Frames per second by the wall clock, capture and display included
+        timer.frame()
+        fps = timer.fps
         
         # Press 'q' to quit
-        if cv2.waitKey(1) == ord('q'):
+        if show_preview and key == ord('q'):
             break
 
 camera.release()
+print("Frames captured:", camera.captured,
+      "dropped:", camera.dropped,
+      "reused:", camera.reused)
+if scheduler is not None:
+    print("Scheduler", scheduler.report())
+print("Timing:")
+print(timer.report())
+if timing_dump:
+    timer.dump(timing_dump)
         
 # Clean up
-cv2.destroyAllWindows()
+if metrics is not None:
+    metrics_server.stop()
+if show_preview:
+    cv2.destroyAllWindows()
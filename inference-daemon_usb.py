@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+"""
+Inference Daemon (USB version by Antonio)
+
+Starts the .eim models once, warms them up and serves them on a Unix socket
+to the live scripts, so they don't each start (and keep) a copy of the model.
+Set daemon_socket in a live script to the socket below to attach it; several
+scripts may share a model. Press Ctrl+C to stop the daemon.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import os, sys, time
+
+# Shared helpers live in usb_pipeline/ at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+from usb_pipeline.daemon import InferenceDaemon
+
+# Settings
+socket_path = "/tmp/ei-inference.sock" # Unix socket the live scripts attach to
+model_files = [                        # Models to serve (.eim), relative to this program
+    "electronic-components-dnn/modelfile.eim",
+    "electronic-components-cnn/modelfile.eim",
+    "electronic-components-object_detection/modelfile.eim",
+]
+use_shm = True                         # Send features to the models via shared memory if they support it
+
+# Load models relative to this program, like the live scripts do
+dir_path = os.path.dirname(os.path.realpath(__file__))
+model_paths = [os.path.join(dir_path, model_file) for model_file in model_files]
+
+# Start and warm up every model
+daemon = InferenceDaemon(socket_path, model_paths, shared_memory=use_shm)
+try:
+    start_times = daemon.start()
+except Exception as e:
+    print("ERROR: Could not start models")
+    print("Exception:", e)
+    daemon.stop()
+    sys.exit(1)
+for model_file, model, start_time in zip(model_files, daemon.models, start_times):
+    print("Model name:", model.model_info['project']['name'],
+          "(" + model_file + ") started in", round(start_time, 2), "s")
+print("Serving on:", socket_path)
+
+try:
+    daemon.serve_forever()
+except KeyboardInterrupt:
+    pass
+
+# Clean up
+print(daemon.stats())
+daemon.stop()
@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+"""
+Pipeline Benchmark
+
+Measures the throughput of the DNN, CNN, object detection and sliding window
+pipelines reproducibly, without a camera or a screen. Each pipeline runs its
+live script's own preprocessing and inference code (usb_pipeline/) over
+stored images: electronic-components-object_detection/image_set/ for DNN,
+detection and sliding window, and the CNN dataset in
+electronic-components-png.zip for the CNN. Images are decoded up front, so
+file I/O and PNG decode are not measured.
+
+Each pipeline runs in a process of its own, pinned to cpu_affinity (the model
+processes and threads it starts inherit the pinning). It runs warmup frames
+first, then times iterations frames stage by stage. The report (throughput,
+frame and stage latency percentiles, and peak RSS of the pipeline and of
+any model process) is printed and written to report_file as JSON.
+
+If baseline_file exists, the run is compared with it: the benchmark exits
+with status 1 when any pipeline's throughput drops, or its p95 frame
+latency rises, by more than max_regression. The first run (or a run with
+update_baseline = True) stores its report as the baseline. Baselines only
+compare runs on the same machine.
+
+.eim models default to the stand-in runner in usb_pipeline/, so this runs
+without trained models; point the *_model settings at real .eim files to
+measure them.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import json, os, platform, subprocess, sys, time
+
+# Shared helpers live in usb_pipeline/ at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+from usb_pipeline.benchmark import child_pids, peak_rss_kb, pin_cpus, regressions
+
+# Settings
+pipelines = ['dnn', 'cnn', 'detection', 'sliding'] # Pipelines to run
+image_set = "electronic-components-object_detection/image_set" # Images for DNN, detection and sliding window
+cnn_dataset = "electronic-components-cnn/electronic-components-png.zip" # Images for the CNN
+warmup = 10                             # Frames run before timing starts
+iterations = 200                        # Frames timed per pipeline
+cpu_affinity = [0]                      # CPUs to pin the pipelines to (None = no pinning)
+report_file = "pipeline-benchmark.json" # JSON report of this run
+baseline_file = "pipeline-benchmark-baseline.json" # Report to compare with
+update_baseline = False                 # Store this run as the baseline
+max_regression = 0.1                    # Fail on a throughput drop or p95 latency rise beyond this share
+use_shm = True                          # Send features via shared memory if the model supports it
+dnn_model = "usb_pipeline/standin_runner.py" # DNN model (.eim)
+cnn_backend = 'savedmodel'              # 'eim' or 'savedmodel' (in-process)
+cnn_model = "usb_pipeline/standin_runner.py" # CNN model (.eim)
+cnn_savedmodel = "electronic-components-cnn/ei-electronic-components-cnn-nn-classifier-tensorflow-savedmodel-model-v2.zip"
+cnn_labels = ['background', 'capacitor', 'diode', 'led', 'resistor'] # Labels in model order
+detection_backend = 'tflite'            # 'eim' or 'tflite' (in-process)
+detection_model = "usb_pipeline/standin_runner.py" # Object detection model (.eim)
+detection_lite = "electronic-components-object_detection/ei-electronic-components-object-detection-object-detection-tensorflow-lite-int8-quantized-model.lite"
+sliding_backend = 'savedmodel'          # 'eim' or 'savedmodel' (in-process)
+sliding_model = "usb_pipeline/standin_runner.py" # Sliding window CNN (.eim)
+sliding_convolutional = False           # Share the CNN's work between overlapping windows (backend = 'savedmodel', 84x84 windows)
+
+# Paths are relative to this program
+dir_path = os.path.dirname(os.path.realpath(__file__))
+
+
+def path(name):
+    return os.path.join(dir_path, name)
+
+
+def load_frames(spec):
+    """
+    Decodes every image of a folder or zip up front
+    """
+    from usb_pipeline.sources import open_source
+    source = open_source(path(spec), 0, 0)
+    frames = []
+    while True:
+        ret, frame = source.read()
+        if not ret:
+            break
+        frames.append(frame)
+    source.release()
+    return frames
+
+
+def start_runner(model, width, height, channels, model_type='classification'):
+    """
+    Starts a .eim model and returns it with its transport. The stand-in
+    runner is told the model input of the pipeline it stands in for.
+    """
+    from edge_impulse_linux.runner import ImpulseRunner
+    from usb_pipeline.transport import FeatureTransport
+    if os.path.basename(model) == "standin_runner.py":
+        os.environ.update({'STANDIN_WIDTH': str(width),
+                           'STANDIN_HEIGHT': str(height),
+                           'STANDIN_CHANNELS': str(channels),
+                           'STANDIN_TYPE': model_type})
+    runner = ImpulseRunner(path(model))
+    model_info = runner.init()
+    return runner, model_info, FeatureTransport(runner, model_info,
+                                                shared_memory=use_shm)
+
+
+def dnn_pipeline():
+    """
+    dnn-live-inference-pi-cam_usb.py: rotate and crop (also the preview),
+    fused grayscale features, classify
+    """
+    from usb_pipeline.features import GrayscaleFeatures
+    runner, model_info, transport = start_runner(dnn_model, 28, 28, 1)
+    extract_features = GrayscaleFeatures(28, 28, 96, 96, copy=True)
+
+    def step(frame, timer):
+        with timer.stage("rotate"):
+            crop = extract_features.crop(frame)
+        with timer.stage("features"):
+            features = extract_features.from_crop(crop)
+        with timer.stage("classify"):
+            return transport.classify(features)
+
+    return load_frames(image_set), model_info, step, runner.stop
+
+
+def cnn_pipeline():
+    """
+    cnn-live-inference_usb.py: warp to the model input, pack pixels, classify
+    """
+    from usb_pipeline.features import PackedPixelFeatures
+    from usb_pipeline.geometry import GeometryPlan
+    if cnn_backend == 'savedmodel':
+        from usb_pipeline.savedmodel import SavedModelClassifier
+        runner = SavedModelClassifier(path(cnn_savedmodel), cnn_labels)
+        model_info = runner.init()
+        model = runner
+    else:
+        runner, model_info, model = start_runner(cnn_model, 96, 96, 3)
+    params = model_info['model_parameters']
+    geometry = GeometryPlan(0, out_size=(params['image_input_width'],
+                                         params['image_input_height']))
+    pack_features = PackedPixelFeatures.for_model(model_info)
+
+    def step(frame, timer):
+        with timer.stage("rotate"):
+            img = geometry.apply(frame)
+        features = img
+        if cnn_backend != 'savedmodel':
+            with timer.stage("features"):
+                features = pack_features(img)
+        with timer.stage("classify"):
+            return model.classify(features)
+
+    return load_frames(cnn_dataset), model_info, step, runner.stop
+
+
+def detection_pipeline():
+    """
+    live-detection-pi-cam_usb.py: crop and warp to the model input, pack
+    pixels, detect
+    """
+    from usb_pipeline.features import PackedPixelFeatures
+    from usb_pipeline.geometry import GeometryPlan
+    if detection_backend == 'tflite':
+        from usb_pipeline.tflite import TFLiteDetector
+        runner = TFLiteDetector(path(detection_lite),
+                                num_threads=len(pin_cpus(None)))
+        model_info = runner.init()
+        model = runner
+    else:
+        runner, model_info, model = start_runner(detection_model, 320, 320, 3,
+                                                 'object-detection')
+    params = model_info['model_parameters']
+    geometry = GeometryPlan(0, (320, 320),
+                            out_size=(params['image_input_width'],
+                                      params['image_input_height']))
+    pack_features = PackedPixelFeatures.for_model(model_info)
+
+    def step(frame, timer):
+        with timer.stage("rotate"):
+            img = geometry.apply(frame)
+        features = img
+        if detection_backend != 'tflite':
+            with timer.stage("features"):
+                features = pack_features(img)
+        with timer.stage("classify"):
+            return model.classify(features)
+
+    return load_frames(image_set), model_info, step, runner.stop
+
+
+def sliding_pipeline():
+    """
+    live-sliding-window-object-detection_usb.py: every 96x96 window at stride
+    24, classified as one batch, then the boxes over the threshold. The
+    convolutional mode needs 84x84 windows (a stride of 8 pixels at model
+    scale).
+    """
+    from usb_pipeline.geometry import GeometryPlan
+    from usb_pipeline.windows import SlidingWindows
+    if sliding_backend == 'savedmodel':
+        from usb_pipeline.savedmodel import SavedModelClassifier
+        runner = SavedModelClassifier(path(cnn_savedmodel), cnn_labels)
+        model_info = runner.init()
+        model = runner
+    else:
+        runner, model_info, model = start_runner(sliding_model, 96, 96, 3)
+    geometry = GeometryPlan(0)
+    size = 84 if sliding_convolutional else 96
+    windows = SlidingWindows(model, model_info, (size, size), 24,
+                             convolutional=sliding_convolutional)
+
+    def step(frame, timer):
+        with timer.stage("rotate"):
+            img = geometry.apply(frame)
+        with timer.stage("classify"):
+            probabilities = windows.probabilities(img)
+        with timer.stage("boxes"):
+            return windows.boxes(probabilities, 'led', 0.6)
+
+    return load_frames(image_set), model_info, step, runner.stop
+
+
+PIPELINES = {
+    'dnn': dnn_pipeline,
+    'cnn': cnn_pipeline,
+    'detection': detection_pipeline,
+    'sliding': sliding_pipeline,
+}
+
+
+def run_pipeline(name):
+    """
+    Runs one pipeline in this process and returns its results
+    """
+    from usb_pipeline.timing import LoopTimer
+    cpus = pin_cpus(cpu_affinity)
+    start_time = time.perf_counter()
+    frames, model_info, step, stop = PIPELINES[name]()
+    setup_time = time.perf_counter() - start_time
+
+    # Warm up, then time every frame and stage
+    for i in range(warmup):
+        step(frames[i % len(frames)], LoopTimer())
+    timer = LoopTimer(iterations + 1)
+    timer.frame()
+    for i in range(iterations):
+        step(frames[(warmup + i) % len(frames)], timer)
+        timer.frame()
+
+    result = timer.snapshot()
+    result.update({
+        'model': model_info['project']['name'],
+        'images': len(frames),
+        'cpus': cpus,
+        'setup_s': round(setup_time, 3),
+        'peak_rss_kb': peak_rss_kb(),
+        'model_peak_rss_kb': sum(peak_rss_kb(pid) or 0 for pid in child_pids()),
+    })
+    stop()
+    return result
+
+
+# Run a single pipeline when started with its name (that's how the pipelines
+# are run below, each in a fresh process)
+if len(sys.argv) > 1:
+    print(json.dumps(run_pipeline(sys.argv[1])))
+    sys.exit(0)
+
+# Print something to the console
+print()
+print("---Pipeline Benchmark---")
+print("Warm-up:", warmup, "frames, timed:", iterations, "frames per pipeline")
+
+report = {
+    'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+    'platform': platform.platform(),
+    'python': platform.python_version(),
+    'cpu_affinity': cpu_affinity,
+    'warmup': warmup,
+    'iterations': iterations,
+    'pipelines': {},
+}
+failed = []
+for name in pipelines:
+    run = subprocess.run([sys.executable, os.path.realpath(__file__), name],
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if run.returncode != 0:
+        print(name + ": ERROR")
+        print(run.stderr.strip().splitlines()[-1] if run.stderr.strip() else "")
+        failed.append(name)
+        continue
+    result = json.loads(run.stdout.strip().splitlines()[-1])
+    report['pipelines'][name] = result
+    frame = result['stages']['frame']
+    print(name + ": " + str(result['fps']) + " FPS, latency p50/p95/p99 (ms): " +
+          str(frame['p50_ms']) + "/" + str(frame['p95_ms']) + "/" +
+          str(frame['p99_ms']) + ", peak RSS " +
+          str(round(result['peak_rss_kb'] / 1024, 1)) + " MB" +
+          (" + model " + str(round(result['model_peak_rss_kb'] / 1024, 1)) + " MB"
+           if result['model_peak_rss_kb'] else ""))
+    for stage, stats in result['stages'].items():
+        if stage != 'frame':
+            print("  " + stage.ljust(12) + str(stats['p50_ms']) + "/" +
+                  str(stats['p95_ms']) + "/" + str(stats['p99_ms']) + " ms")
+
+with open(path(report_file), 'w') as f:
+    json.dump(report, f, indent=2)
+print("Report:", report_file)
+
+# Compare with the baseline, or store this run as the baseline
+regressed = []
+if update_baseline or not os.path.exists(path(baseline_file)):
+    with open(path(baseline_file), 'w') as f:
+        json.dump(report, f, indent=2)
+    print("Baseline stored:", baseline_file)
+else:
+    with open(path(baseline_file)) as f:
+        baseline = json.load(f)
+    regressed = regressions(report, baseline, max_regression)
+    print("Baseline:", baseline_file, "from", baseline['created'])
+    for line in regressed:
+        print("REGRESSION:", line)
+    if not regressed:
+        print("No regressions beyond", str(round(max_regression * 100)) + "%")
+print()
+
+if failed or regressed:
+    sys.exit(1)
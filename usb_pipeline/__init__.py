@@ -0,0 +1,9 @@
+"""
+USB Camera Pipeline Helpers
+
+Shared capture, preprocessing and inference helpers used by the *_usb.py live
+scripts. The scripts are run directly, so each one adds the top of the
+repository to sys.path before importing from this package.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
@@ -0,0 +1,90 @@
+"""
+Benchmark Helpers
+
+Used by pipeline-benchmark.py, which runs the real preprocessing and inference
+code of each pipeline over stored images, headless, and compares the results
+with a stored baseline.
+
+To make runs comparable, the benchmark pins itself to a fixed set of CPUs with
+pin_cpus(). Model processes it starts, and threads the model starts, inherit
+the pinning. peak_rss_kb() reads a process's peak resident memory from /proc,
+so .eim model processes can be measured alongside the benchmark's own.
+
+regressions() compares a report with a baseline report. For every pipeline
+in both, throughput may not drop, and p95 frame latency may not rise, by more
+than the allowed share.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import os, resource
+
+
+def pin_cpus(cpus):
+    """
+    Pins this process (and the processes and threads it starts from now on)
+    to the given CPUs. Returns the CPUs it runs on, sorted.
+    """
+    if cpus is not None:
+        if not hasattr(os, 'sched_setaffinity'):
+            raise ValueError("CPU pinning is not supported on this platform")
+        os.sched_setaffinity(0, cpus)
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count()))
+
+
+def peak_rss_kb(pid=None):
+    """
+    Peak resident memory of a process in kB (this process by default), or
+    None if it can't be read
+    """
+    try:
+        with open("/proc/" + (str(pid) if pid else "self") + "/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    if pid is None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return None
+
+
+def child_pids():
+    """
+    Process IDs of this process's children, e.g. started .eim models
+    """
+    pids = []
+    try:
+        for task in os.listdir("/proc/self/task"):
+            with open("/proc/self/task/" + task + "/children") as f:
+                pids += [int(pid) for pid in f.read().split()]
+    except OSError:
+        pass
+    return pids
+
+
+def regressions(report, baseline, max_regression):
+    """
+    Returns a line for every pipeline whose throughput dropped, or whose p95
+    frame latency rose, by more than max_regression (a share, e.g. 0.1)
+    against the baseline
+    """
+    lines = []
+    for name, result in report['pipelines'].items():
+        base = baseline.get('pipelines', {}).get(name)
+        if base is None:
+            continue
+        fps, base_fps = result['fps'], base['fps']
+        if base_fps and fps < base_fps * (1 - max_regression):
+            lines.append(name + ": throughput " + str(fps) + " FPS, baseline " +
+                         str(base_fps) + " FPS (" +
+                         str(round((fps / base_fps - 1) * 100, 1)) + "%)")
+        p95 = result['stages']['frame']['p95_ms']
+        base_p95 = base['stages']['frame']['p95_ms']
+        if base_p95 and p95 > base_p95 * (1 + max_regression):
+            lines.append(name + ": p95 latency " + str(p95) + " ms, baseline " +
+                         str(base_p95) + " ms (+" +
+                         str(round((p95 / base_p95 - 1) * 100, 1)) + "%)")
+    return lines
@@ -0,0 +1,109 @@
+"""
+Content-Hash Result Cache
+
+The same picture often reaches the model more than once: a bench camera sees
+the same scene frame after frame, and a sliding window sees the same empty
+background tile at many positions. ResultCache remembers the model's answer
+for a picture, keyed by a hash of its pixels, and hands it back instead of
+classifying again.
+
+Pixels are quantized before hashing (the lowest quantize_bits bits of every
+value are dropped), so pictures that differ only within those bits share an
+entry. That is lossy, as a picture can get the result of a different one, so
+the default quantize_bits=0 only matches identical pixels. Random noise over a
+whole window nearly always crosses a step somewhere, so a noisy camera gets
+few hits: the cache pays off for exact repeats such as synthetic, rendered or
+file sources, held frames and flat tiles. Entries are evicted least recently
+used first once the cache holds more than max_bytes, and hits, misses and
+evictions are counted.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import collections, hashlib
+
+import numpy as np
+
+# Rough memory of an entry besides its value: key, dictionary slot, list node
+ENTRY_OVERHEAD = 200
+
+
+def value_size(value):
+    """
+    Approximate memory used by a cached value, in bytes
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    return len(repr(value))
+
+
+class ResultCache:
+    """
+    Least recently used cache of results, keyed by picture content
+    """
+
+    def __init__(self, max_bytes=16 << 20, quantize_bits=0):
+        self.max_bytes = max_bytes
+        self.mask = np.uint8((0xff << quantize_bits) & 0xff)
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, pixels):
+        """
+        Returns the hash of the quantized uint8 pixels
+        """
+        quantized = np.bitwise_and(pixels, self.mask)
+        return hashlib.blake2b(quantized.tobytes(), digest_size=16).digest()
+
+    def get(self, key):
+        """
+        Returns the result stored under key, or None (counted as a miss)
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value):
+        """
+        Stores value under key, evicting the oldest entries over max_bytes
+        """
+        size = value_size(value) + ENTRY_OVERHEAD
+        if key in self.entries:
+            self.bytes -= self.entries.pop(key)[1]
+        self.entries[key] = (value, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes and self.entries:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    def classify(self, model, pixels, features):
+        """
+        Returns model.classify(features), or the stored result if a picture
+        with the same quantized pixels was classified before
+        """
+        key = self.key(pixels)
+        res = self.get(key)
+        if res is None:
+            res = model.classify(features)
+            self.put(key, res)
+        return res
+
+    def stats(self):
+        """
+        Returns a one-line summary of the counters
+        """
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups if lookups else 0.0
+        return ("hits: " + str(self.hits) + " misses: " + str(self.misses) +
+                " hit rate: " + str(round(rate, 3)) +
+                " evictions: " + str(self.evictions) +
+                " entries: " + str(len(self.entries)) +
+                " memory (kB): " + str(round(self.bytes / 1024, 1)))
@@ -0,0 +1,299 @@
+"""
+USB Camera Capture
+
+Reads frames from a USB camera in a background thread so that V4L capture and
+model inference overlap instead of running one after the other. Frames are
+written into a small ring of preallocated buffers and the consumer always gets
+the newest one. Frames that were overwritten before anyone read them are
+counted as dropped, and frames handed out a second time because the camera had
+nothing newer are counted as reused.
+
+MjpegCamera asks the camera for MJPEG and decodes the compressed frames itself,
+at 1/2, 1/4 or 1/8 scale if requested, so JPEG decode work is only spent on
+the pixels the model will see.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import threading, time
+
+import cv2
+
+# imdecode flags for each reduced decode scale (libjpeg DCT scaling)
+DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+class FrameRing:
+    """
+    Ring of preallocated frames shared by one writer and one reader.
+
+    The writer never touches the slot holding the newest frame or the slot the
+    reader is currently using, so a frame returned by read() stays valid until
+    the next call to read().
+    """
+
+    def __init__(self, num_slots=3, listener=None):
+        if num_slots < 3:
+            raise ValueError("FrameRing needs at least 3 slots")
+        self.slots = [None] * num_slots
+        self.times = [0.0] * num_slots  # When each slot's frame was captured
+        self.listener = listener        # Optional threading.Event set on publish
+        self.cond = threading.Condition()
+        self.latest = None              # Slot holding the newest frame
+        self.latest_seq = 0             # Number of frames published so far
+        self.reading = None             # Slot checked out by the reader
+        self.read_seq = 0               # Sequence number of the last frame read
+        self.read_time = 0.0            # Capture time of the last frame read
+        self.closed = False
+        self.dropped = 0
+        self.reused = 0
+
+    def acquire_write(self):
+        """
+        Returns the index of a slot the writer may fill
+        """
+        with self.cond:
+            for i in range(len(self.slots)):
+                if i != self.latest and i != self.reading:
+                    return i
+
+    def publish(self, index, frame):
+        """
+        Makes the frame in slot index the newest frame
+        """
+        with self.cond:
+            self.slots[index] = frame
+            self.times[index] = time.perf_counter()
+            if self.latest is not None and self.latest_seq > self.read_seq:
+                self.dropped += 1
+            self.latest = index
+            self.latest_seq += 1
+            self.cond.notify_all()
+        if self.listener is not None:
+            self.listener.set()
+
+    def close(self):
+        """
+        Wakes up the reader and makes further reads fail once drained
+        """
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        if self.listener is not None:
+            self.listener.set()
+
+    def read(self, timeout=1.0, fresh_only=False):
+        """
+        Returns (ret, frame) with the newest frame, waiting up to timeout
+        seconds for one newer than the last frame read. If nothing newer
+        arrives the last frame is returned again and counted as reused,
+        unless fresh_only is set, in which case (False, None) is returned.
+        """
+        with self.cond:
+            self.cond.wait_for(lambda: self.latest_seq > self.read_seq or
+                               self.closed, timeout)
+            if self.latest is None or (self.closed and
+                                       self.latest_seq == self.read_seq):
+                return False, None
+            if self.latest_seq == self.read_seq:
+                if fresh_only:
+                    return False, None
+                self.reused += 1
+            self.reading = self.latest
+            self.read_seq = self.latest_seq
+            self.read_time = self.times[self.reading]
+            return True, self.slots[self.reading]
+
+    def wait_first(self, timeout=None):
+        """
+        Waits until the first frame is published, without reading it.
+        Returns False if the writer stopped or timeout passed first.
+        """
+        with self.cond:
+            self.cond.wait_for(lambda: self.latest_seq > 0 or self.closed,
+                               timeout)
+            return self.latest_seq > 0
+
+    @property
+    def ended(self):
+        """
+        True once the writer has stopped and every frame has been read
+        """
+        return self.closed and self.latest_seq == self.read_seq
+
+
+class ThreadedCapture:
+    """
+    Drop-in replacement for cv2.VideoCapture.read() backed by a capture thread
+
+    Wraps an already opened and configured camera (anything with read() and
+    release()) and keeps reading from it into a FrameRing.
+    """
+
+    def __init__(self, camera, num_slots=3, timeout=1.0, listener=None):
+        self.camera = camera
+        self.ring = FrameRing(num_slots, listener)
+        self.timeout = timeout
+        self.captured = 0
+        self.running = True
+        self.thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self.thread.start()
+
+    def _capture_loop(self):
+        ring = self.ring
+        while self.running:
+            index = ring.acquire_write()
+
+            # Passing the slot lets OpenCV decode straight into the
+            # preallocated buffer once its shape is known
+            if ring.slots[index] is None:
+                ret, frame = self.camera.read()
+            else:
+                ret, frame = self.camera.read(ring.slots[index])
+            if not ret:
+                break
+
+            # Allocate every slot from the first frame so later reads reuse them
+            if ring.slots[index] is None:
+                for i in range(len(ring.slots)):
+                    if ring.slots[i] is None and i != index:
+                        ring.slots[i] = frame.copy()
+
+            self.captured += 1
+            ring.publish(index, frame)
+        ring.close()
+
+    def read(self):
+        """
+        Returns (ret, frame) with the newest captured frame
+        """
+        return self.ring.read(self.timeout)
+
+    def wait_first_frame(self, timeout=5.0):
+        """
+        Waits until the camera has delivered its first frame (which can take
+        a while after opening a USB camera). Returns False if it didn't.
+        """
+        return self.ring.wait_first(timeout)
+
+    def poll(self):
+        """
+        Returns (True, frame) if a frame newer than the last one read is
+        waiting, (False, None) otherwise. Never blocks.
+        """
+        return self.ring.read(0, fresh_only=True)
+
+    @property
+    def frame_time(self):
+        """
+        time.perf_counter() timestamp of when the last frame read was captured
+        """
+        return self.ring.read_time
+
+    @property
+    def pending(self):
+        """
+        Frames captured since the last read (1 or more means the reader is
+        behind; all but the newest of them will be dropped)
+        """
+        return self.ring.latest_seq - self.ring.read_seq
+
+    @property
+    def dropped(self):
+        return self.ring.dropped
+
+    @property
+    def reused(self):
+        return self.ring.reused
+
+    def get(self, prop_id):
+        return self.camera.get(prop_id)
+
+    def set(self, prop_id, value):
+        return self.camera.set(prop_id, value)
+
+    def release(self):
+        """
+        Stops the capture thread and releases the camera
+        """
+        self.running = False
+        self.thread.join(timeout=2.0)
+        self.ring.close()
+        self.camera.release()
+
+
+class MjpegCamera:
+    """
+    Camera wrapper that negotiates MJPEG and decodes frames at reduced scale
+
+    With CAP_PROP_CONVERT_RGB turned off, the V4L backend returns each MJPEG
+    frame as a buffer of compressed bytes instead of decoding it. The buffer
+    is decoded here with libjpeg's DCT scaling, which skips most of the IDCT
+    and colour conversion work instead of decoding at full size and shrinking
+    afterwards. If roi is given as (width, height) in full-size pixels, only
+    that region from the middle of the frame is returned, as a view. It is
+    divided by scale like the frame, so the view is roi // scale pixels.
+
+    If the camera refuses MJPEG, frames arrive already decoded and are scaled
+    with cv2.resize, so the output shape is the same either way.
+    """
+
+    def __init__(self, camera, scale=1, roi=None):
+        if scale not in DECODE_FLAGS:
+            raise ValueError("decode scale must be 1, 2, 4 or 8")
+        self.camera = camera
+        self.scale = scale
+        self.roi = roi
+        camera.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+        self.mjpeg = self.fourcc() == 'MJPG'
+        if self.mjpeg:
+            camera.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+
+    def fourcc(self):
+        """
+        Returns the pixel format the camera agreed to, e.g. 'MJPG' or 'YUYV'
+        """
+        code = int(self.camera.get(cv2.CAP_PROP_FOURCC))
+        return "".join(chr((code >> (8 * i)) & 0xFF) for i in range(4))
+
+    def read(self, image=None):
+        """
+        Returns (ret, frame) with a decoded BGR frame. The image argument is
+        accepted for compatibility with cv2.VideoCapture.read() and ignored,
+        since imdecode always allocates its output.
+        """
+        ret, frame = self.camera.read()
+        if not ret:
+            return False, None
+
+        # Raw MJPEG arrives as a single row of compressed bytes
+        if frame.ndim < 3:
+            frame = cv2.imdecode(frame, DECODE_FLAGS[self.scale])
+            if frame is None:
+                return False, None
+        elif self.scale > 1:
+            frame = cv2.resize(frame,
+                               (frame.shape[1] // self.scale,
+                                frame.shape[0] // self.scale),
+                               interpolation=cv2.INTER_AREA)
+
+        if self.roi is not None:
+            width, height = self.roi[0] // self.scale, self.roi[1] // self.scale
+            x = max(int(frame.shape[1]/2 - width/2), 0)
+            y = max(int(frame.shape[0]/2 - height/2), 0)
+            frame = frame[y:y+height, x:x+width]
+        return True, frame
+
+    def get(self, prop_id):
+        return self.camera.get(prop_id)
+
+    def set(self, prop_id, value):
+        return self.camera.set(prop_id, value)
+
+    def release(self):
+        self.camera.release()
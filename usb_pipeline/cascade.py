@@ -0,0 +1,100 @@
+"""
+Sliding Window Rejection Cascade
+
+Most windows of a bench scene show nothing but the bench, and each of them
+still costs a CNN call. WindowRejector is a cheap first stage that looks at
+every window at once and rejects the ones that are clearly empty before they
+reach the model.
+
+It uses three measures, each computed for all windows from an integral image
+(one pass over the frame, then four lookups per window):
+
+- local variance of the grayscale pixels: empty surface is flat
+- edge density: the share of pixels on an edge (Sobel gradient above a
+  threshold); components have outlines, the bench mostly doesn't
+- colour distance from the background: the mean difference from the bench
+  colour, taken as the frame's median colour unless given
+
+A window is rejected only when all three say it is empty. SlidingWindows takes
+a rejector as its prefilter and gives rejected windows the background label
+without classifying them.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import cv2
+import numpy as np
+
+
+def window_sums(integral, rows, columns, stride, window_size):
+    """
+    Returns the rows x columns sums of all windows from an integral image
+    (as made by cv2.integral, one row and column larger than the image)
+    """
+    width, height = window_size
+    y = np.arange(rows)[:, np.newaxis] * stride
+    x = np.arange(columns)[np.newaxis, :] * stride
+    return (integral[y + height, x + width] - integral[y, x + width] -
+            integral[y + height, x] + integral[y, x])
+
+
+class WindowRejector:
+    """
+    Rejects sliding windows that look like empty background
+
+    min_variance is in grayscale levels squared, min_edges a share of the
+    window's pixels and min_distance in colour levels (mean absolute
+    difference summed over B, G and R). A window is kept if it reaches any of
+    them. background_color is the (B, G, R) colour of the empty bench, or None
+    to use the median colour of each frame.
+    """
+
+    def __init__(self, min_variance=50, min_edges=0.005, min_distance=30,
+                 edge_threshold=100, background_color=None):
+        self.min_variance = min_variance
+        self.min_edges = min_edges
+        self.min_distance = min_distance
+        self.edge_threshold = edge_threshold
+        self.background_color = background_color
+
+    def measures(self, img, rows, columns, stride, window_size):
+        """
+        Returns the variance, edge density and colour distance of every
+        window as rows x columns arrays
+        """
+        area = window_size[0] * window_size[1]
+
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        sums, squares = cv2.integral2(gray, sdepth=cv2.CV_64F,
+                                      sqdepth=cv2.CV_64F)
+        mean = window_sums(sums, rows, columns, stride, window_size) / area
+        variance = window_sums(squares, rows, columns, stride,
+                               window_size) / area - mean * mean
+
+        gradient_x = cv2.Sobel(gray, cv2.CV_16S, 1, 0)
+        gradient_y = cv2.Sobel(gray, cv2.CV_16S, 0, 1)
+        magnitude = cv2.addWeighted(cv2.convertScaleAbs(gradient_x), 1,
+                                    cv2.convertScaleAbs(gradient_y), 1, 0)
+        edges = (magnitude >= self.edge_threshold).astype(np.uint8)
+        edges = window_sums(cv2.integral(edges), rows, columns, stride,
+                            window_size) / area
+
+        background = self.background_color
+        if background is None:
+            small = cv2.resize(img, None, fx=0.25, fy=0.25,
+                               interpolation=cv2.INTER_NEAREST)
+            background = np.median(small.reshape(-1, 3), axis=0)
+        difference = cv2.absdiff(img, np.full_like(img, background))
+        distance = difference.sum(axis=2, dtype=np.float32)
+        distance = window_sums(cv2.integral(distance), rows, columns, stride,
+                               window_size) / area
+        return variance, edges, distance
+
+    def __call__(self, img, rows, columns, stride, window_size):
+        """
+        Returns a rows x columns boolean array, True for the windows to keep
+        """
+        variance, edges, distance = self.measures(img, rows, columns, stride,
+                                                  window_size)
+        return (variance >= self.min_variance) | (edges >= self.min_edges) | \
+            (distance >= self.min_distance)
@@ -0,0 +1,356 @@
+"""
+Inference Daemon
+
+Every live script starts its own copy of the .eim model and waits for it to
+come up, so running the preview, CNN and detection scripts side by side means
+three cold starts and three resident models. InferenceDaemon is a long-lived
+process that starts the models once, warms each up with a classify request,
+and serves them to any number of scripts over a Unix socket.
+
+The daemon speaks the same protocol as a .eim model (JSON requests, responses
+ending in a NUL byte), with one addition: hello names the model wanted by its
+path. DaemonClient is the thin client the scripts use in place of
+ImpulseRunner; it only connects, so it attaches in milliseconds. Each client
+gets its own shared memory block for features, offered in the hello response
+as features_shm just like a model does. DaemonClient maps it with a
+FeatureTransport of its own, made again on every hello.
+
+Clients of the same model share its one runner and take turns; clients of
+different models run in parallel. The socket is only accessible to the user
+running the daemon, and only models it was started with are served.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import json, os, socket, socketserver, threading, time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .transport import FeatureTransport
+
+
+class ServedModel:
+    """
+    A started runner, its transport and the lock its clients take turns on
+    """
+
+    def __init__(self, model_path, runner_class, shared_memory=True):
+        self.path = os.path.realpath(model_path)
+        self.runner = runner_class(self.path)
+        self.shared_memory = shared_memory
+        self.transport = None
+        self.model_info = None
+        self.lock = threading.Lock()
+        self.clients_lock = threading.Lock()
+        self.clients = 0
+        self.requests = 0
+
+    def start(self):
+        """
+        Starts the runner and warms it up, returns the time it took
+        """
+        start_time = time.perf_counter()
+        self.model_info = self.runner.init()
+        self.transport = FeatureTransport(self.runner, self.model_info,
+                                          shared_memory=self.shared_memory)
+        count = self.model_info['model_parameters']['input_features_count']
+        self.transport.classify(np.zeros(count, dtype=np.float32))
+        return time.perf_counter() - start_time
+
+    def classify(self, features):
+        with self.lock:
+            self.requests += 1
+            return self.transport.classify(features)
+
+    def send_msg(self, msg):
+        with self.lock:
+            return self.runner.send_msg(msg)
+
+    def attach(self, count=1):
+        """
+        Counts a client attaching (or, with count=-1, detaching)
+        """
+        with self.clients_lock:
+            self.clients += count
+
+    def stop(self):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+        self.runner.stop()
+
+
+class ClientHandler(socketserver.BaseRequestHandler):
+    """
+    Serves one connected client until it disconnects
+    """
+
+    def setup(self):
+        self.model = None
+        self.shm = None
+        self.features = None
+
+    def handle(self):
+        decoder = json.JSONDecoder()
+        data = ""
+        while True:
+            chunk = self.request.recv(65536)
+            if not chunk:
+                break
+            data += chunk.decode('utf-8')
+
+            # Requests are bare JSON objects, possibly split across chunks
+            while data:
+                try:
+                    msg, end = decoder.raw_decode(data.lstrip())
+                except ValueError:
+                    break
+                data = data.lstrip()[end:]
+                try:
+                    resp = self.respond(msg)
+                    resp.update({'id': msg.get('id'), 'success': True})
+                except Exception as e:
+                    resp = {'id': msg.get('id'), 'success': False,
+                            'error': str(e)}
+                self.request.sendall(json.dumps(resp).encode('utf-8') + b'\x00')
+
+    def respond(self, msg):
+        if 'hello' in msg:
+            return self.hello(msg.get('model'))
+        if self.model is None:
+            raise ValueError("Send hello with a model first")
+        if 'classify_shm' in msg:
+            return self.model.classify(
+                self.features[:msg['classify_shm']['elements']])
+        if 'classify' in msg:
+            return self.model.classify(msg['classify'])
+        msg = dict(msg)
+        msg.pop('id', None)
+        return dict(self.model.send_msg(msg))
+
+    def hello(self, model_path):
+        """
+        Attaches the client to a served model and returns its information,
+        with a features block of the client's own. The block is kept across
+        hellos, and replaced by a bigger one if the new model needs more
+        features than it holds.
+        """
+        model = self.server.inference_daemon.find(model_path)
+        if self.model is not None:
+            self.model.attach(-1)
+        self.model = model
+        self.model.attach()
+        info = dict(self.model.model_info)
+        info.pop('features_shm', None)
+        count = info['model_parameters']['input_features_count']
+        if self.shm is not None and count > len(self.features):
+            self.release()
+        if self.shm is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=count * 4)
+            self.features = np.ndarray((count,), dtype=np.float32,
+                                       buffer=self.shm.buf)
+        info['features_shm'] = {
+            'name': '/' + self.shm.name,
+            'type': 'float32',
+            'elements': count,
+        }
+        return info
+
+    def finish(self):
+        if self.model is not None:
+            self.model.attach(-1)
+        self.release()
+
+    def release(self):
+        """
+        Frees the client's features block
+        """
+        if self.shm is not None:
+            self.features = None
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+
+class InferenceDaemon:
+    """
+    Keeps models started and serves them on a Unix socket
+
+    runner_class makes a runner from a model path, ImpulseRunner by default.
+    """
+
+    def __init__(self, socket_path, model_paths, shared_memory=True,
+                 runner_class=None):
+        if runner_class is None:
+            try:
+                from edge_impulse_linux.runner import ImpulseRunner
+            except ImportError as e:
+                raise ImportError("InferenceDaemon needs edge_impulse_linux "
+                                  "(" + str(e) + ")")
+            runner_class = ImpulseRunner
+        self.socket_path = socket_path
+        self.models = [ServedModel(path, runner_class, shared_memory)
+                       for path in model_paths]
+        self.server = None
+
+    def start(self):
+        """
+        Starts and warms up every model, then opens the socket. Returns the
+        start-up time of each model in seconds.
+        """
+        times = []
+        for model in self.models:
+            times.append(model.start())
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+        # Create the socket accessible to this user only
+        umask = os.umask(0o177)
+        try:
+            self.server = socketserver.ThreadingUnixStreamServer(
+                self.socket_path, ClientHandler)
+        finally:
+            os.umask(umask)
+        self.server.daemon_threads = True
+        self.server.inference_daemon = self
+        return times
+
+    def find(self, model_path):
+        """
+        Returns the served model for a path (any model if there is only one
+        and no path is given)
+        """
+        if model_path is None and len(self.models) == 1:
+            return self.models[0]
+        if model_path is not None:
+            path = os.path.realpath(model_path)
+            for model in self.models:
+                if model.path == path:
+                    return model
+        raise ValueError("Model not served by this daemon: " + str(model_path))
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def stats(self):
+        """
+        Returns a line per model: clients attached and requests served
+        """
+        lines = []
+        for model in self.models:
+            with model.clients_lock:
+                clients = model.clients
+            lines.append(os.path.basename(model.path) + ": clients " +
+                         str(clients) + " requests " + str(model.requests))
+        return "\n".join(lines)
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+        for model in self.models:
+            model.stop()
+
+
+class DaemonClient:
+    """
+    Thin stand-in for ImpulseRunner that uses a model served by the daemon
+
+    model_path names the model and must be one the daemon was started with.
+    Features go through the client's shared memory block, unless
+    shared_memory is False. Like the SDK's runner, the client then has an
+    _input_shm, so a FeatureTransport made on top hands it the features
+    unchanged.
+    """
+
+    def __init__(self, socket_path, model_path=None, timeout=None,
+                 shared_memory=True):
+        self.socket_path = socket_path
+        self.model_path = model_path
+        self.timeout = timeout
+        self.shared_memory = shared_memory
+        self.client = None
+        self.transport = None
+        self.ix = 0
+
+    def init(self):
+        """
+        Connects to the daemon and returns the model information
+        """
+        self.client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.client.settimeout(self.timeout)
+        try:
+            self.client.connect(self.socket_path)
+        except OSError as e:
+            self.client.close()
+            self.client = None
+            raise ConnectionError("No inference daemon on " +
+                                  self.socket_path + " (" + str(e) + ")")
+        return self.hello(self.model_path)
+
+    def hello(self, model_path=None):
+        """
+        Attaches to a served model and returns its information. The daemon
+        may hand out a new features block, so the transport is made again
+        from the response.
+        """
+        msg = {"hello": 1}
+        if model_path is not None:
+            msg["model"] = os.path.realpath(model_path)
+        info = self.send_msg(msg)
+        self.model_path = model_path
+        self.close_transport()
+        self.transport = FeatureTransport(self, info,
+                                          shared_memory=self.shared_memory)
+        return info
+
+    @property
+    def _input_shm(self):
+        if self.transport is not None and self.transport.mode == 'shm':
+            return self.transport.shm
+        return None
+
+    def send_msg(self, msg):
+        if self.client is None:
+            raise Exception("DaemonClient is not initialized (call init())")
+        self.ix += 1
+        msg = dict(msg, id=self.ix)
+        self.client.sendall(json.dumps(msg).encode('utf-8'))
+
+        data = b""
+        while not data.endswith(b'\x00'):
+            chunk = self.client.recv(65536)
+            if not chunk:
+                raise ConnectionError("Inference daemon closed the connection")
+            data += chunk
+        resp = json.loads(data[:-1].decode('utf-8'))
+        if resp.get('id') != self.ix:
+            raise Exception("Wrong id, expected: " + str(self.ix) +
+                            " but got " + str(resp.get('id')))
+        if not resp['success']:
+            raise Exception(resp['error'])
+        del resp['id']
+        del resp['success']
+        return resp
+
+    def classify(self, data):
+        if self._input_shm is not None:
+            return self.transport.classify(data)
+        if isinstance(data, np.ndarray):
+            data = data.tolist()
+        return self.send_msg({"classify": data})
+
+    def close_transport(self):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+    def stop(self):
+        self.close_transport()
+        if self.client is not None:
+            self.client.close()
+            self.client = None
@@ -0,0 +1,106 @@
+"""
+Model Feature Extraction
+
+Turns camera frames into the feature vectors the models expect, writing into
+buffers that are allocated once and reused for every frame.
+
+GrayscaleFeatures builds the DNN input: center crop, resize, grayscale and scale
+to 0..1. Rotation and crop happen in one exact warp (see geometry.py), the resize
+is the same cv2.resize the DNN was trained with, and the final scaling is a
+lookup in a precomputed 256-entry float32 table instead of a float64 division
+over the whole image.
+
+PackedPixelFeatures builds the input of the image models run through
+ImageImpulseRunner: one 0xRRGGBB number per pixel, the same values the SDK's
+get_features_from_image() packs in a Python loop.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import cv2
+import numpy as np
+
+from .geometry import GeometryPlan
+
+# Grayscale value -> feature value, i.e. x / 255
+NORMALIZE_LUT = np.arange(256, dtype=np.float32) / 255
+
+
+class GrayscaleFeatures:
+    """
+    Callable that extracts DNN features from a BGR frame
+
+    Returns a float32 array of width * height values, the same numbers as
+    np.reshape(cvtColor(resize(crop), BGR2GRAY), -1) / 255 on the rotated
+    frame. The array is reused by the next call, so copy it if it has to
+    outlive the frame.
+
+    The two halves can also be called on their own: crop() rotates and crops
+    the frame, and from_crop() turns the crop into features, so a script can
+    show the crop without rotating and cropping the frame a second time.
+    With copy set the crop is never a view of the frame, so it can be drawn
+    on once its features are taken.
+    """
+
+    def __init__(self, width, height, crop_width, crop_height, rotation=0,
+                 copy=False):
+        self.plan = GeometryPlan(rotation, (crop_width, crop_height), copy=copy)
+        self.size = (width, height)
+        self.small = np.empty((height, width, 3), dtype=np.uint8)
+        self.gray = np.empty((height, width), dtype=np.uint8)
+        self.features = np.empty(width * height, dtype=np.float32)
+
+    def __call__(self, frame):
+        return self.from_crop(self.crop(frame))
+
+    def crop(self, frame):
+        """
+        Returns the rotated, center-cropped frame, reused by the next call
+        """
+        return self.plan.apply(frame)
+
+    def from_crop(self, crop):
+        """
+        Returns the features of a rotated, center-cropped frame
+        """
+        cv2.resize(crop, self.size, dst=self.small)
+        cv2.cvtColor(self.small, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        np.take(NORMALIZE_LUT, self.gray.reshape(-1), out=self.features)
+        return self.features
+
+
+class PackedPixelFeatures:
+    """
+    Callable that packs a BGR image of the model's input size into 0xRRGGBB
+    features
+
+    Pixels are copied into a zero-padded BGRX buffer whose memory, read as
+    little-endian 32-bit integers, is exactly b + (g << 8) + (r << 16). So no
+    RGB conversion, shifting or Python loop is needed. The returned uint32
+    array is reused by the next call.
+    """
+
+    def __init__(self, width, height, grayscale=False):
+        self.grayscale = grayscale
+        self.bgrx = np.zeros((height, width, 4), dtype=np.uint8)
+        self.packed = self.bgrx.view(np.dtype('<u4')).reshape(-1)
+        self.gray = np.empty((height, width), dtype=np.uint32)
+
+    @classmethod
+    def for_model(cls, model_info):
+        """
+        Creates the packer for the model described by runner.init()'s result
+        """
+        params = model_info['model_parameters']
+        return cls(params['image_input_width'], params['image_input_height'],
+                   params['image_channel_count'] == 1)
+
+    def __call__(self, img):
+        if self.grayscale:
+            # The SDK applies BGR2GRAY to RGB images; RGB2GRAY on our BGR
+            # image uses the same weights on the same channels
+            gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+            np.multiply(gray, 0x010101, out=self.gray, dtype=np.uint32)
+            return self.gray.reshape(-1)
+        self.bgrx[..., :3] = img
+        return self.packed
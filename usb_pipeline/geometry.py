@@ -0,0 +1,178 @@
+"""
+Precompiled Frame Geometry
+
+The live scripts used to rotate the whole frame (a full copy), slice a center
+crop out of it, and then let the runner resize and crop that again to the
+model's input size. All of these steps are affine, so GeometryPlan folds them
+into one 2x3 matrix, worked out once for a given frame size, and produces the
+final image with a single cv2.warpAffine straight from the captured frame.
+
+When the combined transform doesn't scale, nearest-neighbour sampling is used,
+so the output is pixel-for-pixel what rotate + crop would have produced. When
+there is nothing to do at all, apply() returns a view of the frame.
+
+Shrinking is the exception. The runner (get_features_from_image) shrinks with
+cv2.INTER_AREA, which averages every source pixel under an output pixel,
+and a bilinear warp gives visibly different model inputs. So when the plan
+shrinks, the warp only rotates and crops, and cv2.resize with INTER_AREA
+does the resize, followed by the runner's center crop as a view.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import math
+import cv2
+import numpy as np
+
+
+def rotation_matrix(rotation, width, height):
+    """
+    Returns the 3x3 matrix that maps a pixel of the frame rotated clockwise by
+    rotation degrees back to the pixel of the original width x height frame
+    """
+    if rotation == 0:
+        return np.eye(3)
+    if rotation == 90:
+        # rotated (x, y) <- original (y, height - 1 - x)
+        return np.array([[0, 1, 0], [-1, 0, height - 1], [0, 0, 1]], float)
+    if rotation == 180:
+        return np.array([[-1, 0, width - 1], [0, -1, height - 1], [0, 0, 1]],
+                        float)
+    if rotation == 270:
+        # rotated (x, y) <- original (width - 1 - y, x)
+        return np.array([[0, -1, width - 1], [1, 0, 0], [0, 0, 1]], float)
+    raise ValueError("rotation must be 0, 90, 180 or 270")
+
+
+def runner_crop(crop_width, crop_height, out_width, out_height):
+    """
+    Returns (scale, x, y): how the Edge Impulse runner fits an image into the
+    model input. It scales the image so that it covers out_width x
+    out_height while keeping its aspect ratio, then cuts out the middle.
+    """
+    scale = max(out_width / crop_width, out_height / crop_height)
+    resized_width = int(math.ceil(scale * crop_width))
+    resized_height = int(math.ceil(scale * crop_height))
+    x = int((resized_width - out_width) / 2)
+    y = int((resized_height - out_height) / 2)
+    return scale, x, y
+
+
+class GeometryPlan:
+    """
+    Rotation, center crop and resize of a frame compiled into one warp
+
+    crop_size is the (width, height) center crop taken from the rotated
+    frame, or None for the whole rotated frame. out_size is the (width,
+    height) of the result; if it differs from the crop, the crop is fitted the
+    way the runner does it (see runner_crop), or stretched to out_size like a
+    plain cv2.resize if squash is set. With copy set, the result is always
+    the plan's own buffer, never a view of the frame, so it can be drawn on.
+    The plan is compiled on the first frame and again only if the frame size
+    changes.
+    """
+
+    def __init__(self, rotation, crop_size=None, out_size=None, squash=False,
+                 copy=False):
+        self.rotation = rotation
+        self.crop_size = crop_size
+        self.out_size = out_size
+        self.squash = squash
+        self.copy = copy
+        self.frame_shape = None
+        self.matrix = None
+        self.flags = cv2.INTER_NEAREST
+        self.view = None                # (y0, y1, x0, x1) if just a crop
+        self.out = None
+        self.crop_plan = None           # Rotate + crop before an area resize
+        self.resize_size = None         # (width, height) of the area resize
+        self.resize_view = None         # (y0, y1, x0, x1) of the runner crop
+
+    def compile(self, frame_shape):
+        height, width = frame_shape[:2]
+        if self.rotation in (90, 270):
+            rotated_width, rotated_height = height, width
+        else:
+            rotated_width, rotated_height = width, height
+        crop_width, crop_height = self.crop_size or (rotated_width,
+                                                     rotated_height)
+        out_width, out_height = self.out_size or (crop_width, crop_height)
+
+        # Output pixel -> crop pixel (pixel centres line up when scaling)
+        if self.squash:
+            scale_x = out_width / crop_width
+            scale_y = out_height / crop_height
+            runner_x = runner_y = 0
+        else:
+            scale, runner_x, runner_y = runner_crop(crop_width, crop_height,
+                                                    out_width, out_height)
+            scale_x = scale_y = scale
+        to_crop = np.array([[1 / scale_x, 0, (runner_x + 0.5) / scale_x - 0.5],
+                            [0, 1 / scale_y, (runner_y + 0.5) / scale_y - 0.5],
+                            [0, 0, 1]])
+
+        # Crop pixel -> rotated frame pixel -> original frame pixel
+        crop_x = int(rotated_width/2 - crop_width/2)
+        crop_y = int(rotated_height/2 - crop_height/2)
+        to_rotated = np.array([[1, 0, crop_x], [0, 1, crop_y], [0, 0, 1]],
+                              float)
+        to_frame = rotation_matrix(self.rotation, width, height)
+
+        # Shrinking: rotate and crop exactly, then resize like the runner
+        self.crop_plan = None
+        if scale_x < 1 or scale_y < 1:
+            self.crop_plan = GeometryPlan(self.rotation, (crop_width, crop_height))
+            if self.squash:
+                self.resize_size = (out_width, out_height)
+            else:
+                self.resize_size = (int(math.ceil(scale_x * crop_width)),
+                                    int(math.ceil(scale_y * crop_height)))
+            self.resize_view = (runner_y, runner_y + out_height,
+                                runner_x, runner_x + out_width)
+            self.out = np.empty((self.resize_size[1], self.resize_size[0]) +
+                                tuple(frame_shape[2:]), dtype=np.uint8)
+            self.frame_shape = frame_shape
+            return
+
+        matrix = (to_frame @ to_rotated @ to_crop)[:2]
+        self.matrix = matrix
+        scaled = scale_x != 1 or scale_y != 1 or runner_x or runner_y
+        if scaled:
+            self.flags = cv2.WARP_INVERSE_MAP | cv2.INTER_LINEAR
+        else:
+            self.flags = cv2.WARP_INVERSE_MAP | cv2.INTER_NEAREST
+
+        # A plain crop needs no resampling at all
+        self.view = None
+        if self.rotation == 0 and not scaled:
+            x0, y0 = int(matrix[0, 2]), int(matrix[1, 2])
+            if x0 >= 0 and y0 >= 0 and x0 + out_width <= width and \
+                    y0 + out_height <= height:
+                self.view = (y0, y0 + out_height, x0, x0 + out_width)
+
+        self.out = np.empty((out_height, out_width) + tuple(frame_shape[2:]),
+                            dtype=np.uint8)
+        self.frame_shape = frame_shape
+
+    def apply(self, frame):
+        """
+        Returns the transformed frame. The result is either a view of frame
+        (unless copy is set) or a buffer reused by the next call.
+        """
+        if frame.shape != self.frame_shape:
+            self.compile(frame.shape)
+        if self.crop_plan is not None:
+            cv2.resize(self.crop_plan.apply(frame), self.resize_size,
+                       dst=self.out, interpolation=cv2.INTER_AREA)
+            y0, y1, x0, x1 = self.resize_view
+            return self.out[y0:y1, x0:x1]
+        if self.view is not None:
+            y0, y1, x0, x1 = self.view
+            if self.copy:
+                np.copyto(self.out, frame[y0:y1, x0:x1])
+                return self.out
+            return frame[y0:y1, x0:x1]
+        out_height, out_width = self.out.shape[:2]
+        return cv2.warpAffine(frame, self.matrix, (out_width, out_height),
+                              dst=self.out, flags=self.flags,
+                              borderMode=cv2.BORDER_REPLICATE)
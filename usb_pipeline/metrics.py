@@ -0,0 +1,246 @@
+"""
+Prometheus Metrics Endpoint
+
+The live scripts report by printing to the console, which nobody watches on a
+deployed device. MetricsServer serves a Metrics registry as
+http://localhost:<port>/metrics in the Prometheus text format, from a thread
+of its own, so the scripts can be scraped like any other service.
+
+Scraping must never stall the frame loop, so the loop does as little as
+possible for it. Most metrics are read at scrape time from counters the
+pipeline keeps anyway (frames captured and dropped by ThreadedCapture, queue
+depths of StagedPipeline stages, the stage histograms of LoopTimer, copied
+under its lock). What the loop counts itself (predictions per label,
+inference errors) are plain dict increments with no lock; everything is
+formatted on the server thread.
+
+Stage and frame latencies are exported as one histogram family with a stage
+label, in seconds, so inference latency is stage="classify". The server
+listens on 127.0.0.1 only unless another host is given.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import collections, http.server, math, threading
+
+
+def escape(value):
+    """
+    Escapes a label value for the text format
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def labels_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(name + '="' + escape(value) + '"'
+                          for name, value in labels) + "}"
+
+
+def number_text(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """
+    Registry of the metrics to export, each read when scraped
+
+    Metric names get prefix and an underscore in front.
+    """
+
+    def __init__(self, prefix='edge_impulse'):
+        self.prefix = prefix
+        self.families = collections.OrderedDict()  # name: (type, help, collect)
+        self.counts = {}                # Counters kept by inc()
+        self.lock = threading.Lock()
+
+    def add(self, name, kind, help_text, collect):
+        """
+        Adds a metric family. collect() is called when scraped and returns
+        the value, or a dict of label value tuples (label names first) to
+        values. For histograms the value is (cumulative buckets, sum, count).
+        """
+        with self.lock:
+            self.families[self.prefix + "_" + name] = (kind, help_text, collect)
+
+    def counter(self, name, help_text, collect=None, label=None):
+        """
+        Adds a counter, read from collect() or, without it, kept by inc().
+        Counters kept by inc() are labelled by label if it's given, or by
+        several labels if it's a tuple of names (inc() then takes a tuple of
+        values).
+        """
+        if collect is None:
+            self.counts[name] = {}
+            collect = self.labelled(name, label) if label else \
+                (lambda: self.counts[name].get(None, 0))
+        self.add(name, 'counter', help_text, collect)
+
+    def gauge(self, name, help_text, collect):
+        self.add(name, 'gauge', help_text, collect)
+
+    def histogram(self, name, help_text, collect):
+        self.add(name, 'histogram', help_text, collect)
+
+    def labelled(self, name, label):
+        def collect():
+            counts = self.counts[name].copy()
+            if isinstance(label, tuple):
+                return {tuple(zip(label, values)): count
+                        for values, count in counts.items()}
+            return {((label, value),): count for value, count in counts.items()}
+        return collect
+
+    def inc(self, name, value=None, amount=1):
+        """
+        Counts one (or amount) for a counter kept by inc(), under label value
+        value if it's labelled. Called from the frame loop: no lock, no
+        formatting.
+        """
+        counts = self.counts[name]
+        counts[value] = counts.get(value, 0) + amount
+
+    def add_capture(self, camera):
+        """
+        Adds the frame counters and backlog of a ThreadedCapture
+        """
+        self.counter("frames_captured_total", "Frames read from the camera",
+                     lambda: camera.captured)
+        self.counter("frames_dropped_total",
+                     "Frames overwritten before they were processed",
+                     lambda: camera.dropped)
+        self.counter("frames_reused_total",
+                     "Frames processed again because nothing newer was captured",
+                     lambda: camera.reused)
+        self.gauge("capture_pending_frames",
+                   "Frames captured since the loop last read one",
+                   lambda: camera.pending)
+
+    def add_cameras(self, cameras):
+        """
+        Adds the frame counters and backlog of every camera of a MultiCamera,
+        labelled by camera index
+        """
+        def each(read):
+            return lambda: {(('camera', i),): read(camera)
+                            for i, camera in enumerate(cameras.cameras)}
+        self.counter("frames_captured_total", "Frames read from each camera",
+                     each(lambda camera: camera.captured))
+        self.counter("frames_dropped_total",
+                     "Frames overwritten before they were processed",
+                     each(lambda camera: camera.dropped))
+        self.gauge("capture_pending_frames",
+                   "Frames captured since the loop last read one",
+                   each(lambda camera: camera.pending))
+
+    def add_timer(self, timer):
+        """
+        Adds the frames processed and the stage latency histograms of a
+        LoopTimer
+        """
+        self.counter("frames_processed_total", "Frames through the loop",
+                     lambda: timer.frames.count)
+
+        def collect():
+            return {(('stage', name),): histogram
+                    for name, histogram in timer.histograms().items()}
+        self.histogram("stage_seconds", "Time spent in each stage of the loop",
+                       collect)
+
+    def add_pipeline(self, pipeline):
+        """
+        Adds the items, drops and queue depth of every StagedPipeline stage
+        """
+        self.counter("stage_items_total", "Items each stage passed on",
+                     lambda: {(('stage', stage.name),): stage.processed
+                              for stage in pipeline.stages})
+        self.counter("stage_dropped_total",
+                     "Items dropped from the queue in front of each stage",
+                     lambda: {(('stage', stage.name),): stage.dropped
+                              for stage in pipeline.stages[1:]})
+        self.gauge("stage_queue_depth", "Items waiting in front of each stage",
+                   lambda: {(('stage', stage.name),): stage.depth
+                            for stage in pipeline.stages[1:]})
+
+    def render(self):
+        """
+        Returns every metric in the Prometheus text format
+        """
+        with self.lock:
+            families = list(self.families.items())
+        lines = []
+        for name, (kind, help_text, collect) in families:
+            values = collect()
+            if not isinstance(values, dict):
+                values = {(): values}
+            lines.append("# HELP " + name + " " + help_text)
+            lines.append("# TYPE " + name + " " + kind)
+            for labels, value in values.items():
+                if kind != 'histogram':
+                    lines.append(name + labels_text(labels) + " " +
+                                 number_text(value))
+                    continue
+                buckets, total, count = value
+                for bound, below in buckets:
+                    lines.append(name + "_bucket" +
+                                 labels_text(labels + (('le', number_text(bound)),)) +
+                                 " " + str(below))
+                lines.append(name + "_sum" + labels_text(labels) + " " +
+                             number_text(float(total)))
+                lines.append(name + "_count" + labels_text(labels) + " " +
+                             str(count))
+        return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Answers GET /metrics, and 404 for anything else
+    """
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer:
+    """
+    Serves a Metrics registry over HTTP from a thread of its own
+    """
+
+    def __init__(self, metrics, port, host='127.0.0.1'):
+        self.metrics = metrics
+        self.address = (host, port)
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        self.server = http.server.ThreadingHTTPServer(self.address, MetricsHandler)
+        self.server.daemon_threads = True
+        self.server.metrics = self.metrics
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return "http://" + host + ":" + str(port) + "/metrics"
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
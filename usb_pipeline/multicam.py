@@ -0,0 +1,121 @@
+"""
+Multi-Camera Fan-In
+
+Serves several cameras from one process and one model. Each camera keeps its
+own capture thread and ring buffer. The inference loop collects the newest
+frame from every camera that has one into a micro-batch, runs the batch through
+the shared model, and routes each result back to the camera it came from. Per
+camera frame rate and capture-to-result latency are kept as it goes.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import collections, threading, time
+
+from .capture import ThreadedCapture
+
+
+def classify_batch(runner, batch):
+    """
+    Runs a list of model inputs through runner in one go. Backends that can
+    batch provide classify_batch(); the Edge Impulse runner only takes one
+    input at a time, so for it the batch is classified back to back.
+    """
+    if hasattr(runner, 'classify_batch'):
+        return runner.classify_batch(batch)
+    return [runner.classify(item) for item in batch]
+
+
+class CameraStats:
+    """
+    Rolling frame rate and latency of one camera's results
+    """
+
+    def __init__(self, window=100):
+        self.processed = 0
+        self.done_times = collections.deque(maxlen=window)
+        self.latencies = collections.deque(maxlen=window)
+
+    def record(self, captured_at, done_at):
+        self.processed += 1
+        self.done_times.append(done_at)
+        self.latencies.append(done_at - captured_at)
+
+    @property
+    def fps(self):
+        if len(self.done_times) < 2:
+            return 0.0
+        elapsed = self.done_times[-1] - self.done_times[0]
+        return (len(self.done_times) - 1) / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def latency_ms(self):
+        """
+        Mean capture-to-result latency over the window, in milliseconds
+        """
+        if not self.latencies:
+            return 0.0
+        return 1000 * sum(self.latencies) / len(self.latencies)
+
+    @property
+    def max_latency_ms(self):
+        return 1000 * max(self.latencies) if self.latencies else 0.0
+
+
+class MultiCamera:
+    """
+    Fans the frames of several sources in to one inference loop
+
+    sources are opened frame sources (see sources.py). Each one is wrapped in a
+    ThreadedCapture that signals a shared event whenever it has a new frame.
+    """
+
+    def __init__(self, sources, num_slots=3):
+        self.new_frame = threading.Event()
+        self.cameras = [ThreadedCapture(source, num_slots,
+                                        listener=self.new_frame)
+                        for source in sources]
+        self.stats = [CameraStats() for _ in self.cameras]
+        self.start = 0                  # Camera polled first, for fairness
+
+    def next_batch(self, max_batch=None, timeout=1.0):
+        """
+        Waits for new frames and returns a list of (camera_index, frame,
+        captured_at) holding the newest frame of each camera that has one,
+        at most max_batch entries. Returns an empty list if nothing arrived
+        within timeout and None once every camera has ended. A camera's frame
+        stays valid until that camera's next batch.
+        """
+        count = len(self.cameras)
+        max_batch = max_batch or count
+        deadline = time.perf_counter() + timeout
+        while True:
+            self.new_frame.clear()
+            batch = []
+            for n in range(count):
+                i = (self.start + n) % count
+                ret, frame = self.cameras[i].poll()
+                if ret:
+                    batch.append((i, frame, self.cameras[i].frame_time))
+                    if len(batch) == max_batch:
+                        break
+            if batch:
+                self.start = (batch[-1][0] + 1) % count
+                return batch
+            if all(camera.ring.ended for camera in self.cameras):
+                return None
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return []
+            self.new_frame.wait(remaining)
+
+    def done(self, index, captured_at):
+        """
+        Records that the frame captured at captured_at on camera index has
+        its result
+        """
+        self.stats[index].record(captured_at, time.perf_counter())
+
+    def release(self):
+        for camera in self.cameras:
+            camera.release()
@@ -0,0 +1,198 @@
+"""
+Staged Asyncio Pipeline
+
+The live scripts capture, preprocess, classify and display a frame one step
+after another in a while(True) loop, so every step waits for all the others.
+StagedPipeline runs the steps as stages joined by bounded queues instead:
+while the model works on one frame, the next is already being captured and
+preprocessed and the one before is being drawn.
+
+Each stage is a function that takes the item of the stage before it and
+returns the item for the stage after it. Returning None drops the item (for
+the first stage, which takes no argument, it means there are no more). The
+functions block, so each stage runs its function on its own executor thread,
+which also keeps items in order; OpenCV, numpy and runner sockets release the
+GIL while they work. A stage created with inline=True runs in the event loop
+instead, on the main thread, which is where cv2.imshow wants to be.
+
+When a stage's input queue is full, the stage feeding it either waits (policy
+'block') or drops the oldest queued item to make room (policy 'drop-oldest'),
+which keeps latency low when a later stage can't keep up. Every stage counts
+its items and drops, the time it was busy, starved (waiting for input) and
+blocked (waiting for room downstream), and samples the depth of its input
+queue, so stats() shows where the pipeline waits.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import asyncio, concurrent.futures, time
+
+POLICIES = ('block', 'drop-oldest')
+
+# Passed down the queues after the last item
+END = object()
+
+
+class Stage:
+    """
+    One step of a StagedPipeline and the bounded queue in front of it
+    """
+
+    def __init__(self, name, func, queue_size=2, policy='block', inline=False):
+        if policy not in POLICIES:
+            raise ValueError("Unknown queue policy: " + str(policy) +
+                             " (use one of " + ", ".join(POLICIES) + ")")
+        self.name = name
+        self.func = func
+        self.queue_size = queue_size
+        self.policy = policy
+        self.executor = None
+        if not inline:
+            self.executor = concurrent.futures.ThreadPoolExecutor(
+                1, thread_name_prefix=name)
+        self.queue = None
+        self.processed = 0
+        self.dropped = 0
+        self.busy = 0.0
+        self.starved = 0.0
+        self.blocked = 0.0
+        self.depth_total = 0
+        self.depth_samples = 0
+        self.max_depth = 0
+
+    async def call(self, *args):
+        start_time = time.perf_counter()
+        if self.executor is None:
+            result = self.func(*args)
+        else:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self.executor, self.func, *args)
+        self.busy += time.perf_counter() - start_time
+        return result
+
+    async def put(self, item):
+        """
+        Queues an item for this stage, applying the queue policy if it's full
+        """
+        if self.policy == 'drop-oldest':
+            if self.queue.full():
+                self.queue.get_nowait()
+                self.dropped += 1
+            self.queue.put_nowait(item)
+        else:
+            await self.queue.put(item)
+
+    async def get(self):
+        depth = self.queue.qsize()
+        self.depth_total += depth
+        self.depth_samples += 1
+        self.max_depth = max(self.max_depth, depth)
+        start_time = time.perf_counter()
+        item = await self.queue.get()
+        self.starved += time.perf_counter() - start_time
+        return item
+
+    @property
+    def depth(self):
+        return self.queue.qsize() if self.queue is not None else 0
+
+    @property
+    def mean_depth(self):
+        return self.depth_total / self.depth_samples if self.depth_samples else 0.0
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+
+class StagedPipeline:
+    """
+    Runs a list of stages, the first of them the frame source
+
+    Stage functions may call stop() to end the pipeline (e.g. when 'q' is
+    pressed); items already queued are still passed on.
+    """
+
+    def __init__(self, stages):
+        if len(stages) < 2:
+            raise ValueError("A pipeline needs a source and at least one "
+                             "more stage")
+        self.stages = stages
+        self.stopping = False
+        self.elapsed = 0.0
+
+    def stop(self):
+        self.stopping = True
+
+    def run(self):
+        """
+        Runs until the source has no more items or stop() is called
+        """
+        try:
+            asyncio.run(self.run_stages())
+        finally:
+            for stage in self.stages:
+                stage.close()
+
+    async def run_stages(self):
+        for stage in self.stages[1:]:
+            stage.queue = asyncio.Queue(stage.queue_size)
+        start_time = time.perf_counter()
+        source = self.stages[0]
+        tasks = [self.produce(source, self.stages[1])]
+        for stage, downstream in zip(self.stages[1:],
+                                     self.stages[2:] + [None]):
+            tasks.append(self.consume(stage, downstream))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            self.elapsed = time.perf_counter() - start_time
+
+    async def produce(self, source, downstream):
+        while not self.stopping:
+            item = await source.call()
+            if item is None:
+                break
+            source.processed += 1
+            await self.forward(source, downstream, item)
+        await self.forward(source, downstream, END)
+
+    async def consume(self, stage, downstream):
+        while True:
+            item = await stage.get()
+            if item is END:
+                break
+            result = await stage.call(item)
+            if result is None:
+                continue
+            stage.processed += 1
+            if downstream is not None:
+                await self.forward(stage, downstream, result)
+        if downstream is not None:
+            await self.forward(stage, downstream, END)
+
+    async def forward(self, stage, downstream, item):
+        start_time = time.perf_counter()
+        await downstream.put(item)
+        stage.blocked += time.perf_counter() - start_time
+
+    def stats(self):
+        """
+        Returns one line per stage: items, drops, the share of the run time
+        spent busy, starved and blocked, and the depth of its input queue
+        """
+        elapsed = self.elapsed or 1.0
+        lines = []
+        for stage in self.stages:
+            line = (stage.name + ": items " + str(stage.processed) +
+                    " busy " + str(round(stage.busy / elapsed, 3)) +
+                    " starved " + str(round(stage.starved / elapsed, 3)) +
+                    " blocked " + str(round(stage.blocked / elapsed, 3)))
+            if stage.queue is not None:
+                line += (" queue mean " + str(round(stage.mean_depth, 2)) +
+                         " max " + str(stage.max_depth) +
+                         " of " + str(stage.queue_size) +
+                         " dropped " + str(stage.dropped))
+            lines.append(line)
+        return "\n".join(lines)
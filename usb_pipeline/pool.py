@@ -0,0 +1,190 @@
+"""
+Runner Process Pool
+
+A .eim model runs in its own process and works on one request at a time, so
+one runner keeps one core busy however many windows or frames are waiting.
+RunnerPool starts several copies of the model, each in its own process with
+its own FeatureTransport, and spreads the inputs of a batch over them.
+
+Each runner is driven by a worker thread. The threads take inputs from one
+shared queue, so a runner that finishes early takes the next input instead of
+waiting for a fixed share, and they spend their time blocked on the runner's
+socket, where Python doesn't hold the GIL. classify_batch() returns the
+results in input order, so the pool can stand in for a single runner (it has
+the same init/classify/stop interface, and multicam.classify_batch() uses
+its classify_batch()).
+
+Each worker counts the requests it served and the time its runner was busy,
+so utilisation() shows how evenly the load is spread and whether more
+runners would help.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import os, queue, threading, time
+
+from .transport import FeatureTransport
+
+
+class PoolWorker:
+    """
+    One runner, its transport and the thread that feeds it
+    """
+
+    def __init__(self, runner):
+        self.runner = runner
+        self.transport = None
+        self.thread = None
+        self.requests = 0
+        self.busy = 0.0
+
+
+class PendingBatch:
+    """
+    Results of one batch, filled in by the workers as they finish
+    """
+
+    def __init__(self, count):
+        self.results = [None] * count
+        self.error = None
+        self.remaining = count
+        self.lock = threading.Lock()
+        self.finished = threading.Event()
+        if count == 0:
+            self.finished.set()
+
+    def complete(self, index, res=None, error=None):
+        with self.lock:
+            self.results[index] = res
+            if error is not None and self.error is None:
+                self.error = error
+            self.remaining -= 1
+            if self.remaining == 0:
+                self.finished.set()
+
+
+class RunnerPool:
+    """
+    Several copies of a .eim model behind one runner interface
+
+    workers is the number of model processes (None = one per CPU core).
+    runner_class makes a runner from the model path, ImageImpulseRunner by
+    default. Set shared_memory=False to force the JSON protocol.
+    """
+
+    def __init__(self, model_path, workers=None, shared_memory=True,
+                 runner_class=None):
+        if runner_class is None:
+            try:
+                from edge_impulse_linux.image import ImageImpulseRunner
+            except ImportError as e:
+                raise ImportError("RunnerPool needs edge_impulse_linux "
+                                  "(" + str(e) + ")")
+            runner_class = ImageImpulseRunner
+        self.shared_memory = shared_memory
+        self.workers = [PoolWorker(runner_class(model_path))
+                        for _ in range(workers or os.cpu_count() or 1)]
+        self.jobs = queue.Queue()
+        self.model_info = None
+        self.started = None
+
+    def init(self):
+        """
+        Starts every runner (in parallel, as each one takes a while to come
+        up) and returns the model information of the first
+        """
+        infos = [None] * len(self.workers)
+        errors = []
+
+        def start(n, worker):
+            try:
+                infos[n] = worker.runner.init()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=start, args=(n, worker))
+                   for n, worker in enumerate(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            self.stop()
+            raise errors[0]
+
+        self.model_info = infos[0]
+        for worker, info in zip(self.workers, infos):
+            worker.transport = FeatureTransport(worker.runner, info,
+                                                shared_memory=self.shared_memory)
+            worker.thread = threading.Thread(target=self.serve, args=(worker,),
+                                             daemon=True)
+            worker.thread.start()
+        self.started = time.perf_counter()
+        return self.model_info
+
+    def serve(self, worker):
+        """
+        Worker thread: classifies inputs from the shared queue until stopped
+        """
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            pending, index, features = job
+            start_time = time.perf_counter()
+            try:
+                res = worker.transport.classify(features)
+                pending.complete(index, res)
+            except Exception as e:
+                pending.complete(index, error=e)
+            worker.busy += time.perf_counter() - start_time
+            worker.requests += 1
+
+    def classify_batch(self, batch):
+        """
+        Classifies a list of feature vectors across the runners and returns
+        the responses in the same order. The feature vectors must stay
+        unchanged until it returns.
+        """
+        pending = PendingBatch(len(batch))
+        for index, features in enumerate(batch):
+            self.jobs.put((pending, index, features))
+        pending.finished.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.results
+
+    def classify(self, features):
+        return self.classify_batch([features])[0]
+
+    def utilisation(self):
+        """
+        Returns the share of time each runner was busy since init()
+        """
+        if self.started is None:
+            return [0.0] * len(self.workers)
+        elapsed = time.perf_counter() - self.started
+        return [worker.busy / elapsed if elapsed > 0 else 0.0
+                for worker in self.workers]
+
+    def stats(self):
+        """
+        Returns a one-line summary of the requests and utilisation per runner
+        """
+        return " ".join("[" + str(n) + "] requests: " + str(worker.requests) +
+                        " busy: " + str(round(busy, 3))
+                        for n, (worker, busy) in
+                        enumerate(zip(self.workers, self.utilisation())))
+
+    def stop(self):
+        for worker in self.workers:
+            if worker.thread is not None:
+                self.jobs.put(None)
+        for worker in self.workers:
+            if worker.thread is not None:
+                worker.thread.join()
+                worker.thread = None
+            if worker.transport is not None:
+                worker.transport.close()
+                worker.transport = None
+            worker.runner.stop()
@@ -0,0 +1,371 @@
+"""
+Batched SavedModel Classifier
+
+The CNN classifier is also exported from Edge Impulse as a TensorFlow
+SavedModel (the ...-savedmodel-model.zip files in electronic-components-cnn/).
+SavedModelClassifier loads one of those on the CPU and classifies a whole list
+of images with one model call, so the per-call overhead of the .eim runner
+(one socket round trip per image) is paid once per batch. Batches can have any
+size.
+
+Images go through the same steps the runner applies: fit to the model input
+(see GeometryPlan), grayscale (or RGB) and scale to 0..1. The results have the
+runner's layout, res['result']['classification'] with the labels in model
+order, so scripts print them exactly as they print the runner's.
+
+For sliding windows the classifier can also classify a whole grid of
+overlapping windows at once (see window_probabilities): the convolution and
+pooling layers run once over the frame where windows share their input, and
+per window only where a window's zero padding makes it differ from its
+neighbours (see window_axis), so every window gets exactly the probabilities
+it would get on its own.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import json, os, tempfile, time, zipfile
+import cv2
+import numpy as np
+
+from .features import NORMALIZE_LUT
+from .geometry import GeometryPlan
+
+
+def import_tensorflow():
+    try:
+        import tensorflow as tf
+    except ImportError:
+        raise ImportError("Install tensorflow to run SavedModel models")
+    return tf
+
+
+def rebuild_keras_model(model_dir):
+    """
+    Builds the model again from the Keras config stored next to a SavedModel
+    (keras_metadata.pb) and loads its weights. Needed for exports that Keras
+    can't revive directly, e.g. the v2 CNN whose Dropout layers were saved
+    without their call function.
+    """
+    tf = import_tensorflow()
+    with open(os.path.join(model_dir, 'keras_metadata.pb'), 'rb') as f:
+        metadata = f.read().decode('latin-1')
+
+    # The first JSON object in the file describes the whole model
+    start = metadata.index('{"name"')
+    root, _ = json.JSONDecoder().raw_decode(metadata[start:])
+    model = tf.keras.models.model_from_json(json.dumps(
+        {'class_name': root['class_name'], 'config': root['config']}))
+    model.load_weights(os.path.join(model_dir, 'variables', 'variables')) \
+        .assert_existing_objects_matched()
+    return model
+
+
+def load_keras_model(model_path):
+    """
+    Loads a Keras SavedModel from its folder or from the zip Edge Impulse
+    exports (which holds a saved_model/ folder)
+    """
+    tf = import_tensorflow()
+    if not zipfile.is_zipfile(model_path):
+        try:
+            return tf.keras.models.load_model(model_path, compile=False)
+        except ValueError:
+            return rebuild_keras_model(model_path)
+
+    # All weights are read while loading, so the extracted copy can go
+    with tempfile.TemporaryDirectory() as folder:
+        with zipfile.ZipFile(model_path) as archive:
+            archive.extractall(folder)
+        model_dir = folder
+        for root, _, files in os.walk(folder):
+            if 'saved_model.pb' in files:
+                model_dir = root
+                break
+        return load_keras_model(model_dir)
+
+
+def split_classifier(model):
+    """
+    Splits a CNN classifier (convolution and pooling layers, Flatten, then
+    Dense layers) into the layers before Flatten and the Dense layers after it
+
+    Only layers that overlapping windows can share are accepted: stride 1
+    convolutions with 'same' padding and odd kernels, and max pooling whose
+    stride is its square pool size. Dropout does nothing at inference and is
+    left out. Returns the trunk, the head and the trunk's stride: how many
+    input pixels one step on its output map covers.
+    """
+    tf = import_tensorflow()
+    layers = [layer for layer in model.layers
+              if not isinstance(layer, (tf.keras.layers.Dropout,
+                                        tf.keras.layers.InputLayer))]
+    names = [type(layer).__name__ for layer in layers]
+    if 'Flatten' not in names:
+        raise ValueError("Model has no Flatten layer to split at")
+    split = names.index('Flatten')
+    trunk, head = layers[:split], layers[split + 1:]
+    if not head or not all(isinstance(layer, tf.keras.layers.Dense)
+                           for layer in head):
+        raise ValueError("Only Dense layers can follow Flatten")
+
+    stride = 1
+    for layer in trunk:
+        if isinstance(layer, tf.keras.layers.Conv2D):
+            if (layer.strides != (1, 1) or layer.dilation_rate != (1, 1) or
+                    layer.padding != 'same' or layer.groups != 1 or
+                    not all(size % 2 for size in layer.kernel_size)):
+                raise ValueError("Layer " + layer.name + " isn't a stride 1 "
+                                 "'same' convolution with an odd kernel")
+        elif isinstance(layer, tf.keras.layers.MaxPooling2D):
+            size = layer.pool_size[0]
+            if layer.pool_size != (size, size) or layer.strides != (size, size):
+                raise ValueError("Layer " + layer.name + " doesn't pool "
+                                 "square, non-overlapping areas")
+            stride *= size
+        else:
+            raise ValueError("Can't share layer " + layer.name + " (" +
+                             type(layer).__name__ + ") between windows")
+    return trunk, head, stride
+
+
+def window_axis(trunk, axis, count, step, length, size):
+    """
+    Plans the trunk of a classifier along one axis (0 rows, 1 columns) of an
+    input length pixels long, for count windows of size pixels, window w
+    starting at w * step, so that every window gets exactly what it would get
+    on its own
+
+    Overlapping windows see the same pixels but not the same padding: a
+    window's outer positions are computed with zeros past its edge, not with
+    its neighbour's pixels, and each convolution carries that one kernel
+    radius further in. So after every layer the positions that close to a
+    window's edges are kept per window, as (window, index), and only the
+    positions in between are computed once for all windows that cover them.
+
+    Returns one array per layer, row i listing the positions of the layer's
+    input that its output position i reads (len(input) reads a zero), and a
+    count x n array of the positions of each window's n outputs of the last
+    layer.
+    """
+    tf = import_tensorflow()
+    positions = list(range(length))
+    reach = 0                           # Positions from each edge kept per window
+    plans = []
+    for layer in trunk:
+        index = {position: i for i, position in enumerate(positions)}
+        if isinstance(layer, tf.keras.layers.MaxPooling2D):
+            taps = layer.pool_size[axis]
+            scale, offset, out_reach = taps, 0, -(-reach // taps)
+            if size % taps:
+                raise ValueError("Pooling doesn't evenly divide the window")
+        else:
+            taps = layer.kernel_size[axis]
+            scale, offset, out_reach = 1, -(taps // 2), reach + taps // 2
+        out_size = size // scale
+        out_step = step // scale
+
+        def read(w, i):
+            if i < 0 or i >= size:
+                return len(positions)
+            if i < reach or i >= size - reach:
+                return index[(w, i)]
+            return index[w * step + i]
+
+        inner = range(out_reach, out_size - out_reach)
+        edges = [i for i in range(out_size) if i not in inner]
+        shared = sorted({w * out_step + i for w in range(count) for i in inner})
+        own = [(w, i) for w in range(count) for i in edges]
+        rows = [[index[y * scale + offset + t] for t in range(taps)]
+                for y in shared]
+        rows += [[read(w, i * scale + offset + t) for t in range(taps)]
+                 for w, i in own]
+        plans.append(np.array(rows, dtype=np.int32).reshape(-1, taps))
+        positions = shared + own
+        reach, size, step = out_reach, out_size, out_step
+
+    index = {position: i for i, position in enumerate(positions)}
+    last = [[index[(w, i)] if i < reach or i >= size - reach else
+             index[w * step + i] for i in range(size)] for w in range(count)]
+    return plans, np.array(last, dtype=np.int32).reshape(count, size)
+
+
+class SavedModelClassifier:
+    """
+    Classifies batches of BGR images with a SavedModel image classifier
+
+    labels are the class names in model order, the order the .eim runner
+    lists them in (model_parameters['labels']). Like TFLiteDetector it offers
+    init(), classify() and stop(), so it can stand in for the runner.
+    """
+
+    def __init__(self, model_path, labels):
+        tf = import_tensorflow()
+        self.model = load_keras_model(model_path)
+        _, self.height, self.width, self.channels = self.model.input_shape
+        classes = self.model.output_shape[-1]
+        if len(labels) != classes:
+            raise ValueError("Model has " + str(classes) + " classes, got " +
+                             str(len(labels)) + " labels")
+        self.labels = list(labels)
+
+        # Traced once for any batch size, instead of once per size
+        self.predict = tf.function(self.model, input_signature=[
+            tf.TensorSpec((None, self.height, self.width, self.channels),
+                          tf.float32)])
+
+        self.trunk = None               # Split off by window_stride() when needed
+        self.shared = None              # Built by window_probabilities() per layout
+        self.shared_layout = None
+
+        self.geometry = GeometryPlan(0, out_size=(self.width, self.height))
+        self.batch = np.empty((0, self.height, self.width, self.channels),
+                              dtype=np.float32)
+        self.model_info = {
+            'project': {'name': os.path.basename(model_path),
+                        'owner': "(local SavedModel)"},
+            'model_parameters': {
+                'model_type': 'classification',
+                'image_input_width': self.width,
+                'image_input_height': self.height,
+                'image_channel_count': self.channels,
+                'labels': self.labels}}
+
+    def init(self):
+        return self.model_info
+
+    def features(self, images):
+        """
+        Returns the model input for a list of BGR images as one float32 NHWC
+        array. The array is reused by the next call.
+        """
+        if len(images) > len(self.batch):
+            self.batch = np.empty((len(images),) + self.batch.shape[1:],
+                                  dtype=np.float32)
+        for i, img in enumerate(images):
+            self.convert(self.geometry.apply(img), self.batch[i])
+        return self.batch[:len(images)]
+
+    def convert(self, img, out=None):
+        """
+        Converts a BGR image of any size to the model's pixel format: 0..1
+        float32 grayscale or RGB values, height x width x channels. Writes
+        into out if given.
+        """
+        if self.channels == 1:
+            # Same weights on the same channels as the runner's grayscale
+            pixels = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)[..., np.newaxis]
+        else:
+            pixels = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        if out is None:
+            out = np.empty(pixels.shape, dtype=np.float32)
+        np.take(NORMALIZE_LUT, pixels, out=out)
+        return out
+
+    def probabilities(self, batch):
+        """
+        Runs an NHWC float32 batch through the model and returns its
+        probabilities, one row per image and one column per label
+        """
+        return self.predict(np.ascontiguousarray(batch, dtype=np.float32)).numpy()
+
+    def window_stride(self):
+        """
+        Returns the stride of the convolution trunk: windows for
+        window_probabilities() must start a multiple of it apart
+        """
+        if self.trunk is None:
+            self.trunk, self.head, self.trunk_stride = \
+                split_classifier(self.model)
+        return self.trunk_stride
+
+    def window_probabilities(self, pixels, rows, columns, step):
+        """
+        Classifies the rows x columns model-sized windows of pixels (model
+        format, any size, see convert()) whose top left corners are at
+        (r, c) * step and returns their probabilities, one row per window,
+        row by row. The same as classifying each window on its own, with the
+        shared work done once.
+        """
+        if step % self.window_stride():
+            raise ValueError("Windows must be a multiple of " +
+                             str(self.trunk_stride) + " pixels apart")
+        layout = (pixels.shape, rows, columns, step)
+        if layout != self.shared_layout:
+            self.shared = self.shared_windows(*layout)
+            self.shared_layout = layout
+        return self.shared(
+            np.ascontiguousarray(pixels, dtype=np.float32)).numpy()
+
+    def shared_windows(self, shape, rows, columns, step):
+        """
+        Builds the function window_probabilities() runs for one layout
+        """
+        tf = import_tensorflow()
+        row_plans, row_outputs = window_axis(self.trunk, 0, rows, step,
+                                             shape[0], self.height)
+        column_plans, column_outputs = window_axis(self.trunk, 1, columns, step,
+                                                   shape[1], self.width)
+        steps = [(layer, tf.constant(row_plan), tf.constant(column_plan))
+                 for layer, row_plan, column_plan in
+                 zip(self.trunk, row_plans, column_plans)]
+        row_outputs = tf.constant(row_outputs)
+        column_outputs = tf.constant(column_outputs)
+
+        def run(x):
+            for layer, row_plan, column_plan in steps:
+                if isinstance(layer, tf.keras.layers.MaxPooling2D):
+                    x = tf.reduce_max(tf.gather(x, row_plan), axis=1)
+                    x = tf.reduce_max(tf.gather(x, column_plan, axis=1), axis=2)
+                    continue
+                # Patches of column taps x row taps x channels (the order the
+                # kernel is flattened in), zero past the last position
+                x = tf.pad(x, [[0, 1], [0, 1], [0, 0]])
+                x = tf.transpose(tf.gather(x, row_plan), [0, 2, 1, 3])
+                x = tf.gather(x, column_plan, axis=1)
+                kernel = tf.reshape(tf.transpose(layer.kernel, [1, 0, 2, 3]),
+                                    [-1, layer.filters])
+                out = tf.matmul(tf.reshape(x, [-1, kernel.shape[0]]), kernel)
+                if layer.use_bias:
+                    out += layer.bias
+                x = tf.reshape(layer.activation(out),
+                               [len(row_plan), len(column_plan), layer.filters])
+
+            # Each window's feature map, flattened the way Flatten does
+            x = tf.gather(tf.gather(x, row_outputs), column_outputs, axis=2)
+            x = tf.transpose(x, [0, 2, 1, 3, 4])
+            x = tf.reshape(x, [rows * columns, -1])
+            for dense in self.head:
+                x = dense(x)
+            return x
+
+        return tf.function(run, input_signature=[
+            tf.TensorSpec(shape, tf.float32)])
+
+    def classify_batch(self, images):
+        """
+        Classifies a list of BGR images and returns one runner-style result
+        per image
+        """
+        if not len(images):
+            return []
+        start_time = time.perf_counter()
+        batch = self.features(images)
+        features_time = time.perf_counter()
+        probabilities = self.probabilities(batch)
+        end_time = time.perf_counter()
+
+        # Like the runner's, per image
+        timing = {'dsp': int((features_time - start_time) * 1000 / len(images)),
+                  'classification': int((end_time - features_time) * 1000 /
+                                        len(images)),
+                  'anomaly': 0}
+        return [{'result': {'classification':
+                            dict(zip(self.labels, map(float, row)))},
+                 'timing': dict(timing)}
+                for row in probabilities]
+
+    def classify(self, img):
+        return self.classify_batch([img])[0]
+
+    def stop(self):
+        pass
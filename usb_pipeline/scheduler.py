@@ -0,0 +1,144 @@
+"""
+Adaptive Frame Skipping
+
+When inference takes longer than the camera's frame interval, a loop that
+classifies every frame shows every frame late by at least the inference time.
+FrameScheduler holds a latency budget instead: it decides frame by frame
+whether to run inference or to show the frame straight away with the last
+result, from the inference time it measures as it goes.
+
+A frame is inferred if its predicted capture-to-display latency (its age
+now, plus the inference time and the rest of the loop, both smoothed) fits the
+budget. If inference can't fit (a slow model, or a slow frame), frames are
+still inferred, but only as often as the budget allows: over the last window
+frames at most 1 - percentile of them may be shown late. So with percentile
+0.9 the scheduler aims for at least 90% of frames within the budget, and
+spends the rest on inference.
+
+Every shown frame's latency is recorded, and report() gives the effective
+inference rate and the latency percentiles achieved.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import collections, time
+
+import numpy as np
+
+
+class FrameScheduler:
+    """
+    Chooses the frames to run inference on to hold a latency budget
+
+    latency_budget is in seconds. smoothing is the weight of a new sample in
+    the running inference and loop time estimates. The last history frame
+    latencies are kept for the report.
+    """
+
+    def __init__(self, latency_budget, percentile=0.9, window=100,
+                 smoothing=0.2, history=10000):
+        if not 0 < percentile <= 1:
+            raise ValueError("percentile must be in (0, 1], got " +
+                             str(percentile))
+        self.latency_budget = latency_budget
+        self.percentile = percentile
+        self.smoothing = smoothing
+        self.inference_time = None      # Smoothed inference time (s)
+        self.loop_time = 0.0            # Smoothed rest of the loop (s)
+        self.late = collections.deque(maxlen=window)
+        self.latencies = collections.deque(maxlen=history)
+        self.decided_at = None
+        self.last_inference = 0.0
+        self.frames = 0
+        self.inferred = 0
+        self.started = None
+
+    def smooth(self, estimate, sample):
+        if estimate is None:
+            return sample
+        return estimate + self.smoothing * (sample - estimate)
+
+    def predict(self, captured_at, now=None):
+        """
+        Predicted capture-to-display latency of the frame if it is inferred
+        """
+        if now is None:
+            now = time.perf_counter()
+        return now - captured_at + (self.inference_time or 0.0) + self.loop_time
+
+    def should_infer(self, captured_at):
+        """
+        Returns True to run inference on the frame captured at captured_at
+        (a time.perf_counter() timestamp), False to show it with the last
+        result
+        """
+        now = time.perf_counter()
+        if self.started is None:
+            self.started = now
+        self.decided_at = now
+        self.last_inference = 0.0
+
+        # Nothing measured yet, or it fits the budget
+        if self.inference_time is None or \
+                self.predict(captured_at, now) <= self.latency_budget:
+            return True
+
+        # Otherwise only as often as the late frames allowed in the window
+        allowed = (1 - self.percentile) * (len(self.late) + 1)
+        return sum(self.late) + 1 <= allowed
+
+    def record_inference(self, inference_time):
+        """
+        Records how long the inference of the current frame took (s)
+        """
+        self.inference_time = self.smooth(self.inference_time, inference_time)
+        self.last_inference = inference_time
+        self.inferred += 1
+
+    def shown(self, captured_at):
+        """
+        Records that the current frame has been shown
+        """
+        now = time.perf_counter()
+        latency = now - captured_at
+        self.latencies.append(latency)
+        self.late.append(latency > self.latency_budget)
+        self.frames += 1
+        if self.decided_at is not None:
+            loop_time = now - self.decided_at - self.last_inference
+            self.loop_time = self.smooth(self.loop_time, max(loop_time, 0.0))
+        return latency
+
+    @property
+    def inference_rate(self):
+        """
+        Frames inferred per second since the first frame
+        """
+        if self.started is None:
+            return 0.0
+        elapsed = time.perf_counter() - self.started
+        return self.inferred / elapsed if elapsed > 0 else 0.0
+
+    def percentiles(self, points=(50, 90, 99)):
+        """
+        Returns the latency percentiles of the recorded frames, in seconds
+        """
+        if not self.latencies:
+            return [0.0 for _ in points]
+        return list(np.percentile(np.array(self.latencies), points))
+
+    def report(self):
+        """
+        Returns a one-line summary: frames, inference rate and latencies
+        """
+        p50, p90, p99 = self.percentiles()
+        within = 1 - (sum(latency > self.latency_budget
+                          for latency in self.latencies) /
+                      len(self.latencies)) if self.latencies else 0.0
+        return ("frames: " + str(self.frames) +
+                " inferred: " + str(self.inferred) +
+                " inference rate: " + str(round(self.inference_rate, 2)) + "/s" +
+                " latency p50/p90/p99 (ms): " + str(round(p50 * 1000, 1)) +
+                "/" + str(round(p90 * 1000, 1)) +
+                "/" + str(round(p99 * 1000, 1)) +
+                " within budget: " + str(round(within, 3)))
@@ -0,0 +1,295 @@
+"""
+Frame Sources
+
+Everything the live scripts read frames from, behind the same read()/release()
+interface as cv2.VideoCapture. Besides a V4L camera, frames can come from a
+directory of images, a zip of images (read straight from the archive without
+extracting it), a video file or a synthetic generator, so the pipelines can run
+and be benchmarked on a machine without a camera.
+
+Every source takes an fps setting. None reads as fast as possible, which is
+what you want for measuring a pipeline's throughput ceiling. A number paces
+reads to that rate, like a real camera would.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import glob, os, re, time, zipfile
+import cv2
+import numpy as np
+
+# File extensions read by the directory and zip sources
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+
+def natural_key(name):
+    """
+    Sort key that puts "2.png" before "10.png"
+    """
+    return [int(part) if part.isdigit() else part
+            for part in re.split(r'(\d+)', name)]
+
+
+class FrameSource:
+    """
+    Base class for frame sources
+
+    Subclasses implement grab(), which returns the next BGR frame or None when
+    the source is exhausted. If loop is set, finite sources start over instead
+    of ending.
+    """
+
+    def __init__(self, fps=None, loop=False):
+        self.fps = fps
+        self.loop = loop
+        self.frames_read = 0
+        self.next_time = None
+
+    def grab(self):
+        raise NotImplementedError
+
+    def rewind(self):
+        """
+        Goes back to the first frame. Returns False if the source can't.
+        """
+        return False
+
+    def pace(self):
+        """
+        Sleeps until the next frame is due when a frame rate is set
+        """
+        if not self.fps:
+            return
+        now = time.perf_counter()
+        if self.next_time is None or now - self.next_time > 1.0:
+            self.next_time = now
+        elif self.next_time > now:
+            time.sleep(self.next_time - now)
+        self.next_time += 1.0 / self.fps
+
+    def read(self, image=None):
+        """
+        Returns (ret, frame) like cv2.VideoCapture.read(). Like OpenCV, the
+        frame is written into image if it has the right shape, so callers can
+        draw on it without touching the source's own (possibly cached) data.
+        """
+        self.pace()
+        frame = self.grab()
+        if frame is None and self.loop and self.rewind():
+            frame = self.grab()
+        if frame is None:
+            return False, None
+        self.frames_read += 1
+        if image is not None and image.shape == frame.shape:
+            np.copyto(image, frame)
+            return True, image
+        return True, frame.copy()
+
+    def get(self, prop_id):
+        return 0
+
+    def set(self, prop_id, value):
+        return False
+
+    def isOpened(self):
+        return True
+
+    def release(self):
+        pass
+
+
+class V4LSource(FrameSource):
+    """
+    USB camera opened through the V4L backend
+    """
+
+    def __init__(self, device, width, height, fps=None):
+        super().__init__(fps=None)
+        self.camera = cv2.VideoCapture(device, cv2.CAP_V4L)
+        self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        self.camera.set(cv2.CAP_PROP_MODE, 0) # CV_CAP_MODE_BGR
+        if fps:
+            self.camera.set(cv2.CAP_PROP_FPS, fps)
+
+    def read(self, image=None):
+        # The camera paces itself, and can decode into the caller's buffer
+        ret, frame = self.camera.read(image)
+        if ret:
+            self.frames_read += 1
+        return ret, frame
+
+    def get(self, prop_id):
+        return self.camera.get(prop_id)
+
+    def set(self, prop_id, value):
+        return self.camera.set(prop_id, value)
+
+    def isOpened(self):
+        return self.camera.isOpened()
+
+    def release(self):
+        self.camera.release()
+
+
+class ImageListSource(FrameSource):
+    """
+    Base class for sources that step through a list of named images
+
+    With preload set, all images are decoded up front so that reading a frame
+    costs nothing, which keeps file I/O and PNG decode out of benchmarks.
+    """
+
+    def __init__(self, names, fps=None, loop=False, preload=False):
+        super().__init__(fps, loop)
+        if not names:
+            raise ValueError("No images found")
+        self.names = names
+        self.index = 0
+        self.name = None
+        self.cache = [self.load(name) for name in names] if preload else None
+
+    def load(self, name):
+        raise NotImplementedError
+
+    def grab(self):
+        if self.index >= len(self.names):
+            return None
+        self.name = self.names[self.index]
+        if self.cache is not None:
+            frame = self.cache[self.index]
+        else:
+            frame = self.load(self.name)
+        self.index += 1
+        return frame
+
+    def rewind(self):
+        self.index = 0
+        return True
+
+
+class DirectorySource(ImageListSource):
+    """
+    Images in a directory, in natural filename order (0.png, 1.png, ... 10.png)
+    """
+
+    def __init__(self, path, fps=None, loop=False, preload=False):
+        names = [f for f in glob.glob(os.path.join(path, '*'))
+                 if f.lower().endswith(IMAGE_EXTENSIONS)]
+        super().__init__(sorted(names, key=natural_key), fps, loop, preload)
+
+    def load(self, name):
+        return cv2.imread(name, cv2.IMREAD_COLOR)
+
+
+class ZipSource(ImageListSource):
+    """
+    Images inside a zip archive, decoded from memory without extracting them
+
+    The label of an image is the name of the folder it is in, e.g. "led" for
+    electronic-components-png/led/0.png.
+    """
+
+    def __init__(self, path, fps=None, loop=False, preload=False):
+        self.archive = zipfile.ZipFile(path)
+        names = [n for n in self.archive.namelist()
+                 if n.lower().endswith(IMAGE_EXTENSIONS)]
+        super().__init__(sorted(names, key=natural_key), fps, loop, preload)
+
+    def load(self, name):
+        data = np.frombuffer(self.archive.read(name), dtype=np.uint8)
+        return cv2.imdecode(data, cv2.IMREAD_COLOR)
+
+    @property
+    def label(self):
+        """
+        Label of the last image read
+        """
+        if self.name is None:
+            return None
+        return os.path.basename(os.path.dirname(self.name))
+
+    def release(self):
+        self.archive.close()
+
+
+class VideoFileSource(FrameSource):
+    """
+    Frames of a video file
+    """
+
+    def __init__(self, path, fps=None, loop=False):
+        super().__init__(fps, loop)
+        self.video = cv2.VideoCapture(path)
+        if not self.video.isOpened():
+            raise ValueError("Could not open video file: " + path)
+
+    def grab(self):
+        ret, frame = self.video.read()
+        return frame if ret else None
+
+    def rewind(self):
+        return self.video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def get(self, prop_id):
+        return self.video.get(prop_id)
+
+    def release(self):
+        self.video.release()
+
+
+class SyntheticSource(FrameSource):
+    """
+    Generated frames: a bright square bouncing over a noisy grey background
+
+    Frames are written into one preallocated buffer, so generating them is
+    cheap and does not allocate. count limits the number of frames (None
+    means endless).
+    """
+
+    def __init__(self, width, height, fps=None, count=None, size=48, seed=0):
+        super().__init__(fps)
+        self.count = count
+        self.size = min(size, width, height)
+        rng = np.random.default_rng(seed)
+        self.background = rng.integers(100, 140, (height, width, 3),
+                                       dtype=np.uint8)
+        self.frame = np.empty_like(self.background)
+        self.position = np.array([0.0, 0.0])
+        self.velocity = np.array([3.0, 2.0])
+
+    def grab(self):
+        if self.count is not None and self.frames_read >= self.count:
+            return None
+        height, width = self.frame.shape[:2]
+        limits = np.array([width - self.size, height - self.size])
+        self.position += self.velocity
+        for i in range(2):
+            if not 0 <= self.position[i] <= limits[i]:
+                self.velocity[i] = -self.velocity[i]
+                self.position[i] = min(max(self.position[i], 0), limits[i])
+        x, y = self.position.astype(int)
+        np.copyto(self.frame, self.background)
+        self.frame[y:y+self.size, x:x+self.size] = (40, 200, 240)
+        return self.frame
+
+
+def open_source(spec, width, height, fps=None, loop=False, preload=False):
+    """
+    Opens a frame source from a settings string:
+      /dev/videoN        V4L camera
+      synthetic          SyntheticSource
+      path/to/dir        DirectorySource
+      path/to/file.zip   ZipSource
+      path/to/video      VideoFileSource
+    Relative paths are taken from the current directory.
+    """
+    if spec.startswith('/dev/video'):
+        return V4LSource(spec, width, height, fps)
+    if spec == 'synthetic':
+        return SyntheticSource(width, height, fps)
+    if os.path.isdir(spec):
+        return DirectorySource(spec, fps, loop, preload)
+    if spec.lower().endswith('.zip'):
+        return ZipSource(spec, fps, loop, preload)
+    return VideoFileSource(spec, fps, loop)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+"""
+Stand-In Model Runner
+
+A small program that speaks the same Unix socket protocol as an Edge Impulse
+.eim model file, so runners, transports and pipelines can be exercised on a
+machine without a trained model. Pass it to ImpulseRunner / ImageImpulseRunner
+in place of modelfile.eim. Like a .eim, it is started with the socket path as
+its only argument.
+
+It answers hello with model parameters, offers a shared memory block for
+features (features_shm), and answers both classify (JSON feature list) and
+classify_shm requests. The "model" is a fixed function of the feature values,
+so both transports must give identical results for identical features.
+
+Environment variables:
+  STANDIN_SHM=0            Don't offer shared memory (JSON protocol only)
+  STANDIN_TYPE             "classification" (default) or "object-detection"
+  STANDIN_WIDTH/HEIGHT     Model input size (default 96x96)
+  STANDIN_CHANNELS         1 or 3 (default 3)
+  STANDIN_DELAY_MS         Simulated inference time per request (default 0)
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import json, math, os, socket, sys, time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+LABELS = ['background', 'capacitor', 'diode', 'led', 'resistor']
+
+
+def model_info(width, height, channels, model_type, shm):
+    """
+    Returns the hello response
+    """
+    info = {
+        'project': {'name': 'Stand-in runner', 'owner': 'local', 'id': 0},
+        'model_parameters': {
+            'image_input_width': width,
+            'image_input_height': height,
+            'image_channel_count': channels,
+            'input_features_count': width * height,
+            'labels': LABELS,
+            'label_count': len(LABELS),
+            'sensor': 3,
+            'model_type': model_type,
+        },
+    }
+    if shm is not None:
+        info['features_shm'] = {
+            'name': '/' + shm.name,
+            'type': 'float32',
+            'elements': width * height,
+        }
+    return info
+
+
+def run_model(features, width, height, model_type):
+    """
+    Deterministic stand-in for inference. Scores each label by how close the
+    mean feature value is to that label's position in [0, 1].
+    """
+    features = np.asarray(features, dtype=np.float64)
+    if features.size and features.max() > 1.0:
+        # Packed 0xRRGGBB pixels, as produced by get_features_from_image
+        packed = features.astype(np.int64)
+        features = ((packed >> 16) + ((packed >> 8) & 0xFF) +
+                    (packed & 0xFF)) / (3 * 255)
+    mean = float(features.mean()) if features.size else 0.0
+    scores = [math.exp(-20 * (mean - i / (len(LABELS) - 1)) ** 2)
+              for i in range(len(LABELS))]
+    total = sum(scores)
+    classification = {label: score / total
+                      for label, score in zip(LABELS, scores)}
+    if model_type != 'object-detection':
+        return {'classification': classification}
+    label = max(classification, key=classification.get)
+    return {'bounding_boxes': [{
+        'label': label,
+        'value': classification[label],
+        'x': width // 4,
+        'y': height // 4,
+        'width': width // 2,
+        'height': height // 2,
+    }]}
+
+
+def serve(socket_path):
+    width = int(os.environ.get('STANDIN_WIDTH', 96))
+    height = int(os.environ.get('STANDIN_HEIGHT', 96))
+    channels = int(os.environ.get('STANDIN_CHANNELS', 3))
+    model_type = os.environ.get('STANDIN_TYPE', 'classification')
+    delay = float(os.environ.get('STANDIN_DELAY_MS', 0)) / 1000
+
+    shm = None
+    features = None
+    if os.environ.get('STANDIN_SHM', '1') != '0':
+        shm = shared_memory.SharedMemory(create=True, size=width * height * 4)
+        features = np.ndarray((width * height,), dtype=np.float32,
+                              buffer=shm.buf)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(1)
+    decoder = json.JSONDecoder()
+    try:
+        client, _ = server.accept()
+        data = ""
+        while True:
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            data += chunk.decode('utf-8')
+
+            # Requests are bare JSON objects, possibly split across chunks
+            while data:
+                try:
+                    msg, end = decoder.raw_decode(data.lstrip())
+                except ValueError:
+                    break
+                data = data.lstrip()[end:]
+
+                resp = {'id': msg.get('id'), 'success': True}
+                start = time.perf_counter()
+                if 'hello' in msg:
+                    resp.update(model_info(width, height, channels,
+                                           model_type, shm))
+                elif 'classify' in msg or 'classify_shm' in msg:
+                    if 'classify_shm' in msg:
+                        values = features[:msg['classify_shm']['elements']]
+                    else:
+                        values = msg['classify']
+                    time.sleep(delay)
+                    resp['result'] = run_model(values, width, height,
+                                               model_type)
+                    resp['timing'] = {
+                        'dsp': 0,
+                        'classification': int(1000 * (time.perf_counter() -
+                                                      start)),
+                        'anomaly': 0,
+                    }
+                else:
+                    resp = {'id': msg.get('id'), 'success': False,
+                            'error': 'Unknown request'}
+                client.sendall(json.dumps(resp).encode('utf-8') + b'\x00')
+    finally:
+        server.close()
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+
+
+if __name__ == '__main__':
+    serve(sys.argv[1])
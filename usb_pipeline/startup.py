@@ -0,0 +1,96 @@
+"""
+Concurrent Cold Start
+
+The live scripts used to start up one step at a time: start the model and
+wait for it, then open the camera, negotiate its format and wait for the
+first frame. On a USB camera and a .eim model both halves can take seconds,
+and neither needs the other. ConcurrentStartup runs each half on a thread of
+its own and times the phases inside them, so start-up takes as long as the
+slower half instead of both together.
+
+report() breaks the time to the first shown result down by phase: when each
+started and ended (seconds since start-up began) and how long it took, the
+time the same phases would have taken one after the other, and the time to
+each marked moment such as the first result.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import contextlib, threading, time
+
+
+class ConcurrentStartup:
+    """
+    Runs start-up steps concurrently and records how long their phases took
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.lock = threading.Lock()
+        self.phases = []                # (name, start, end), seconds since origin
+        self.marks = []                 # (name, time since origin)
+        self.threads = {}
+        self.results = {}
+        self.errors = {}
+
+    def start(self, name, func, *args):
+        """
+        Runs func(*args) on a thread of its own; result(name) returns what
+        it returned
+        """
+        def run():
+            try:
+                self.results[name] = func(*args)
+            except BaseException as e:
+                self.errors[name] = e
+
+        thread = threading.Thread(target=run, name=name, daemon=True)
+        self.threads[name] = thread
+        thread.start()
+
+    def result(self, name):
+        """
+        Waits for the step to finish and returns its result, or raises the
+        exception it raised
+        """
+        self.threads[name].join()
+        if name in self.errors:
+            raise self.errors[name]
+        return self.results[name]
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Times the statements in a with block as one phase
+        """
+        start = time.perf_counter() - self.origin
+        try:
+            yield
+        finally:
+            end = time.perf_counter() - self.origin
+            with self.lock:
+                self.phases.append((name, start, end))
+
+    def mark(self, name):
+        """
+        Records a moment, such as the first result shown. Only the first mark
+        of each name is kept.
+        """
+        with self.lock:
+            if all(mark[0] != name for mark in self.marks):
+                self.marks.append((name, time.perf_counter() - self.origin))
+
+    def report(self):
+        """
+        Returns a line per phase and mark, and the serial total
+        """
+        lines = []
+        for name, start, end in sorted(self.phases, key=lambda phase: phase[1]):
+            lines.append(" " + name.ljust(16) + str(round(start, 3)).rjust(7) +
+                         " -> " + str(round(end, 3)).rjust(7) + " s  (" +
+                         str(round(end - start, 3)) + " s)")
+        serial = sum(end - start for name, start, end in self.phases)
+        lines.append(" " + "one at a time".ljust(16) + str(round(serial, 3)).rjust(18) + " s")
+        for name, at in self.marks:
+            lines.append(" " + name.ljust(16) + str(round(at, 3)).rjust(18) + " s")
+        return "\n".join(lines)
@@ -0,0 +1,198 @@
+"""
+Quantized TensorFlow Lite Input
+
+The int8 detection model in electronic-components-object_detection/ takes its
+input as int8 numbers with scale 1/255 and zero point -128. A camera pixel p
+becomes the float p / 255, which quantizes to round((p / 255) * 255) - 128, so
+the whole float round trip is just p - 128.
+
+QuantizedImageInput uses that: it converts the model-sized BGR image to RGB
+straight into the interpreter's own input tensor and maps the pixel values to
+their quantized form with a 256-entry lookup table, in place. No float image or
+packed feature array is made. For models whose input is uint8 with scale 1/255
+and zero point 0 the lookup is skipped altogether.
+
+TFLiteDetector runs that model in this process instead of in an .eim runner
+subprocess, so no features cross a socket and no second process is kept
+alive. TFLite runs it on the CPU with its default XNNPACK delegate, spread over
+num_threads threads. The model is a FOMO-style detector: it outputs a grid of
+class probabilities (one cell per 8x8 input pixels, class 0 is background),
+which is turned into the same bounding_boxes list the runner returns.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import os, time
+import cv2
+import numpy as np
+
+
+def load_interpreter(model_path, num_threads=None):
+    """
+    Returns an allocated TFLite interpreter for model_path, from tflite_runtime
+    if it is installed or else from TensorFlow. It uses num_threads threads,
+    by default one per CPU core.
+    """
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tensorflow.lite import Interpreter
+        except ImportError:
+            raise ImportError("Install tflite-runtime (or tensorflow) to run "
+                              ".lite models in-process")
+    interpreter = Interpreter(model_path=model_path,
+                              num_threads=num_threads or os.cpu_count())
+    interpreter.allocate_tensors()
+    return interpreter
+
+
+def quantize(values, scale, zero_point, dtype):
+    """
+    Quantizes float values the way TFLite does: round(x / scale) + zero_point,
+    clipped to the range of dtype
+    """
+    limits = np.iinfo(dtype)
+    q = np.round(np.asarray(values, dtype=np.float32) / scale) + zero_point
+    return np.clip(q, limits.min, limits.max).astype(dtype)
+
+
+class QuantizedImageInput:
+    """
+    Writes uint8 BGR images into the quantized image input of a TFLite model
+
+    The image must already have the model's input size (see GeometryPlan).
+    Call it with the image, then interpreter.invoke().
+    """
+
+    def __init__(self, interpreter, input_index=0):
+        detail = interpreter.get_input_details()[input_index]
+        if detail['dtype'] not in (np.int8, np.uint8):
+            raise ValueError("Model input is not quantized: " +
+                             str(detail['dtype']))
+        self.interpreter = interpreter
+        self.index = detail['index']
+        self.dtype = detail['dtype']
+        _, self.height, self.width, self.channels = detail['shape']
+        self.scale, self.zero_point = detail['quantization']
+
+        # Pixel -> quantized value of pixel / 255, as the raw byte
+        lut = quantize(np.arange(256) / 255, self.scale, self.zero_point,
+                       self.dtype)
+        self.lut = lut.view(np.uint8)
+        self.identity = bool(np.all(self.lut == np.arange(256)))
+
+    def __call__(self, img):
+        # A view of the tensor's memory; it must not outlive this call, or the
+        # interpreter refuses to invoke
+        raw = self.interpreter.tensor(self.index)()[0].view(np.uint8)
+        if self.channels == 1:
+            cv2.cvtColor(img, cv2.COLOR_BGR2GRAY,
+                         dst=raw.reshape(self.height, self.width))
+        else:
+            cv2.cvtColor(img, cv2.COLOR_BGR2RGB, dst=raw)
+        if not self.identity:
+            cv2.LUT(raw, self.lut, dst=raw)
+
+    def set_float(self, img):
+        """
+        Reference path: scales the image to 0..1 floats and quantizes those,
+        as a float pipeline in front of the model would
+        """
+        if self.channels == 1:
+            pixels = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)[..., np.newaxis]
+        else:
+            pixels = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        values = pixels.astype(np.float32) / 255
+        self.interpreter.set_tensor(self.index, quantize(
+            values, self.scale, self.zero_point, self.dtype)[np.newaxis])
+
+
+def grid_boxes(probabilities, labels, threshold, width, height):
+    """
+    Turns a FOMO output grid (rows x columns x classes, class 0 background)
+    into bounding boxes in pixels of the width x height model input.
+    Neighbouring cells of the same class above threshold make one box, scored
+    with the highest probability among them.
+    """
+    rows, columns = probabilities.shape[:2]
+    cell_width = width / columns
+    cell_height = height / rows
+    boxes = []
+    for c in range(1, probabilities.shape[2]):
+        mask = (probabilities[..., c] >= threshold).astype(np.uint8)
+        if not mask.any():
+            continue
+        count, regions, stats, _ = cv2.connectedComponentsWithStats(mask)
+        for region in range(1, count):
+            x, y, w, h = stats[region, :4]
+            score = probabilities[..., c][regions == region].max()
+            boxes.append({'label': labels[c - 1],
+                          'value': float(score),
+                          'x': int(round(x * cell_width)),
+                          'y': int(round(y * cell_height)),
+                          'width': int(round(w * cell_width)),
+                          'height': int(round(h * cell_height))})
+    return boxes
+
+
+class TFLiteDetector:
+    """
+    Runs the int8 FOMO detection model (.lite) in-process
+
+    Follows the parts of ImageImpulseRunner the live detection script uses:
+    init() returns a model_info dictionary, classify(img) takes the BGR image
+    at the model's input size (not packed features) and returns {'result':
+    {'bounding_boxes': [...]}, 'timing': {...}}, and stop() does nothing.
+    labels are the object classes in training order (without background);
+    without them boxes are labelled by class number.
+    """
+
+    def __init__(self, model_path, labels=None, threshold=0.5,
+                 num_threads=None):
+        self.interpreter = load_interpreter(model_path, num_threads)
+        self.input = QuantizedImageInput(self.interpreter)
+        output = self.interpreter.get_output_details()[0]
+        self.output_index = output['index']
+        self.output_scale, self.output_zero_point = output['quantization']
+        classes = output['shape'][-1] - 1
+        self.labels = list(labels or [str(c) for c in range(1, classes + 1)])
+        if len(self.labels) != classes:
+            raise ValueError("Model detects " + str(classes) + " classes, got " +
+                             str(len(self.labels)) + " labels")
+        self.threshold = threshold
+        self.model_info = {
+            'project': {'name': os.path.basename(model_path),
+                        'owner': "(local TFLite model)"},
+            'model_parameters': {
+                'model_type': 'constrained_object_detection',
+                'image_input_width': self.input.width,
+                'image_input_height': self.input.height,
+                'image_channel_count': self.input.channels,
+                'labels': self.labels,
+                'threshold': threshold}}
+
+    def init(self):
+        return self.model_info
+
+    def classify(self, img):
+        start_time = time.perf_counter()
+        self.input(img)
+        input_time = time.perf_counter()
+        self.interpreter.invoke()
+        invoke_time = time.perf_counter()
+
+        grid = self.interpreter.get_tensor(self.output_index)[0]
+        probabilities = (grid.astype(np.float32) - self.output_zero_point) * \
+            self.output_scale
+        boxes = grid_boxes(probabilities, self.labels, self.threshold,
+                           self.input.width, self.input.height)
+        end_time = time.perf_counter()
+        return {'result': {'bounding_boxes': boxes},
+                'timing': {'dsp': int((input_time - start_time) * 1000),
+                           'classification': int((invoke_time - input_time) * 1000),
+                           'anomaly': 0,
+                           'postprocessing': int((end_time - invoke_time) * 1000)}}
+
+    def stop(self):
+        pass
@@ -0,0 +1,221 @@
+"""
+Per-Stage Loop Timing
+
+The live scripts used to show 1 / frame_time of the last frame as their FPS,
+with frame_time taken after camera.read() and before waitKey, so it left out
+capture and display and jumped around from frame to frame. LoopTimer times
+every stage of a loop instead (read, rotate, colour convert, features,
+classify, draw, show) and keeps a LatencyHistogram per stage.
+
+Each histogram keeps the last window samples for rolling p50/p95/p99, and
+counts every sample into fixed cumulative buckets (the kind a Prometheus
+histogram exports). frame() is called before the loop and at the end of every
+iteration; the time between calls gives the frame time, and a true wall-clock
+throughput (frames over the time they took, across the window), which is what
+fps reports.
+
+runner_split() splits a classify call against the runner's own res['timing']
+(dsp, classification, anomaly and postprocessing, in ms), with what is left
+of the call recorded as 'runner overhead': the IPC, (de)serialization and
+transport time the model itself doesn't count.
+
+All methods take a lock, so the timings can be read (snapshot(), report())
+from another thread while the loop runs. report() is printed on exit, and
+dump() writes the snapshot as JSON.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import collections, contextlib, json, threading, time
+
+import numpy as np
+
+# Bucket upper bounds in seconds, 0.5 ms to 2.5 s
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+           0.5, 1.0, 2.5)
+
+# Stages of res['timing'] reported by the runner (ms)
+RUNNER_STAGES = ('dsp', 'classification', 'anomaly', 'postprocessing')
+
+
+class LatencyHistogram:
+    """
+    Rolling percentiles over the last window samples, plus cumulative
+    bucket counts, total and count of every sample
+    """
+
+    def __init__(self, window=1000, buckets=BUCKETS):
+        self.samples = collections.deque(maxlen=window)
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)    # Last one is +Inf
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.counts[np.searchsorted(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def percentiles(self, points=(50, 95, 99)):
+        """
+        Returns the percentiles of the samples in the window, in seconds
+        """
+        if not self.samples:
+            return [0.0 for _ in points]
+        return [float(p) for p in np.percentile(np.array(self.samples), points)]
+
+    def cumulative(self):
+        """
+        Returns (upper bound, samples at or below it) pairs, ending with
+        infinity and the count
+        """
+        bounds = self.buckets + (float('inf'),)
+        return list(zip(bounds, np.cumsum(self.counts).tolist()))
+
+
+class LoopTimer:
+    """
+    Times the stages of a live loop and its frames
+
+    window is the number of recent samples the percentiles and the
+    throughput are taken over.
+    """
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.lock = threading.Lock()
+        self.stages = collections.OrderedDict()
+        self.frames = LatencyHistogram(window)
+        self.frame_times = collections.deque(maxlen=window)
+        self.started = None
+
+    def add(self, name, seconds):
+        """
+        Records one sample of a stage
+        """
+        with self.lock:
+            if name not in self.stages:
+                self.stages[name] = LatencyHistogram(self.window)
+            self.stages[name].add(seconds)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Times the statements in a with block as one sample of a stage
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def runner_split(self, res, seconds, name='runner'):
+        """
+        Splits a classify call that took seconds against the runner's own
+        res['timing']
+        """
+        timing = (res or {}).get('timing')
+        if not timing:
+            return
+        reported = 0.0
+        for key in RUNNER_STAGES:
+            if key in timing:
+                self.add(name + " " + key, timing[key] / 1000)
+                reported += timing[key] / 1000
+        self.add(name + " overhead", max(seconds - reported, 0.0))
+
+    def frame(self):
+        """
+        Marks the end of a loop iteration (and the start of the next); call
+        it once before the loop as well
+        """
+        now = time.perf_counter()
+        with self.lock:
+            if self.frame_times:
+                self.frames.add(now - self.frame_times[-1])
+            else:
+                self.started = now
+            self.frame_times.append(now)
+
+    @property
+    def fps(self):
+        """
+        Frames per second over the window, by the wall clock
+        """
+        with self.lock:
+            if len(self.frame_times) < 2:
+                return 0.0
+            elapsed = self.frame_times[-1] - self.frame_times[0]
+            return (len(self.frame_times) - 1) / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def elapsed(self):
+        """
+        Seconds from the first frame to the last
+        """
+        with self.lock:
+            if self.started is None:
+                return 0.0
+            return self.frame_times[-1] - self.started
+
+    def histograms(self):
+        """
+        Returns the histograms of the frames and of every stage as a dict of
+        name: (cumulative buckets, total, count), copied under the lock
+        """
+        with self.lock:
+            return collections.OrderedDict(
+                (name, (histogram.cumulative(), histogram.total, histogram.count))
+                for name, histogram in [('frame', self.frames)] +
+                list(self.stages.items()))
+
+    def snapshot(self):
+        """
+        Returns the timings as a dict: frames, throughput, and count, mean
+        and p50/p95/p99 of every stage (ms)
+        """
+        fps, elapsed = self.fps, self.elapsed
+        with self.lock:
+            stages = collections.OrderedDict()
+            for name, histogram in [('frame', self.frames)] + list(self.stages.items()):
+                p50, p95, p99 = histogram.percentiles()
+                mean = histogram.total / histogram.count if histogram.count else 0.0
+                stages[name] = {
+                    'count': histogram.count,
+                    'mean_ms': round(mean * 1000, 3),
+                    'p50_ms': round(p50 * 1000, 3),
+                    'p95_ms': round(p95 * 1000, 3),
+                    'p99_ms': round(p99 * 1000, 3),
+                }
+            return {
+                'frames': self.frames.count,
+                'elapsed_s': round(elapsed, 3),
+                'fps': round(fps, 3),
+                'stages': stages,
+            }
+
+    def report(self):
+        """
+        Returns a line per stage with its p50/p95/p99 and mean (ms), after a
+        line with the frames and throughput
+        """
+        snapshot = self.snapshot()
+        lines = [" frames: " + str(snapshot['frames']) +
+                 " in " + str(snapshot['elapsed_s']) + " s" +
+                 " throughput: " + str(snapshot['fps']) + " FPS",
+                 " " + "stage".ljust(24) + "p50/p95/p99 (ms)".rjust(24) +
+                 "mean".rjust(10)]
+        for name, stats in snapshot['stages'].items():
+            lines.append(" " + name.ljust(24) +
+                         (str(stats['p50_ms']) + "/" + str(stats['p95_ms']) +
+                          "/" + str(stats['p99_ms'])).rjust(24) +
+                         str(stats['mean_ms']).rjust(10))
+        return "\n".join(lines)
+
+    def dump(self, path):
+        """
+        Writes the snapshot to a JSON file
+        """
+        with open(path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
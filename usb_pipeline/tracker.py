@@ -0,0 +1,199 @@
+"""
+Bounding Box Tracker
+
+Detections only change when the model runs, so boxes drawn straight from
+res['result']['bounding_boxes'] jump at inference rate and blink when an
+object is missed for a frame. BoxTracker keeps a track per object instead and
+can be asked for boxes on every frame:
+
+- each track has a constant-velocity Kalman filter over its box centre and
+  size, so between inference frames boxes move on with the object
+- new detections are matched to tracks of the same label by IoU (greedily,
+  best overlap first) and correct their filters; unmatched detections start
+  new tracks
+- each track keeps the ID it was given, and is dropped after max_missed
+  inference frames without a detection
+
+Time is taken from the caller (time.perf_counter() by default), so the model
+can run at a few Hz while the boxes are predicted at the camera's frame rate.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import time
+
+import numpy as np
+
+
+def iou(a, b):
+    """
+    Intersection over union of two (x, y, w, h) boxes
+    """
+    x0 = max(a[0], b[0])
+    y0 = max(a[1], b[1])
+    x1 = min(a[0] + a[2], b[0] + b[2])
+    y1 = min(a[1] + a[3], b[1] + b[3])
+    overlap = max(0.0, x1 - x0) * max(0.0, y1 - y0)
+    union = a[2] * a[3] + b[2] * b[3] - overlap
+    return overlap / union if union > 0 else 0.0
+
+
+class Track:
+    """
+    One tracked object: a Kalman filter over (cx, cy, w, h) and their rates
+    """
+
+    # Measurement: the box, without the rates
+    H = np.hstack([np.eye(4), np.zeros((4, 4))])
+
+    def __init__(self, track_id, bbox, now, position_noise, velocity_noise,
+                 measurement_noise):
+        self.id = track_id
+        self.label = bbox['label']
+        self.value = bbox['value']
+        self.time = now
+        self.hits = 1
+        self.missed = 0
+        self.position_noise = position_noise
+        self.velocity_noise = velocity_noise
+        self.R = np.eye(4) * measurement_noise ** 2
+        self.x = np.zeros(8)
+        self.x[:4] = self.measure(bbox)
+        self.P = np.diag([measurement_noise ** 2] * 4 +
+                         [(10 * velocity_noise) ** 2] * 4)
+
+    @staticmethod
+    def measure(bbox):
+        return np.array([bbox['x'] + bbox['width'] / 2,
+                         bbox['y'] + bbox['height'] / 2,
+                         bbox['width'], bbox['height']], dtype=np.float64)
+
+    def state_at(self, now):
+        """
+        Returns the predicted state and covariance at time now
+        """
+        dt = max(now - self.time, 0.0)
+        F = np.eye(8)
+        F[:4, 4:] = np.eye(4) * dt
+        Q = np.diag([(self.position_noise * dt) ** 2] * 4 +
+                    [(self.velocity_noise * dt) ** 2] * 4)
+        return F @ self.x, F @ self.P @ F.T + Q
+
+    def predict(self, now):
+        self.x, self.P = self.state_at(now)
+        self.x[2:4] = np.maximum(self.x[2:4], 1.0)
+        self.time = now
+
+    def correct(self, bbox):
+        z = self.measure(bbox)
+        S = self.H @ self.P @ self.H.T + self.R
+        K = self.P @ self.H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ (z - self.H @ self.x)
+        self.P = (np.eye(8) - K @ self.H) @ self.P
+        self.value = bbox['value']
+        self.hits += 1
+        self.missed = 0
+
+    def box(self, now=None):
+        """
+        Returns (x, y, w, h) of the track, predicted to now if given
+        """
+        x = self.x if now is None else self.state_at(now)[0]
+        cx, cy, w, h = x[:4]
+        w = max(w, 1.0)
+        h = max(h, 1.0)
+        return (cx - w / 2, cy - h / 2, w, h)
+
+
+class BoxTracker:
+    """
+    Tracks detected objects across frames and gives them stable IDs
+
+    iou_threshold is the least overlap for a detection to continue a track.
+    It is low because at a few Hz an object moves a good part of its size
+    between detections, more so when it turns (where a constant-velocity
+    filter overshoots). Tracks are shown once they have min_hits detections
+    and dropped after max_missed inference frames in a row without one. The
+    noise settings are in pixels (per second for the rates).
+    """
+
+    def __init__(self, iou_threshold=0.1, max_missed=2, min_hits=1,
+                 position_noise=20.0, velocity_noise=50.0,
+                 measurement_noise=4.0):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.min_hits = min_hits
+        self.position_noise = position_noise
+        self.velocity_noise = velocity_noise
+        self.measurement_noise = measurement_noise
+        self.tracks = []
+        self.next_id = 1
+
+    def update(self, bboxes, now=None):
+        """
+        Takes the bounding boxes of an inference frame (runner format) and
+        returns the tracked boxes
+        """
+        if now is None:
+            now = time.perf_counter()
+        for track in self.tracks:
+            track.predict(now)
+
+        # Greedy matching, best overlap first, same label only
+        pairs = []
+        for t, track in enumerate(self.tracks):
+            box = track.box()
+            for d, bbox in enumerate(bboxes):
+                if bbox['label'] != track.label:
+                    continue
+                overlap = iou(box, (bbox['x'], bbox['y'],
+                                    bbox['width'], bbox['height']))
+                if overlap >= self.iou_threshold:
+                    pairs.append((overlap, t, d))
+        pairs.sort(reverse=True)
+        matched_tracks = set()
+        matched_boxes = set()
+        for overlap, t, d in pairs:
+            if t in matched_tracks or d in matched_boxes:
+                continue
+            self.tracks[t].correct(bboxes[d])
+            matched_tracks.add(t)
+            matched_boxes.add(d)
+
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.missed += 1
+        self.tracks = [track for track in self.tracks
+                       if track.missed <= self.max_missed]
+        for d, bbox in enumerate(bboxes):
+            if d not in matched_boxes:
+                self.tracks.append(Track(self.next_id, bbox, now,
+                                         self.position_noise,
+                                         self.velocity_noise,
+                                         self.measurement_noise))
+                self.next_id += 1
+        return self.boxes(now)
+
+    def boxes(self, now=None):
+        """
+        Returns the tracked boxes predicted to now, in the runner's format
+        with an added 'id'. Doesn't change the tracks, so it can be called on
+        every frame between updates.
+        """
+        if now is None:
+            now = time.perf_counter()
+        result = []
+        for track in self.tracks:
+            if track.hits < self.min_hits:
+                continue
+            x, y, w, h = track.box(now)
+            result.append({
+                'id': track.id,
+                'label': track.label,
+                'value': track.value,
+                'x': int(round(x)),
+                'y': int(round(y)),
+                'width': int(round(w)),
+                'height': int(round(h)),
+            })
+        return result
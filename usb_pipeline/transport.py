@@ -0,0 +1,78 @@
+"""
+Shared Memory Feature Transport
+
+By default ImpulseRunner.classify() sends every feature vector to the .eim
+process as a JSON list of numbers over its Unix socket. For image models that
+is thousands of numbers formatted as text and parsed again on every frame,
+which can cost more than running a small model.
+
+Models that support it advertise a shared memory block (features_shm) in their
+hello response. FeatureTransport writes features straight into that block and
+only sends a short classify_shm request with the number of elements. Models
+that don't advertise one keep using the JSON protocol, so the scripts can use
+the transport unconditionally.
+
+Recent versions of the Edge Impulse SDK already use the shared memory block on
+their own; in that case classify() hands the features to the SDK unchanged.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+
+class FeatureTransport:
+    """
+    Sends classify requests to an initialized ImpulseRunner
+
+    model_info is the dictionary returned by runner.init(). Set
+    shared_memory=False to force the JSON protocol.
+    """
+
+    def __init__(self, runner, model_info, shared_memory=True):
+        self.runner = runner
+        self.shm = None
+        self.array = None
+        if getattr(runner, '_input_shm', None):
+            self.mode = 'sdk-shm'
+        elif shared_memory and 'features_shm' in model_info:
+            self.open_shm(model_info['features_shm'])
+            self.mode = 'shm'
+        else:
+            self.mode = 'json'
+
+    def open_shm(self, info):
+        if info.get('type', 'float32') != 'float32':
+            raise ValueError("Unsupported shared memory type: " + info['type'])
+
+        # Python wants the name without the leading slash
+        self.shm = shared_memory.SharedMemory(name=info['name'].lstrip('/'))
+
+        # The runner owns the block; don't let our resource tracker unlink it
+        resource_tracker.unregister(self.shm._name, "shared_memory")
+        self.array = np.ndarray((info['elements'],), dtype=np.float32,
+                                buffer=self.shm.buf)
+
+    def classify(self, features):
+        """
+        Classifies a feature vector (list or numpy array) and returns the
+        runner's response, the same as runner.classify()
+        """
+        if self.mode == 'shm':
+            count = len(features)
+            if count > self.array.size:
+                raise ValueError("Got " + str(count) + " features, model "
+                                 "takes at most " + str(self.array.size))
+            self.array[:count] = features
+            return self.runner.send_msg({"classify_shm": {"elements": count}})
+        if self.mode == 'json' and isinstance(features, np.ndarray):
+            features = features.tolist()
+        return self.runner.classify(features)
+
+    def close(self):
+        if self.shm is not None:
+            self.array = None
+            self.shm.close()
+            self.shm = None
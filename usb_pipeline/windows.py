@@ -0,0 +1,313 @@
+"""
+Batched Sliding Windows
+
+The sliding window script used to cut out every window, fit it to the model
+input, pack its pixels and classify it on its own: 70 round trips to the model
+per 320x240 frame. SlidingWindows classifies all windows of a frame as one
+batch and returns one probability matrix, indexed by window row, window column
+and label.
+
+When the stride maps to a whole number of pixels at model scale (e.g. 96 pixel
+windows on a 28x28 model with stride 24: 7 pixels), the frame is fitted to
+model scale once, with the same sampling positions the runner would use for
+each window, so the result is exactly what per-window resizing gives. Every
+window is then a strided view into that one small image, so the batch tensor
+(rows x columns x height x width x channels) is built without copying any
+window. Otherwise each window is fitted on its own into one shared buffer.
+
+Models that can batch (see savedmodel.py) get the whole tensor in one call.
+The Edge Impulse runner only takes one input at a time, so for it the packed
+windows are sent back to back.
+
+With convolutional=True the CNN isn't run per window at all. Overlapping
+windows share most of their pixels, so the SavedModel's convolution and
+pooling layers run once over the small frame, and per window only near its
+edges, where its own zero padding makes it differ from its neighbours (see
+SavedModelClassifier.window_probabilities). The predictions are the same as
+classifying each window. Windows must then also start a multiple of the
+CNN's pooling stride apart at model scale: 4 pixels for the 28x28 CNN, so 84
+pixel windows with stride 24 (8 pixels) rather than 96 pixel ones (7).
+
+A prefilter (see cascade.py) can reject windows before any of this: rejected
+windows aren't classified and get the background label (probability 1) in the
+matrix.
+
+With a change_threshold, results are also kept from frame to frame. Each
+window remembers the model-size pixels its result was computed from, and is
+classified again only when its pixels now differ from those by more than the
+threshold (mean absolute difference, in levels). On a fixed camera most
+windows keep their result. With threshold 0 a result is only reused for
+exactly the same pixels, so the output is the same as classifying everything.
+Every refresh_every frames all windows are classified regardless.
+
+A result_cache (see cache.py) is looked up for the windows that still need a
+result: windows that look like one classified before, at any position and in
+any frame, take the stored result, and identical windows within a frame are
+classified once.
+
+rejected, reused (kept from the last frame), cached (from the result cache,
+or from an identical window of the same frame) and classified count the
+windows of the last frame.
+
+License: Apache-2.0 (apache.org/licenses/LICENSE-2.0)
+"""
+
+import cv2
+import numpy as np
+
+from .features import PackedPixelFeatures
+from .geometry import GeometryPlan, runner_crop
+from .multicam import classify_batch
+
+
+def strided_windows(array, rows, columns, row_step, column_step, size):
+    """
+    Returns a rows x columns x height x width (x channels) view of array in
+    which window (r, c) starts r * row_step + c * column_step pixels into it,
+    steps being (y, x) pairs and size the (width, height) of a window
+    """
+    stride_y, stride_x = array.strides[:2]
+    width, height = size
+    shape = (rows, columns, height, width) + array.shape[2:]
+    strides = (row_step[0] * stride_y + row_step[1] * stride_x,
+               column_step[0] * stride_y + column_step[1] * stride_x) + \
+        array.strides
+    return np.lib.stride_tricks.as_strided(array, shape, strides,
+                                           writeable=False)
+
+
+class SlidingWindows:
+    """
+    Classifies every window of a frame in one batch
+
+    model is a model that can batch (it has probabilities(), e.g.
+    SavedModelClassifier) or anything with classify() that takes packed
+    features, e.g. a FeatureTransport. model_info is the init() result. The
+    window layout is worked out on the first frame and again only if the
+    frame size changes.
+    """
+
+    def __init__(self, model, model_info, window_size, stride,
+                 convolutional=False, prefilter=None, change_threshold=None,
+                 refresh_every=0, result_cache=None):
+        params = model_info['model_parameters']
+        self.model = model
+        self.labels = params['labels']
+        self.model_size = (params['image_input_width'],
+                           params['image_input_height'])
+        self.grayscale = params['image_channel_count'] == 1
+        self.window_size = window_size
+        self.stride = stride
+        self.convolutional = convolutional
+        self.prefilter = prefilter
+        self.change_threshold = change_threshold
+        self.refresh_every = refresh_every
+        self.result_cache = result_cache
+        self.frame_shape = None
+        self.rejected = 0
+        self.reused = 0
+        self.cached = 0
+        self.classified = 0
+
+        # What a rejected window gets instead of a prediction
+        self.rejected_probabilities = np.zeros(len(self.labels),
+                                               dtype=np.float32)
+        if 'background' in self.labels:
+            self.rejected_probabilities[self.labels.index('background')] = 1
+
+    def compile(self, frame_shape):
+        height, width = frame_shape[:2]
+        window_width, window_height = self.window_size
+        model_width, model_height = self.model_size
+        self.columns = (width - window_width) // self.stride + 1
+        self.rows = (height - window_height) // self.stride + 1
+
+        # Can all windows share one frame fitted to model scale?
+        scale, runner_x, runner_y = runner_crop(window_width, window_height,
+                                                model_width, model_height)
+        step = self.stride * scale
+        self.shared = runner_x == 0 and runner_y == 0 and \
+            model_width == window_width * scale and \
+            model_height == window_height * scale and step == int(step)
+
+        if self.shared:
+            step = int(step)
+            self.row_step = (step, 0)
+            self.column_step = (0, step)
+            self.covered = ((self.columns - 1) * self.stride + window_width,
+                            (self.rows - 1) * self.stride + window_height)
+            self.scaled_size = ((self.columns - 1) * step + model_width,
+                                (self.rows - 1) * step + model_height)
+            # Scaled pixel -> frame pixel, pixel centres lined up as in
+            # GeometryPlan, so each window is sampled exactly as on its own
+            self.matrix = np.array([[1 / scale, 0, 0.5 / scale - 0.5],
+                                    [0, 1 / scale, 0.5 / scale - 0.5]])
+            self.pixels = np.empty((self.scaled_size[1], self.scaled_size[0],
+                                    3), dtype=np.uint8)
+        elif self.convolutional:
+            raise ValueError("Convolutional mode needs a stride that is a "
+                             "whole number of pixels at model scale")
+        else:
+            # Windows stacked one below the other
+            self.row_step = (self.columns * model_height, 0)
+            self.column_step = (model_height, 0)
+            self.window_geometry = GeometryPlan(0, out_size=self.model_size)
+            self.pixels = np.empty((self.rows * self.columns * model_height,
+                                    model_width, 3), dtype=np.uint8)
+
+        if self.convolutional and step % self.model.window_stride():
+            raise ValueError("Convolutional mode needs a stride of a multiple "
+                             "of " + str(self.model.window_stride()) +
+                             " pixels at model scale, not " + str(step))
+
+        height, width = self.pixels.shape[:2]
+        self.pack_features = PackedPixelFeatures(width, height, self.grayscale)
+        self.model_pixels = np.empty((height, width,
+                                      1 if self.grayscale else 3),
+                                     dtype=np.float32)
+
+        # Results kept between frames, and the pixels they were computed from
+        count = self.rows * self.columns
+        self.results = np.empty((count, len(self.labels)), dtype=np.float32)
+        self.reference = np.empty((count, model_width * model_height * 3),
+                                  dtype=np.uint8)
+        self.valid = np.zeros(count, dtype=bool)
+        self.frame_count = 0
+        self.frame_shape = frame_shape
+
+    def fit(self, img):
+        """
+        Returns the windows' pixels at model size, laid out as described by
+        row_step and column_step
+        """
+        if img.shape != self.frame_shape:
+            self.compile(img.shape)
+        if not self.shared:
+            window_width, window_height = self.window_size
+            model_height = self.model_size[1]
+            for r in range(self.rows):
+                for c in range(self.columns):
+                    x = c * self.stride
+                    y = r * self.stride
+                    top = (r * self.columns + c) * model_height
+                    self.pixels[top:top + model_height] = \
+                        self.window_geometry.apply(
+                            img[y:y + window_height, x:x + window_width])
+            return self.pixels
+        covered_width, covered_height = self.covered
+        region = img[:covered_height, :covered_width]
+        if self.scaled_size == self.covered:
+            return region
+
+        # Shrink with an area filter like the runner does. The stride is a
+        # whole number of pixels at model scale, so every window gets the
+        # same pixels as when resized on its own.
+        if self.scaled_size[0] < covered_width:
+            return cv2.resize(region, self.scaled_size, dst=self.pixels,
+                              interpolation=cv2.INTER_AREA)
+        return cv2.warpAffine(region, self.matrix, self.scaled_size,
+                              dst=self.pixels,
+                              flags=cv2.WARP_INVERSE_MAP | cv2.INTER_LINEAR,
+                              borderMode=cv2.BORDER_REPLICATE)
+
+    def windows(self, array):
+        """
+        Returns the rows x columns x height x width (x channels) view of the
+        windows in array, which has the layout fit() returns
+        """
+        return strided_windows(array, self.rows, self.columns, self.row_step,
+                               self.column_step, self.model_size)
+
+    def probabilities(self, img):
+        """
+        Classifies every window of img and returns a float32 rows x columns x
+        labels matrix of probabilities
+        """
+        pixels = self.fit(img)
+        model_width, model_height = self.model_size
+        count = self.rows * self.columns
+        if self.prefilter is None:
+            keep = np.ones(count, dtype=bool)
+        else:
+            keep = self.prefilter(img, self.rows, self.columns, self.stride,
+                                  self.window_size).reshape(-1)
+        classify = keep
+        current = None
+        if self.change_threshold is not None:
+            current = self.windows(pixels).reshape(count, -1)
+            refresh = self.refresh_every and \
+                self.frame_count % self.refresh_every == 0
+            self.frame_count += 1
+            if not refresh:
+                change = cv2.absdiff(current, self.reference).mean(axis=1)
+                classify = keep & (~self.valid |
+                                   (change > self.change_threshold))
+            self.reference[classify] = current[classify]
+            self.valid = keep
+        self.reused = int(np.count_nonzero(keep & ~classify))
+
+        # Windows that look like ones classified before take the stored
+        # result; of identical windows only the first is classified
+        self.cached = 0
+        pending = {}
+        if self.result_cache is not None and classify.any():
+            if current is None:
+                current = self.windows(pixels).reshape(count, -1)
+            classify = classify.copy()
+            for i in np.flatnonzero(classify):
+                key = self.result_cache.key(current[i])
+                if key in pending:
+                    pending[key].append(i)
+                    classify[i] = False
+                    self.cached += 1
+                    continue
+                value = self.result_cache.get(key)
+                if value is None:
+                    pending[key] = [i]
+                else:
+                    self.results[i] = value
+                    classify[i] = False
+                    self.cached += 1
+
+        self.classified = int(np.count_nonzero(classify))
+        self.rejected = count - int(np.count_nonzero(keep))
+
+        if not self.classified:
+            probabilities = np.empty((0, len(self.labels)))
+        elif self.convolutional:
+            probabilities = self.model.window_probabilities(
+                self.model.convert(pixels, self.model_pixels), self.rows,
+                self.columns, self.row_step[0])[classify]
+        elif hasattr(self.model, 'probabilities'):
+            batch = self.windows(self.model.convert(pixels, self.model_pixels))
+            flat = batch.reshape((-1,) + batch.shape[2:])
+            if self.classified < count:
+                flat = flat[classify]
+            probabilities = self.model.probabilities(flat)
+        else:
+            packed = self.pack_features(pixels).reshape(pixels.shape[:2])
+            batch = self.windows(packed).reshape(-1, model_width * model_height)
+            results = classify_batch(self.model, list(batch[classify]))
+            probabilities = [[res['result']['classification'][label]
+                              for label in self.labels] for res in results]
+        self.results[classify] = probabilities
+        for key, indices in pending.items():
+            value = self.results[indices[0]].copy()
+            self.results[indices[1:]] = value
+            self.result_cache.put(key, value)
+
+        matrix = np.empty((count, len(self.labels)), dtype=np.float32)
+        matrix[:] = self.rejected_probabilities
+        matrix[keep] = self.results[keep]
+        return matrix.reshape(self.rows, self.columns, len(self.labels))
+
+    def boxes(self, probabilities, label, threshold):
+        """
+        Returns (x, y, width, height, probability) of every window whose
+        probability of label is at least threshold, row by row
+        """
+        scores = probabilities[..., self.labels.index(label)]
+        window_width, window_height = self.window_size
+        return [(c * self.stride, r * self.stride, window_width, window_height,
+                 float(scores[r, c]))
+                for r, c in zip(*np.nonzero(scores >= threshold))]